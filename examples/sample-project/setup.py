@@ -26,6 +26,11 @@ license: LGPL v.3
 
 from setuptools import setup
 
+# the sibilant importer must be enabled before the build_py command
+# which precompiles our .lspy modules can itself be imported
+import sibilant  # noqa
+from sibilant.site.setuptools import build_py
+
 
 TROVE_CLASSIFIERS = (
     "Development Status :: 4 - Beta",
@@ -56,6 +61,10 @@ setup(name = "sibilant-sample-project",
           ],
       },
 
+      # compiles the .lspy modules into the build, so that they are
+      # never parsed from source once installed
+      cmdclass = {"build_py": build_py},
+
       requires = [
           "sibilant",
       ],
@@ -147,6 +147,7 @@ def __setup__(glbls):
     _op(lib.tailcall_disable, "tailcall-disable")
     _op(lib.tailcall_enable, "tailcall-enable")
     _op(lib.tcr_frame_vars, "__tcr_frame_vars__")
+    _op(lib.tcr_reset_cells, "__tcr_reset_cells__")
 
     _op(compiler.current, "active-compiler")
 
@@ -30,7 +30,9 @@ def __setup__(glbls, clean=True):
     from os.path import join, dirname
     from pkgutil import get_data
 
-    from .module import new_module, init_module, load_module
+    from .module import new_module, init_module
+    from .module import load_module, load_module_fused
+    from .module import _BasicsCache
     from .parse import source_str
 
     # because the sibilant.importlib functions will attempt to use
@@ -47,14 +49,31 @@ def __setup__(glbls, clean=True):
     # 1. grab the bootstrap definitions
     import sibilant.bootstrap as bootstrap
 
-    # 2. grab the basics definitions
-    src = get_data(__name__, "basics.lspy").decode("utf8")
+    # 2. grab the basics definitions. If a cached compilation is
+    # available and fresh, we'll just evaluate that. Otherwise we read
+    # and compile the source, and attempt to cache the results for
+    # the next process.
     filename = join(dirname(glbls.get("__file__", "./")), "basics.lspy")
-    source_stream = source_str(src, filename=filename)
-
     basics = new_module("sibilant.basics")
-    init_module(basics, source_stream, builtins=bootstrap)
-    load_module(basics)
+
+    cache = _BasicsCache(filename)
+    code = cache.get_code()
+
+    if code is not None:
+        basics.__file__ = filename
+        exec(code, basics.__dict__)
+
+    else:
+        src = get_data(__name__, "basics.lspy").decode("utf8")
+        source_stream = source_str(src, filename=filename)
+
+        init_module(basics, source_stream, builtins=bootstrap)
+
+        # fusing only pays for itself if the result is cached
+        if cache.writable():
+            cache.set_code(load_module_fused(basics))
+        else:
+            load_module(basics)
 
     sys.modules["sibilant"].basics = basics
     sys.modules["sibilant.basics"] = basics
@@ -66,6 +85,7 @@ def __setup__(glbls, clean=True):
         "__format_value__",
         "__build_string__",
         "__tcr_frame_vars__",
+        "__tcr_reset_cells__",
     )
 
     # 3. merge bootstrap and basics together into this module
@@ -78,8 +98,7 @@ def __setup__(glbls, clean=True):
     # globals
     if clean:
         PURGE_NAMES = (
-            "__file__", "__builtins__", "__doc__",
-            "__setup__",
+            "__file__", "__builtins__", "__doc__", "__setup__",
         )
 
         for val in PURGE_NAMES:
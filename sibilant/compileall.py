@@ -0,0 +1,305 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+sibilant.compileall
+
+Ahead-of-time compilation of whole trees of sibilant modules into
+the cached bytecode used by sibilant.importlib, in the manner of the
+compileall module from the standard library.
+
+author: Christopher O'Brien  <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+import sys
+
+from importlib.util import cache_from_source
+from os import listdir, makedirs, stat
+from os.path import (
+    abspath, basename, dirname, isdir, isfile, join, splitext,
+)
+
+from .importlib import SOURCE_SUFFIXES
+from .module import (
+    compile_to_file, unmarshal_wrapper,
+    PycInvalidationMode, HASH_PYC_SUPPORTED, default_invalidation_mode,
+    pyc_invalidation_mode, source_hash,
+)
+
+
+BOOTSTRAP_BUILTINS = "sibilant.bootstrap"
+
+# modules which are always compiled using only the bootstrap builtins,
+# as sibilant.builtins itself is built from them
+BOOTSTRAP_MODULES = ("sibilant.basics",)
+
+
+__all__ = (
+    "is_current", "compile_file", "iter_sources", "compile_dir",
+    "main",
+)
+
+
+def is_current(filename, cache_filename, invalidation_mode=None):
+    """
+    True if cache_filename holds a compilation of filename which is
+    valid for this version of python and of sibilant, which uses
+    invalidation_mode, and which is not stale. Hash-based caches are
+    compared against the source even when unchecked.
+    """
+
+    if invalidation_mode is None:
+        invalidation_mode = default_invalidation_mode()
+
+    try:
+        with open(cache_filename, "rb") as cache:
+            data = cache.read()
+
+        if pyc_invalidation_mode(data) is not invalidation_mode:
+            return False
+
+        elif invalidation_mode is PycInvalidationMode.TIMESTAMP:
+            st = stat(filename)
+            unmarshal_wrapper(data, None, filename,
+                              st.st_mtime, st.st_size, cache_filename)
+            return True
+
+        else:
+            with open(filename, "rb") as source:
+                shash = source_hash(source.read())
+
+            unmarshal_wrapper(data, None, filename, 0, 0, cache_filename,
+                              source_hash=shash)
+
+            # the hash follows the magic and flags in the header
+            return data[8:16] == shash
+
+    except (OSError, ImportError, EOFError, ValueError):
+        return False
+
+
+def compile_file(fullname, filename, cache_filename=None,
+                 builtins_name=None, force=False, invalidation_mode=None):
+
+    """
+    Compile the sibilant module fullname from the source file filename
+    into cache_filename, which defaults to the location in which the
+    importer will look for it. If builtins_name is specified, then that
+    module will provide the builtins when the module is compiled and
+    when it is later loaded. invalidation_mode is a
+    PycInvalidationMode, defaulting to default_invalidation_mode.
+
+    Returns True if the file was compiled, or False if the existing
+    cache was current and force was not set.
+    """
+
+    if cache_filename is None:
+        cache_filename = cache_from_source(filename)
+
+    if invalidation_mode is None:
+        invalidation_mode = default_invalidation_mode()
+
+    if not force and is_current(filename, cache_filename,
+                                invalidation_mode):
+        return False
+
+    makedirs(dirname(cache_filename) or ".", exist_ok=True)
+
+    pkgname = fullname.rpartition(".")[0]
+    if splitext(basename(filename))[0] == "__init__":
+        pkgname = fullname
+
+    compile_to_file(fullname, pkgname, filename, cache_filename,
+                    builtins_name=builtins_name,
+                    invalidation_mode=invalidation_mode)
+    return True
+
+
+def iter_sources(dirpath, pkgname=None):
+    """
+    Yields (fullname, filename) for every sibilant source file in
+    dirpath, and recursively in the packages beneath it. pkgname is the
+    dotted name of the package that dirpath holds, or None if dirpath
+    is itself an entry on sys.path.
+    """
+
+    prefix = (pkgname + ".") if pkgname else ""
+
+    for entry in sorted(listdir(dirpath)):
+        path = join(dirpath, entry)
+        name, ext = splitext(entry)
+
+        if ext in SOURCE_SUFFIXES and isfile(path):
+            if name == "__init__":
+                if pkgname:
+                    yield pkgname, path
+            else:
+                yield prefix + name, path
+
+        elif not ext and name.isidentifier() and isdir(path):
+            # namespace packages have no __init__, so any directory
+            # which could be imported as a package is searched
+            yield from iter_sources(path, prefix + name)
+
+
+def compile_dir(dirpath, pkgname=None, bootstrap=(), force=False,
+                workers=1, invalidation_mode=None):
+
+    """
+    Compile every out-of-date sibilant module found by iter_sources.
+    Modules named in bootstrap, as well as those in BOOTSTRAP_MODULES,
+    are compiled and loaded using only the bootstrap builtins.
+
+    When workers is other than 1, the modules are compiled in a pool
+    of that many processes, or of one per CPU if workers is 0, so that
+    the cost of starting up sibilant is paid once per worker rather
+    than once per module.
+
+    invalidation_mode is as for compile_file. Caches which were
+    written using another mode are out-of-date.
+
+    Returns a list of the names of the modules which were compiled.
+    """
+
+    if invalidation_mode is None:
+        invalidation_mode = default_invalidation_mode()
+
+    bootstrap = frozenset(bootstrap).union(BOOTSTRAP_MODULES)
+
+    # compiling a module also runs it, so the tree must be importable
+    # for any imports it performs, including relative ones
+    root = abspath(dirpath)
+    for _ in (pkgname.split(".") if pkgname else ()):
+        root = dirname(root)
+
+    inserted = root not in sys.path
+    if inserted:
+        sys.path.insert(0, root)
+
+    try:
+        work = []
+        for fullname, filename in iter_sources(dirpath, pkgname):
+            cache_filename = cache_from_source(filename)
+            if force or not is_current(filename, cache_filename,
+                                       invalidation_mode):
+                builtins_name = BOOTSTRAP_BUILTINS \
+                    if fullname in bootstrap else None
+                work.append((fullname, filename, cache_filename, builtins_name,
+                             True, invalidation_mode))
+
+        if workers == 1 or len(work) < 2:
+            for job in work:
+                compile_file(*job)
+
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=(workers or None)) as pool:
+                futures = [pool.submit(compile_file, *job) for job in work]
+
+                # propagates the first compilation error, if any
+                for future in futures:
+                    future.result()
+
+    finally:
+        if inserted:
+            sys.path.remove(root)
+
+    return [job[0] for job in work]
+
+
+def cli_option_parser(name):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog=basename(name))
+
+    parser.add_argument("-f", "--force", dest="force",
+                        action="store_true", default=False,
+                        help="Compile modules even if their cache is"
+                        " current")
+
+    parser.add_argument("-j", "--workers", dest="workers",
+                        action="store", type=int, default=1,
+                        help="Number of worker processes to compile"
+                        " with, or 0 for one per CPU")
+
+    parser.add_argument("-p", "--package", dest="package",
+                        action="store", default=None,
+                        help="Dotted name of the package held by each"
+                        " directory, if it is not a sys.path entry")
+
+    parser.add_argument("-B", "--bootstrap", dest="bootstrap",
+                        action="append", default=[],
+                        help="Module to compile using only bootstrap"
+                        " builtins. May be given more than once")
+
+    modes = [mode.name.lower().replace("_", "-")
+             for mode in PycInvalidationMode
+             if HASH_PYC_SUPPORTED or
+             mode is PycInvalidationMode.TIMESTAMP]
+
+    parser.add_argument("--invalidation-mode", dest="invalidation_mode",
+                        action="store", choices=modes, default=None,
+                        help="How the cached bytecode is checked for"
+                        " staleness. Defaults to checked-hash if"
+                        " SOURCE_DATE_EPOCH is set, else timestamp")
+
+    parser.add_argument("-q", "--quiet", dest="quiet",
+                        action="store_true", default=False,
+                        help="Do not list the modules compiled")
+
+    parser.add_argument("dirs", nargs="+",
+                        help="Directories to compile")
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point for python -m sibilant.compileall
+    """
+
+    if argv is None:
+        argv = sys.argv
+
+    name, *args = argv
+    options = cli_option_parser(name).parse_args(args)
+
+    mode = options.invalidation_mode
+    if mode:
+        mode = PycInvalidationMode[mode.upper().replace("-", "_")]
+
+    for dirpath in options.dirs:
+        compiled = compile_dir(dirpath, options.package,
+                               bootstrap=options.bootstrap,
+                               force=options.force,
+                               workers=options.workers,
+                               invalidation_mode=mode)
+
+        if not options.quiet:
+            for fullname in compiled:
+                print("Compiled", fullname)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+#
+# The end.
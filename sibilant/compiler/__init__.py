@@ -29,7 +29,7 @@ from abc import ABCMeta, abstractmethod
 from collections import Mapping
 from contextlib import contextmanager
 from functools import partial
-from itertools import count
+from itertools import chain, count
 from os.path import exists
 from platform import python_implementation
 from sys import version_info
@@ -38,7 +38,7 @@ from typing import Union
 from sibilant.lib import (
     SibilantException, SibilantSyntaxError,
     symbol, is_symbol,
-    lazygensym, is_lazygensym,
+    gensym, lazygensym, is_lazygensym,
     keyword, is_keyword,
     pair, cons, is_pair, is_proper, nil, is_nil,
     get_position, fill_position,
@@ -49,7 +49,7 @@ from sibilant.lib import tailcall_full as tcf
 
 
 from sibilant.pseudops import (
-    PseudopsCompiler, Mode,
+    PseudopsCompiler, Mode, Block, CodeBlock, Pseudop,
     CONST_TYPES, Constant,
 )
 
@@ -83,6 +83,11 @@ _symbol_keyword = symbol("keyword")
 _symbol_tailcall = symbol("tailcall")
 _symbol_tailcall_full = symbol("tailcall-full")
 _symbol_tcr_frame = symbol("__tcr_frame_vars__")
+_symbol_tcr_cells = symbol("__tcr_reset_cells__")
+_symbol_defaults = symbol("__defaults__")
+_symbol_globals = symbol("globals")
+_symbol_setdefault = symbol("setdefault")
+_symbol_kwdefaults = symbol("__kwdefaults__")
 
 Symbol = Union[lazygensym, symbol]
 
@@ -134,6 +139,20 @@ class UncaughtCompilerException(CompilerException):
             (self.origin_ex, self.source_obj)
 
 
+class InlineScopeEscape(CompilerException):
+    """
+    Raised when code compiled within an inline scope turns out to
+    need a function of its own
+    """
+
+    def __init__(self, scope, reason):
+        self.scope = scope
+        self.reason = reason
+
+    def __str__(self):
+        return "Cannot compile inline scope: %s" % self.reason
+
+
 class UnsupportedVersion(SibilantException):
     pass
 
@@ -348,10 +367,62 @@ def compiler_for_version(ver=version_info,
     raise UnsupportedVersion(ver, impl)
 
 
+class InlineScope(object):
+    """
+    A lexical scope which is compiled directly into its enclosing
+    code space, rather than as a nested function. Variables declared
+    within it are renamed to locals of their own.
+    """
+
+    def __init__(self, depth):
+        # the number of blocks open when the scope began
+        self.depth = depth
+
+        # declared names, and the locals standing in for them
+        self.renames = {}
+
+        # names which were referenced while the scope was active
+        self.referenced = set()
+
+        # names bound within the scope to something which cannot be
+        # treated as a variable, eg. the name of an inline loop
+        self.opaque = set()
+
+
+    def local(self, namesym):
+        """
+        The local variable standing in for namesym within this scope
+        """
+
+        return namesym if is_lazygensym(namesym) else self.renames[namesym]
+
+
+    def escape(self, reason):
+        raise InlineScopeEscape(self, reason)
+
+
+class InlineLoop(object):
+    """
+    Passed in place of the tailcall flag when compiling the body of a
+    named let which has been inlined as a loop. A call to the loop by
+    name in this position becomes a rebinding of its variables and a
+    jump back to its top. Any other tailcall consults tc, the flag
+    the named let itself was compiled with.
+    """
+
+    def __init__(self, name, scope, bindings, label, tc):
+        self.name = name
+        self.scope = scope
+        self.bindings = bindings
+        self.label = label
+        self.tc = tc
+
+
 class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
 
 
-    def __init__(self, tco_enabled=True, self_ref=None, **kwopts):
+    def __init__(self, tco_enabled=True, self_ref=None,
+                 defaults=(), kwdefaults=(), **kwopts):
 
         # TODO: using **kwopts is crap, maybe we need a compiler options
         # object to document the options and what they mean.
@@ -364,6 +435,20 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         self.tco_enabled = tco_enabled
         self.tailcalls = 0
 
+        # the inline scopes currently being compiled, innermost last
+        self.inline_scopes = []
+
+        # a block of code run at the start of a module to create its
+        # hoisted values, and the global names those are stored under
+        self.hoisted = None
+        self.hoisted_keys = {}
+
+        # the keyword formals and their default value expressions, as
+        # pairs in the same order as the function's __defaults__ and
+        # __kwdefaults__
+        self.defaults = defaults
+        self.kwdefaults = kwdefaults
+
         self.self_ref = self_ref
         if self_ref:
             self.request_var(self_ref)
@@ -398,6 +483,11 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
     def reset(self):
         super().reset()
         self.tailcalls = 0
+        self.inline_scopes.clear()
+        self.hoisted = None
+        self.hoisted_keys.clear()
+        self.defaults = ()
+        self.kwdefaults = ()
         self.self_ref = None
         self.env = None
 
@@ -458,7 +548,10 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
 
         self.require_active()
 
-        tc = self.tco_enabled and tc
+        if not isinstance(tc, InlineLoop):
+            # an inline loop is just a jump, so it doesn't matter
+            # whether tailcalls are enabled
+            tc = self.tco_enabled and tc
 
         if is_pair(source_obj):
             dispatch = self.compile_pair
@@ -546,10 +639,15 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         Compile a runtime function apply expression.
         """
 
-        tc = tc and self.tco_enabled and not self.generator
-
         head, tail = source_obj
 
+        while isinstance(tc, InlineLoop):
+            if head is tc.name and self.helper_loop_visible(tc):
+                return tcf(self.compile_loop_apply, source_obj, tc, cont)
+            tc = tc.tc
+
+        tc = tc and self.tco_enabled and not self.generator
+
         if tc and self.self_ref and \
            is_symbol(head) and (str(head) == self.name):
             return tcf(self.compile_tcr_apply, source_obj, tc, cont)
@@ -619,6 +717,42 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
             return tcf(self.complete_apply, tcr_source, pos, False, ccp)
 
 
+    @trampoline
+    def compile_loop_apply(self, source_obj: pair, loop, cont):
+        """
+        Compile a call to an inline loop as the assignment of its new
+        binding values, followed by a jump back to the top of its body.
+        """
+
+        position = source_obj.get_position()
+        fun, args = source_obj
+
+        parameters = gather_parameters(args, position)
+        pos, kwds, vals, star, starstar = parameters
+
+        if kwds or star or starstar or len(pos) != len(loop.bindings):
+            # let the function version raise the TypeError
+            loop.scope.escape("unsupported arguments to %s" % loop.name)
+
+        if len(self.blocks) != loop.scope.depth:
+            # the blocks would need to be unwound before jumping
+            loop.scope.escape("%s invoked from within a block" % loop.name)
+
+        for expr in pos:
+            self.add_expression(expr)
+
+        for var in reversed(loop.bindings):
+            self.pseudop_set_var(var)
+
+        self.pseudop_jump(loop.label)
+
+        # the jump never leaves a value, but everything else expects
+        # this expression to have done so.
+        self.pseudop_faux_push()
+
+        return tcf(cont, None, False)
+
+
     @trampoline
     def complete_tcr_apply(self, cont):
         # print("completing a tcr apply")
@@ -659,7 +793,8 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         certain specialty Python values (None, True, False, and ...)
 
         Dotted symbols will be compiled into attr calls. Non-dotted
-        symbols will be compiled into variable references.
+        symbols will be compiled into variable references, unless they
+        name a constant declared with define_constant.
 
         If a symbol correlates to an Alias in the module namespace,
         then that alias will be expanded and compilation will continue
@@ -686,6 +821,10 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
             return tcf(cont, self.pseudop_get_var(sym), tc)
 
         else:
+            found, value = self.find_constant(sym)
+            if found:
+                return tcf(self.compile_constant, value, tc, cont)
+
             ex = sym.rsplit(".", 1)
             if len(ex) == 1:
                 return tcf(cont, self.pseudop_get_var(sym), None)
@@ -759,10 +898,7 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         parameters = gather_parameters(args, position)
         pos, kwds, vals, star, starstar = parameters
 
-        if star or starstar \
-           or self.varargs or self.varkeywords \
-           or self.cell_vars:
-
+        if star or starstar:
             # no support for variadics, it's too tricky to inline. A
             # trampoline bounce isn't any slower than us calling to
             # other functions to figure out how to reform variadics
@@ -770,15 +906,37 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
             # bounce.
             return False
 
-        self_args = self.args
+        self_args = list(self.args)
+        varkeywords = self_args.pop() if self.varkeywords else None
+        varargs = self_args.pop() if self.varargs else None
+
+        if is_nil(varargs):
+            # an ignored star arg, which has no name to assign to
+            return False
+
+        for scope in self.inline_scopes:
+            if any((not is_lazygensym(arg)) and (arg in scope.renames)
+                   for arg in self.args):
+                # an inline scope has shadowed one of our arguments,
+                # so we can't assign to it by name.
+                return False
+
+        split = len(self_args) - self.kwonly
+        positional = self_args[:split]
+
+        if len(pos) > len(positional) and not varargs:
+            # too many positionals, let the trampoline bounce and
+            # have python raise the TypeError
+            return False
 
         # first, skim off the argument name bindings for the
         # positional arguments
-        bindings = self_args[:len(pos)]
+        bindings = positional[:len(pos)]
+        surplus = len(pos) - len(bindings)
 
         # now we need to go through the keyword arguments in order and
         # record their binding
-        for arg in kwds:
+        for arg in map(symbol, kwds):
             if arg in bindings:
                 # keyword parameter dups positional parameter name,
                 # fall back on trampoline
@@ -789,11 +947,19 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
             else:
                 bindings.append(arg)
 
-        if len(self_args) != len(bindings):
-            # if the bindings and argument count doesn't line up, then
+        # any formals which weren't given need to be filled in from
+        # their defaults, which come from their keyword formals
+        defaults = dict((symbol(key), (_symbol_defaults, index))
+                        for index, (key, _expr)
+                        in enumerate(self.defaults))
+        defaults.update((symbol(key), (_symbol_kwdefaults, str(key)))
+                        for key, _expr in self.kwdefaults)
+
+        missing = [arg for arg in self_args if arg not in bindings]
+        if any(arg not in defaults for arg in missing):
+            # if an argument without a default wasn't given, then
             # again it's easier to just let the trampoline bounce and
-            # have python figure out the args (and potentially raise a
-            # TypeError). Default values take too much effort for now.
+            # have python figure out the args (and raise a TypeError)
             return False
 
         # if we made it this far, then we have a mapping of the
@@ -812,12 +978,33 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         self.pseudop_pop_jump_if_false(tclabel)
         self.pseudop_pop()
 
-        # evaluate all of the arguments in order
+        # evaluate all of the arguments in order, collecting any
+        # surplus positionals together for the varargs
         for arg in pos:
             self.add_expression(arg, False)
+        if surplus:
+            self.pseudop_build_tuple(surplus)
         for arg in vals:
             self.add_expression(arg, False)
 
+        for arg in missing:
+            self.helper_tcr_default(*defaults[arg])
+            bindings.append(arg)
+
+        if surplus:
+            bindings.insert(len(pos) - surplus, varargs)
+        elif varargs:
+            self.pseudop_build_tuple(0)
+            bindings.append(varargs)
+
+        if varkeywords:
+            self.pseudop_build_map(0)
+            bindings.append(varkeywords)
+
+        # closures from the previous pass need to keep their own
+        # cells, so we'll have fresh ones before assigning
+        self.pseudop_reset_cells(_symbol_tcr_cells)
+
         # now bind them to the vars that we discovered
         for var in reversed(bindings):
             self.pseudop_set_var(var)
@@ -829,12 +1016,308 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
         return True
 
 
+    def helper_tcr_default(self, attr, key):
+        """
+        Pushes the default value for an argument to an inlined tail
+        recursion, fetched from the function's __defaults__ or
+        __kwdefaults__ (named by attr) at key. The defaults are read
+        on every pass rather than folded into the call site, as they
+        may have been changed since the function was defined.
+        """
+
+        self.pseudop_get_var(self.self_ref)
+        self.pseudop_get_attr(attr)
+        self.pseudop_const(key)
+        self.pseudop_get_item()
+
+
     def declare_tailcall(self):
         assert self.tco_enabled, "declare_tailcall without tco_enabled"
         assert not self.generator, "declare_tailcall with a generator"
         self.tailcalls += 1
 
 
+    def helper_loop_visible(self, loop):
+        """
+        True if loop is what its name would refer to in the current
+        inline scope, rather than a variable shadowing it.
+        """
+
+        scopes = self.inline_scopes
+        if loop.scope not in scopes:
+            return False
+
+        name = loop.name
+        for scope in scopes[scopes.index(loop.scope) + 1:]:
+            if name in scope.renames or name in scope.opaque:
+                return False
+
+        return True
+
+
+    def mark(self):
+        """
+        Returns a token recording the current state of the compiler,
+        which rewind can use to discard any code added after it.
+        """
+
+        block = self.blocks[-1]
+        return (len(self.blocks),
+                len(block.pseudops), len(block.children),
+                len(self.fast_vars), len(self.free_vars),
+                len(self.cell_vars), len(self.global_vars),
+                len(self.names), len(self.consts),
+                len(self.env_tmp_compiled), len(self.inline_scopes),
+                self.generator, self.coroutine, self.tailcalls)
+
+
+    def rewind(self, mark):
+        """
+        Discards any code added since mark was created
+        """
+
+        (blocks, pseudops, children,
+         fast_vars, free_vars, cell_vars, global_vars,
+         names, consts, tmp_compiled, inline_scopes,
+         self.generator, self.coroutine, self.tailcalls) = mark
+
+        del self.blocks[blocks:]
+        block = self.blocks[-1]
+        del block.pseudops[pseudops:]
+        del block.children[children:]
+
+        del self.fast_vars[fast_vars:]
+        del self.free_vars[free_vars:]
+        del self.cell_vars[cell_vars:]
+        del self.global_vars[global_vars:]
+        del self.names[names:]
+        self.truncate_consts(consts)
+        del self.env_tmp_compiled[tmp_compiled:]
+        del self.inline_scopes[inline_scopes:]
+
+
+    @contextmanager
+    def inline_scope(self):
+        """
+        Context in which declared variables are renamed to fresh
+        locals, as though the code compiled within were the body of a
+        nested function. Raises InlineScopeEscape if that code turns
+        out to depend upon actually being in a nested function, eg. if
+        a closure captures one of its variables or it yields. The
+        caller is expected to rewind the compiler in that case.
+
+        Module-level code has no locals, so cannot have inline scopes.
+        """
+
+        if self.mode is Mode.MODULE:
+            raise CompilerException("inline scope in module-level code")
+
+        scope = InlineScope(len(self.blocks))
+
+        self.inline_scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            self.inline_scopes.remove(scope)
+
+
+    def require_function_scope(self, block=None):
+        """
+        Declares that the code being compiled would behave differently
+        within an inline scope than in a function of its own, eg. a
+        return. If given, block is the block the code refers to, and
+        only matters if it was opened outside of the inline scope.
+        """
+
+        if self.inline_scopes:
+            scope = self.inline_scopes[-1]
+            if block is None or self.blocks.index(block) < scope.depth:
+                scope.escape("requires a function scope")
+
+
+    def declare_generator(self):
+        self.require_function_scope()
+        super().declare_generator()
+
+
+    def declare_coroutine(self):
+        self.require_function_scope()
+        super().declare_coroutine()
+
+
+    def _scope_declare(self, namesym: Symbol):
+        # lazygensyms are unique already, so there's no need to rename
+        # them
+        if not self.inline_scopes or is_lazygensym(namesym):
+            return namesym
+
+        scope = self.inline_scopes[-1]
+        renamed = scope.renames.get(namesym)
+
+        if namesym in scope.opaque:
+            scope.escape("%s is not a variable" % namesym)
+
+        elif renamed is None:
+            if namesym in scope.referenced:
+                # in a nested function, this would have been a
+                # reference to a variable from the enclosing scope
+                scope.escape("%s referenced before declaration" % namesym)
+
+            renamed = self.gensym(namesym)
+            scope.renames[namesym] = renamed
+
+        return renamed
+
+
+    def _scope_resolve(self, namesym: Symbol):
+        if not self.inline_scopes or is_lazygensym(namesym):
+            return namesym
+
+        found = namesym
+        opaque = None
+
+        for scope in self.inline_scopes:
+            scope.referenced.add(namesym)
+            if namesym in scope.renames:
+                found = scope.renames[namesym]
+                opaque = None
+            elif namesym in scope.opaque:
+                opaque = scope
+
+        if opaque is not None:
+            # the name of an inline loop is being used as a value
+            opaque.escape("%s is not a variable" % namesym)
+
+        return found
+
+
+    def declare_var(self, namesym: Symbol):
+        return super().declare_var(self._scope_declare(namesym))
+
+
+    def request_cell(self, namesym: Symbol):
+        if self.inline_scopes and not is_lazygensym(namesym):
+            for scope in reversed(self.inline_scopes):
+                if namesym in scope.renames or namesym in scope.opaque:
+                    scope.escape("%s captured by a closure" % namesym)
+                scope.referenced.add(namesym)
+
+        return super().request_cell(namesym)
+
+
+    def pseudop_set_local(self, namesym: Symbol):
+        return super().pseudop_set_local(self._scope_declare(namesym))
+
+
+    def pseudop_get_var(self, namesym: Symbol):
+        return super().pseudop_get_var(self._scope_resolve(namesym))
+
+
+    def pseudop_set_var(self, namesym: Symbol):
+        return super().pseudop_set_var(self._scope_resolve(namesym))
+
+
+    def pseudop_del_var(self, namesym: Symbol):
+        return super().pseudop_del_var(self._scope_resolve(namesym))
+
+
+    def pseudop_get_hoisted(self, key, build):
+        """
+        Pushes a value which is created only once, at the start of the
+        module being compiled, and stored in a global named _hoisted#N
+        from then on. The value is shared by every use of it, so it
+        should be immutable.
+        build will be called with the module's compiler, and must push
+        the pseudo ops to create the value. Calls with an equal key
+        share the same value, unless key is None.
+
+        Outside of a module, build is simply called with this compiler
+        to create the value in place.
+        """
+
+        top = self
+        while top.parent:
+            top = top.parent
+
+        if top.mode is not Mode.MODULE or top.blocks[0] is top.hoisted:
+            # outside of a module there is nowhere to hoist the value
+            # to, and the hoisted code itself only runs once anyway
+            return build(self)
+
+        name = None if key is None else top.hoisted_keys.get(key)
+
+        if name is None:
+            # the leading underscore keeps it out of import *
+            name = gensym("_hoisted", top._hoisted_predicate)
+            top._build_hoisted(name, build)
+            if key is not None:
+                top.hoisted_keys[key] = name
+
+        return self.pseudop_get_global(name)
+
+
+    def _build_hoisted(self, name, build):
+        if self.hoisted is None:
+            self.hoisted = CodeBlock(Block.BEGIN, 0, 0)
+
+        # the creation code goes into the hoisted block rather than
+        # wherever we happen to be in the module, and must not see
+        # any of the inline scopes currently in effect.
+        blocks, self.blocks = self.blocks, [self.hoisted]
+        scopes, self.inline_scopes = self.inline_scopes, []
+
+        try:
+            build(self)
+            self.pseudop_set_global(name)
+
+        finally:
+            self.blocks = blocks
+            self.inline_scopes = scopes
+
+
+    def _hoisted_predicate(self, sym: symbol):
+        # the module may already have hoisted values from expressions
+        # compiled earlier, so those names are also off-limits
+        return (sym not in self.global_vars and
+                str(sym) not in self.env)
+
+
+    def gen_pseudops(self):
+        pseudops = super().gen_pseudops()
+
+        if self.hoisted:
+            pseudops = chain(self.hoisted.gen_pseudops(), pseudops)
+
+        return pseudops
+
+
+    def fuse(self, other):
+        hoisted = other.hoisted
+
+        if not super().fuse(other):
+            return False
+
+        if hoisted:
+            # the fused code needs to create the hoisted values before
+            # it uses them, so they are moved ahead of it
+            block = self.blocks[-1]
+            block.children.insert(-1, hoisted)
+            block.pseudops.insert(-1, (Pseudop.BLOCK, hoisted))
+            other.hoisted = None
+
+        return True
+
+
+    def max_stack(self, strict=True):
+        maximum = super().max_stack(strict)
+
+        if self.hoisted:
+            _leftovers, hoisted = self.hoisted.max_stack(self)
+            maximum = max(maximum, hoisted)
+
+        return maximum
+
+
     def _gensym_predicate(self, sym: symbol):
         # sym = str(sym)
         return (sym not in self.args and
@@ -947,6 +1430,72 @@ class SibilantCompiler(PseudopsCompiler, metaclass=ABCMeta):
             return env_find_compiled(env, namesym)
 
 
+    def define_constant(self, namesym: Symbol, value):
+        """
+        Declare that the global namesym will always hold value within
+        the activated environment for this compiler. Further references
+        to namesym which aren't shadowed by a local variable may be
+        compiled as value itself.
+        """
+
+        constants = self.env.get("__constants__")
+        if constants is None:
+            constants = self.env["__constants__"] = {}
+        constants[str(namesym)] = value
+
+
+    def pseudop_define_constant(self, namesym: Symbol, value):
+        """
+        Pushes the pseudo ops to declare namesym as a constant for
+        value in the module's __constants__ as it runs, as
+        define_constant does at compile time. A module loaded from
+        cached bytecode is never compiled, so this is how it comes by
+        its constants.
+        """
+
+        # globals().setdefault("__constants__", {})[namesym] = value
+        self.pseudop_const(value)
+        self.pseudop_get_global(_symbol_globals)
+        self.pseudop_call(0)
+        self.pseudop_get_attr(_symbol_setdefault)
+        self.pseudop_const("__constants__")
+        self.pseudop_build_map(0)
+        self.pseudop_call(2)
+        self.pseudop_const(str(namesym))
+        self.pseudop_set_item()
+
+
+    def find_constant(self, namesym: Symbol):
+        """
+        Search for a value declared via define_constant for namesym,
+        provided that namesym isn't shadowed by a local variable at
+        this point. Returns a tuple of (found, value)
+        """
+
+        constants = self.env.get("__constants__")
+        if not constants or is_lazygensym(namesym):
+            return False, None
+
+        name = str(namesym)
+        if name not in constants:
+            return False, None
+
+        code = self
+        while code is not None and code.mode is not Mode.MODULE:
+            if namesym in code.fast_vars or \
+               namesym in code.free_vars or \
+               namesym in code.cell_vars:
+                return False, None
+
+            for scope in code.inline_scopes:
+                if namesym in scope.renames or namesym in scope.opaque:
+                    return False, None
+
+            code = code.parent
+
+        return True, constants[name]
+
+
     def find_expander(self, source_obj, env=None):
         """
         Find an expander function for the given source obj in the
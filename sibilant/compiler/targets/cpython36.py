@@ -54,6 +54,21 @@ class SibilantCPython36(PseudopsCPython36, SibilantCompiler):
             self.pseudop_call(len(pos))
             return tailcall(cont)(None, False)
 
+        elif (keywords and not (vargs or vkwds) and
+              len(set(keywords)) == len(keywords)):
+            # the keyword values can go onto the stack after the
+            # positionals, with a tuple naming them, and be passed
+            # without building a dict
+            for val in values:
+                self.add_expression(val)
+            self.pseudop_const(tuple(str(key) for key in keywords))
+
+            if declared_at:
+                self.pseudop_position(*declared_at)
+
+            self.pseudop_call_kw(len(pos) + len(values))
+            return tailcall(cont)(None, False)
+
         elif pos:
             # it's going to get complicated. collect the positionals
             # we've got into a tuple for later.
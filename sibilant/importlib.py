@@ -28,10 +28,17 @@ import sys
 
 from importlib.abc import FileLoader
 from importlib.machinery import FileFinder, PathFinder
+from importlib.util import cache_from_source
 
-from os import getcwd
+from os import getcwd, listdir, makedirs, stat
+from os.path import dirname, isfile, join, splitext
 
-from .module import init_module, load_module
+from .module import (
+    init_module, load_module, load_module_fused,
+    marshal_wrapper, unmarshal_wrapper,
+    PycInvalidationMode, default_invalidation_mode,
+    pyc_invalidation_mode, source_hash,
+)
 from .parse import source_str
 
 
@@ -92,6 +99,17 @@ class SibilantPathFinder(PathFinder):
 
 
 class SibilantSourceFileLoader(FileLoader):
+    """
+    Loads sibilant source files, caching their compiled bytecode
+    alongside them in the same manner as .pyc files.
+
+    A cache is invalidated by changes to its own source file (by
+    mtime or by hash, per the invalidation mode) or to the compiler
+    itself. It is NOT invalidated when a macro it imported from
+    another module changes, as the expansion of that macro is already
+    baked into the cached bytecode. Modules which use a changed macro
+    must be touched or recompiled to pick up the new expansion.
+    """
 
 
     def create_module(self, spec):
@@ -108,18 +126,189 @@ class SibilantSourceFileLoader(FileLoader):
         return self.get_data(self.get_filename(fullname)).decode("utf8")
 
 
+    def path_stats(self, path):
+        st = stat(path)
+        return {"mtime": st.st_mtime, "size": st.st_size}
+
+
+    def get_cache_filename(self, filename):
+        try:
+            return cache_from_source(filename)
+        except NotImplementedError:
+            # sys.implementation.cache_tag is None, so caching is
+            # disabled entirely
+            return None
+
+
+    def get_cached_code(self, fullname, filename, cache_filename):
+        """
+        Produce the stub code object from a previously cached
+        compilation of filename, or None if there is no cache or if it
+        is stale. Only a timestamp cache needs the source file to be
+        stat'd, and only a checked hash-based cache needs it to be
+        read.
+        """
+
+        try:
+            data = self.get_data(cache_filename)
+        except OSError:
+            return None
+
+        mtime = size = 0
+        if pyc_invalidation_mode(data) is PycInvalidationMode.TIMESTAMP:
+            stats = self.path_stats(filename)
+            mtime, size = stats["mtime"], stats["size"]
+
+        def shash():
+            return source_hash(self.get_data(filename))
+
+        try:
+            return unmarshal_wrapper(data, fullname, filename, mtime, size,
+                                     cache_filename, source_hash=shash)
+        except (ImportError, EOFError):
+            return None
+
+
+    def set_cached_code(self, fullname, filename, cache_filename, stats,
+                        code_objs, source_bytes=None):
+        """
+        Write the compiled top-level expressions of filename into
+        cache_filename, using the default_invalidation_mode. Failures
+        are silently ignored, as the cache is merely an optimization.
+        """
+
+        import importlib._bootstrap_external as ibe
+
+        mode = default_invalidation_mode()
+
+        shash = None
+        if mode is not PycInvalidationMode.TIMESTAMP:
+            if source_bytes is None:
+                source_bytes = self.get_data(filename)
+            shash = source_hash(source_bytes)
+
+        try:
+            data = marshal_wrapper(code_objs, filename=filename,
+                                   mtime=stats["mtime"],
+                                   source_size=stats["size"],
+                                   invalidation_mode=mode,
+                                   source_hash=shash)
+        except ValueError:
+            # something in the compiled expressions couldn't be
+            # marshalled, so this module cannot be cached
+            return
+
+        try:
+            makedirs(dirname(cache_filename), exist_ok=True)
+            ibe._write_atomic(cache_filename, data, ibe._calc_mode(filename))
+        except OSError:
+            pass
+
+
     def exec_module(self, module):
         name = module.__name__
         filename = self.get_filename(name)
-        source_stream = source_str(self.get_source(name), filename=filename)
+
+        cache_filename = self.get_cache_filename(filename)
+
+        if cache_filename:
+            code = self.get_cached_code(name, filename, cache_filename)
+            if code is not None:
+                exec(code, module.__dict__)
+                return
+
+        stats = self.path_stats(filename)
+        source_bytes = self.get_data(filename)
+        source_stream = source_str(source_bytes.decode("utf8"),
+                                   filename=filename)
 
         init_module(module, source_stream)
-        load_module(module)
+
+        # fusing only pays for itself if the result is cached
+        if cache_filename and not sys.dont_write_bytecode:
+            code_objs = load_module_fused(module)
+            self.set_cached_code(name, filename, cache_filename, stats,
+                                 code_objs, source_bytes)
+        else:
+            load_module(module)
 
 
 class SibilantFileFinder(FileFinder):
+    """
+    A FileFinder which only finds sibilant modules and packages.
+
+    As the SibilantPathFinder is consulted before any other on every
+    import, each finder keeps an index of the sibilant sources in its
+    directory, so that it can quickly refuse names which couldn't be
+    sibilant. The index is kept until invalidate_caches is called.
+    """
+
+    def __init__(self, path, *loader_details):
+        super().__init__(path, *loader_details)
+        self._suffixes = tuple(suffix for suffix, _loader in self._loaders)
+        self._index = None
+
+
+    def invalidate_caches(self):
+        super().invalidate_caches()
+        self._index = None
+
+
+    def _sibilant_index(self):
+        """
+        A tuple of the names of sibilant modules in this directory,
+        the names of all of its entries, and a dict recording which
+        of those entries have already been checked for being sibilant
+        packages.
+        """
+
+        index = self._index
+        if index is None:
+            try:
+                entries = set(listdir(self.path or getcwd()))
+            except OSError:
+                entries = set()
+
+            suffixes = self._suffixes
+            modules = set()
+            for entry in entries:
+                name, suffix = splitext(entry)
+                if suffix in suffixes:
+                    modules.add(name)
+
+            index = self._index = (modules, entries, {})
+
+        return index
+
+
+    def _maybe_sibilant(self, fullname):
+        """
+        False if there's no sibilant module or package in this
+        directory for fullname.
+        """
+
+        tail = fullname.rpartition(".")[2]
+        modules, entries, packages = self._sibilant_index()
+
+        if tail in modules:
+            return True
+        elif tail not in entries:
+            return False
+
+        found = packages.get(tail)
+        if found is None:
+            # only directories with a sibilant __init__ count
+            init = join(self.path, tail, "__init__")
+            found = any(isfile(init + suffix) for suffix in self._suffixes)
+            packages[tail] = found
+
+        return found
+
 
     def find_spec(self, fullname, target=None):
+        if not self._maybe_sibilant(fullname):
+            return None
+
         # this won't find an __init__.py it would only find an
         # __init__.lspy which means __init__.py packages would have
         # the appearance of being a namespace package. We don't want
@@ -27,6 +27,7 @@ from ._types import values
 from ._types import getderef, setderef, clearderef
 from ._types import trampoline, is_trampoline
 from ._types import tailcall, tailcall_full, tcr_frame_vars
+from ._types import tcr_reset_cells, tailcall_stats
 
 
 __all__ = (
@@ -52,7 +53,8 @@ __all__ = (
     "getderef", "setderef", "clearderef",
 
     "trampoline", "is_trampoline",
-    "tailcall", "tailcall_full", "tcr_frame_vars",
+    "tailcall", "tailcall_full", "tcr_frame_vars", "tcr_reset_cells",
+    "tailcall_stats",
     "tailcall_disable", "tailcall_enable",
 )
 
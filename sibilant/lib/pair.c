@@ -93,10 +93,19 @@ PyTypeObject SibPairIteratorType = {
 /* === PairFollowerType === */
 
 
+/* If the chain looped back upon itself when the follower was created,
+   then remaining is the count of distinct pairs to visit. Otherwise it
+   is -1, and the live chain is walked, so that pairs added while
+   iterating are also visited. In that case, Brent's algorithm (by way
+   of tortoise, power, and lam) guards against a loop being introduced
+   part way through. */
 typedef struct {
   PyObject_HEAD
   PyObject *current;
-  PyObject *seen;
+  PyObject *tortoise;
+  Py_ssize_t remaining;
+  Py_ssize_t power;
+  Py_ssize_t lam;
   long just_items;
 } SibPairFollower;
 
@@ -106,7 +115,7 @@ static void pfoll_dealloc(PyObject *self) {
   // checked
 
   Py_CLEAR(((SibPairFollower *) self)->current);
-  Py_CLEAR(((SibPairFollower *) self)->seen);
+  Py_CLEAR(((SibPairFollower *) self)->tortoise);
   Py_TYPE(self)->tp_free(self);
 }
 
@@ -114,7 +123,6 @@ static void pfoll_dealloc(PyObject *self) {
 static PyObject *pfoll_iternext(PyObject *self) {
   SibPairFollower *s = (SibPairFollower *) self;
   PyObject *current;
-  PyObject *curr_id;
   PyObject *result = NULL;
 
   current = s->current;
@@ -124,26 +132,26 @@ static PyObject *pfoll_iternext(PyObject *self) {
     return NULL;
   }
 
-  if (s->seen) {
-    /* we're set up to keep a record of what pairs we've already
-       seen, to prevent recursion */
-    curr_id = PyLong_FromVoidPtr(current);
-
-    if (PySet_Contains(s->seen, curr_id)) {
-      /* if we've already seen this one, we're done */
-      Py_DECREF(curr_id);
+  /* get ready for the next */
+  if (SibPair_CheckExact(current)) {
+    if (s->remaining > 0) {
+      s->remaining--;
+
+    } else if (! s->remaining || current == s->tortoise) {
+      /* either we were told how many pairs there are to visit
+	 before we started and there are none left, or the live
+	 chain has come back around to one we've already seen. In
+	 both cases we're done */
       Py_CLEAR(s->current);
       return NULL;
 
-    } else {
-      /* otherwise mark it as seen, and continue */
-      PySet_Add(s->seen, curr_id);
-      Py_DECREF(curr_id);
+    } else if (++s->lam == s->power) {
+      Py_INCREF(current);
+      Py_XSETREF(s->tortoise, current);
+      s->power <<= 1;
+      s->lam = 0;
     }
-  }
 
-  /* get ready for the next */
-  if (SibPair_CheckExact(current)) {
     s->current = SibPair_CDR(current);
     Py_INCREF(s->current);
 
@@ -431,15 +439,20 @@ static PyObject *pair_str(PyObject *self) {
 
 
 static long pair_eq(PyObject *left, PyObject *right) {
-  PyObject *seen = NULL;
-  PyObject *left_id, *right_id;
+  PyObject *tort_left, *tort_right;
+  Py_ssize_t power = 1, lam = 0;
   long answer = 1;
-  void *left_seen, *right_seen;
 
   if (left == right)
     return 1;
 
-  seen = PyDict_New();
+  /* left and right are walked in step with one another, with Brent's
+     algorithm applied to the pair of them. If we come back around to
+     a left and right that we've already compared against each other,
+     then we're done. This way we needn't keep a record of every pair
+     that we've compared. */
+  tort_left = left;
+  tort_right = right;
 
   while (left != right) {
     if (SibNil_Check(left) || SibNil_Check(right)) {
@@ -466,41 +479,28 @@ static long pair_eq(PyObject *left, PyObject *right) {
     // and they do not refer to the same memory space, so we can test
     // their CAR equivs and their CDR equivs
 
-    left_id = PyLong_FromVoidPtr(left);
-    right_id = PyLong_FromVoidPtr(right);
-
-    left_seen = PyDict_GetItem(seen, left_id);
-    right_seen = PyDict_GetItem(seen, right_id);
-
-    if ((left_seen && PyLong_AsVoidPtr(left_seen) == right) ||
-        (right_seen && PyLong_AsVoidPtr(right_seen) == left)) {
-
-      /* we've already compared these two against one another */
-      Py_DECREF(left_id);
-      Py_DECREF(right_id);
-      break;
-
-    } else if (! PyObject_RichCompareBool(SibPair_CAR(left),
-					  SibPair_CAR(right), Py_EQ)) {
-      /* haven't been compared before, but they're not equal */
+    if (! PyObject_RichCompareBool(SibPair_CAR(left),
+				   SibPair_CAR(right), Py_EQ)) {
       answer = 0;
-      Py_DECREF(left_id);
-      Py_DECREF(right_id);
       break;
-
-    } else {
-      /* equal, so make note that we've compared these to each other */
-      PyDict_SetItem(seen, left_id, right_id);
-      PyDict_SetItem(seen, right_id, left_id);
-      Py_DECREF(left_id);
-      Py_DECREF(right_id);
     }
 
     left = SibPair_CDR(left);
     right = SibPair_CDR(right);
+    lam++;
+
+    if (left == tort_left && right == tort_right) {
+      /* we've already compared these two against one another */
+      break;
+
+    } else if (lam == power) {
+      tort_left = left;
+      tort_right = right;
+      power <<= 1;
+      lam = 0;
+    }
   }
 
-  Py_DECREF(seen);
   return answer;
 }
 
@@ -528,8 +528,6 @@ static void pair_dealloc(PyObject *self) {
 
   Py_CLEAR(SibPair_CAR(self));
   Py_CLEAR(SibPair_CDR(self));
-  Py_CLEAR(((SibPair *) self)->position);
-
   if (pair_free_count < PAIR_MAX_FREE) {
     SibPair_CDR(self) = (PyObject *) pair_free_list;
     pair_free_list = (SibPair *) self;
@@ -554,7 +552,6 @@ static int pair_traverse(PyObject *self, visitproc visit, void *arg) {
 
   Py_VISIT(SibPair_CAR(self));
   Py_VISIT(SibPair_CDR(self));
-  Py_VISIT(((SibPair *) self)->position);
   return 0;
 }
 
@@ -565,7 +562,6 @@ static int pair_clear(PyObject *self) {
 
   Py_CLEAR(SibPair_CAR(self));
   Py_CLEAR(SibPair_CDR(self));
-  Py_CLEAR(((SibPair *) self)->position);
   return 0;
 }
 
@@ -602,7 +598,8 @@ static PyObject *pair_copy(PyObject *self, PyObject *_noargs) {
 
     // make a new pair, associate it with current ID
     tmp = SibPair_New(SibPair_CAR(self), SibNil);
-    Py_ASSIGN(((SibPair *) tmp)->position, ((SibPair *) self)->position);
+    ((SibPair *) tmp)->line = ((SibPair *) self)->line;
+    ((SibPair *) tmp)->col = ((SibPair *) self)->col;
 
     PyDict_SetItem(seen, self_id, tmp);
     Py_DECREF(self_id);
@@ -636,72 +633,104 @@ static PyObject *pair_copy(PyObject *self, PyObject *_noargs) {
 }
 
 
-static PyObject *pair_length(PyObject *self, PyObject *_noargs) {
-  PyObject *seen;
-  PyObject *tmp;
-  long length = 0;
+/* Walks the CDR chain from self using Brent's cycle detection, so
+   that nothing needs to be allocated along the way. If the chain
+   loops back upon itself then NULL is returned, otherwise the first
+   non-pair (normally nil) at the end of the chain is. If length is
+   not NULL, it is set to the count of distinct pairs in the chain. */
+static PyObject *pair_chain(PyObject *self, Py_ssize_t *length) {
+  PyObject *tortoise = self, *hare = self;
+  Py_ssize_t power = 1, lam = 0, mu = 0, count = 0;
+
+  while (SibPair_CheckExact(hare)) {
+    hare = SibPair_CDR(hare);
+    count++;
+    lam++;
+
+    if (hare == tortoise) {
+      /* it's recursive, and lam is the length of the loop. If we
+	 need the length of the whole chain, then we also need to
+	 find how far along the loop starts. */
+      if (length) {
+	tortoise = hare = self;
+	for (mu = lam; mu; mu--)
+	  hare = SibPair_CDR(hare);
+	for ( ; tortoise != hare; mu++) {
+	  tortoise = SibPair_CDR(tortoise);
+	  hare = SibPair_CDR(hare);
+	}
+	*length = mu + lam;
+      }
+      return NULL;
 
-  if (SibNil_Check(self)) {
-    return PyLong_FromLong(length);
+    } else if (lam == power) {
+      tortoise = hare;
+      power <<= 1;
+      lam = 0;
+    }
   }
 
-  seen = PySet_New(NULL);
-
-  for(; SibPair_CheckExact(self); self = SibPair_CDR(self)) {
+  if (length)
+    *length = count;
+  return hare;
+}
 
-    tmp = PyLong_FromVoidPtr(self);
 
-    if (PySet_Contains(seen, tmp)) {
-      Py_DECREF(tmp);
-      self = NULL;
-      break;
+static PyObject *pair_length(PyObject *self, PyObject *_noargs) {
+  PyObject *end;
+  Py_ssize_t length = 0;
 
-    } else {
-      PySet_Add(seen, tmp);
-      Py_DECREF(tmp);
-      length++;
-    }
+  if (SibNil_Check(self)) {
+    return PyLong_FromSsize_t(length);
   }
 
-  if (self && ! SibNil_Check(self))
+  end = pair_chain(self, &length);
+
+  if (end && ! SibNil_Check(end))
     length++;
 
-  Py_DECREF(seen);
-  return PyLong_FromLong(length);
+  return PyLong_FromSsize_t(length);
 }
 
 
-static PyObject *pair_follow(PyObject *self, PyObject *_noargs) {
-
-  // checked
+static PyObject *pair_follower(PyObject *self, long just_items) {
+  Py_ssize_t length = 0;
 
   SibPairFollower *i = PyObject_New(SibPairFollower, &SibPairFollowerType);
   if(! i)
     return NULL;
 
+  if (pair_chain(self, &length)) {
+    /* no loop, so follow the live chain */
+    i->remaining = -1;
+  } else {
+    i->remaining = length;
+  }
+
   Py_INCREF(self);
   i->current = self;
-  i->seen = PySet_New(NULL);
-  i->just_items = 0;
+  i->tortoise = NULL;
+  i->power = 1;
+  i->lam = 0;
+  i->just_items = just_items;
 
   return (PyObject *) i;
 }
 
 
-static PyObject *pair_unpack(PyObject *self, PyObject *_noargs) {
+static PyObject *pair_follow(PyObject *self, PyObject *_noargs) {
 
   // checked
 
-  SibPairFollower *i = PyObject_New(SibPairFollower, &SibPairFollowerType);
-  if(! i)
-    return NULL;
+  return pair_follower(self, 0);
+}
 
-  Py_INCREF(self);
-  i->current = self;
-  i->seen = PySet_New(NULL);
-  i->just_items = 1;
 
-  return (PyObject *) i;
+static PyObject *pair_unpack(PyObject *self, PyObject *_noargs) {
+
+  // checked
+
+  return pair_follower(self, 1);
 }
 
 
@@ -715,11 +744,7 @@ static PyObject *pair_to_list(PyObject *self) {
   PyObject *result;
   SibPairFollower *i = NULL;
 
-  i = PyObject_New(SibPairFollower, &SibPairFollowerType);
-  Py_INCREF(self);
-  i->current = self;
-  i->seen = PySet_New(NULL);
-  i->just_items = 1;
+  i = (SibPairFollower *) pair_follower(self, 1);
 
   result = PySequence_List((PyObject *) i);
   Py_DECREF(i);
@@ -733,32 +758,15 @@ long SibPair_IsProper(PyObject *self) {
 
   // checked
 
+  PyObject *end;
+
   if (SibNil_Check(self))
     return 1;
 
-  PyObject *seen = PySet_New(NULL);
-  PyObject *pair_id;
-  long result = 0;
-
-  for ( ; SibPair_CheckExact(self); self = SibPair_CDR(self)) {
-    pair_id = PyLong_FromVoidPtr(self);
-
-    if (PySet_Contains(seen, pair_id)) {
-      /* seen it, therefore recursive */
-      Py_DECREF(pair_id);
-      result = 1;
-      break;
-
-    } else {
-      PySet_Add(seen, pair_id);
-      Py_DECREF(pair_id);
-    }
-  }
-
   /* it's either recursive and thus proper, or the last item needs to
      have been a nil, or it's improper */
-  Py_DECREF(seen);
-  return result || SibNil_Check(self);
+  end = pair_chain(self, NULL);
+  return (! end) || SibNil_Check(end);
 }
 
 
@@ -777,39 +785,58 @@ long SibPair_IsRecursive(PyObject *self) {
   if (SibNil_Check(self))
     return 0;
 
-  PyObject *seen = PySet_New(NULL);
-  PyObject *pair_id;
-  long result = 0;
+  return ! pair_chain(self, NULL);
+}
 
-  for ( ; SibPair_CheckExact(self); self = SibPair_CDR(self)) {
-    pair_id = PyLong_FromVoidPtr(self);
 
-    if (PySet_Contains(seen, pair_id)) {
-      /* seen it, therefore recursive */
-      Py_DECREF(pair_id);
-      result = 1;
-      break;
+static PyObject *pair_is_recursive(PyObject *self, PyObject *_noargs) {
 
-    } else {
-      PySet_Add(seen, pair_id);
-      Py_DECREF(pair_id);
-    }
-  }
+  // checked
 
-  Py_DECREF(seen);
-  return result;
+  return PyBool_FromLong(SibPair_IsRecursive(self));
 }
 
 
-static PyObject *pair_is_recursive(PyObject *self, PyObject *_noargs) {
+static int unpack_position(PyObject *position, int *line, int *col) {
 
-  // checked
+  // None clears the position, anything else needs to be a pair of
+  // ints that will fit into the packed fields
 
-  return PyBool_FromLong(SibPair_IsRecursive(self));
+  PyObject *seq;
+
+  if (position == Py_None) {
+    *line = SibPair_NOLINE;
+    *col = 0;
+    return 1;
+  }
+
+  seq = PySequence_Fast(position, "position must be a (line, col) pair");
+  if (! seq)
+    return 0;
+
+  if (PySequence_Fast_GET_SIZE(seq) != 2) {
+    Py_DECREF(seq);
+    PyErr_SetString(PyExc_TypeError, "position must be a (line, col) pair");
+    return 0;
+  }
+
+  *line = _PyLong_AsInt(PySequence_Fast_GET_ITEM(seq, 0));
+  *col = _PyLong_AsInt(PySequence_Fast_GET_ITEM(seq, 1));
+  Py_DECREF(seq);
+
+  if (PyErr_Occurred())
+    return 0;
+
+  if (*line == SibPair_NOLINE) {
+    PyErr_SetString(PyExc_OverflowError, "position line out of range");
+    return 0;
+  }
+
+  return 1;
 }
 
 
-static void pwalk_setpos(PyObject *pair, PyObject *seen, PyObject *pos) {
+static void pwalk_setpos(PyObject *pair, PyObject *seen, int line, int col) {
 
   // checked
 
@@ -830,16 +857,17 @@ static void pwalk_setpos(PyObject *pair, PyObject *seen, PyObject *pos) {
       Py_DECREF(pair_id);
     }
 
-    Py_ASSIGN(sp->position, pos);
+    sp->line = line;
+    sp->col = col;
 
     if (SibPair_CheckExact(SibPair_CAR(sp))) {
-      pwalk_setpos(SibPair_CAR(sp), seen, pos);
+      pwalk_setpos(SibPair_CAR(sp), seen, line, col);
     }
   }
 }
 
 
-static void pwalk_fillpos(PyObject *pair, PyObject *seen, PyObject *pos) {
+static void pwalk_fillpos(PyObject *pair, PyObject *seen, int line, int col) {
 
   // checked
 
@@ -860,16 +888,17 @@ static void pwalk_fillpos(PyObject *pair, PyObject *seen, PyObject *pos) {
       Py_DECREF(pair_id);
     }
 
-    if (sp->position) {
-      pos = sp->position;
+    if (sp->line != SibPair_NOLINE) {
+      line = sp->line;
+      col = sp->col;
 
     } else {
-      Py_INCREF(pos);
-      sp->position = pos;
+      sp->line = line;
+      sp->col = col;
     }
 
     if (SibPair_CheckExact(SibPair_CAR(sp))) {
-      pwalk_fillpos(SibPair_CAR(sp), seen, pos);
+      pwalk_fillpos(SibPair_CAR(sp), seen, line, col);
     }
   }
 }
@@ -889,11 +918,12 @@ static PyObject *pair_clear_position(PyObject *self,
 
   if (follow) {
     PyObject *seen = PySet_New(NULL);
-    pwalk_setpos(self, seen, NULL);
+    pwalk_setpos(self, seen, SibPair_NOLINE, 0);
     Py_DECREF(seen);
 
   } else {
-    Py_CLEAR(((SibPair *) self)->position);
+    ((SibPair *) self)->line = SibPair_NOLINE;
+    ((SibPair *) self)->col = 0;
   }
 
   Py_RETURN_NONE;
@@ -905,9 +935,10 @@ static PyObject *pair_set_position(PyObject *self,
 
   // checked
 
-  static char *keywords[] = { "postition", "follow", NULL };
+  static char *keywords[] = { "position", "follow", NULL };
   PyObject *position = NULL;
   int follow = 0;
+  int line, col;
 
   if (SibNil_Check(self))
     Py_RETURN_NONE;
@@ -916,13 +947,17 @@ static PyObject *pair_set_position(PyObject *self,
 				    &position, &follow))
     return NULL;
 
+  if (! unpack_position(position, &line, &col))
+    return NULL;
+
   if (follow) {
     PyObject *seen = PySet_New(NULL);
-    pwalk_setpos(self, seen, position);
+    pwalk_setpos(self, seen, line, col);
     Py_DECREF(seen);
 
   } else {
-    Py_ASSIGN(((SibPair *) self)->position, position);
+    ((SibPair *) self)->line = line;
+    ((SibPair *) self)->col = col;
   }
 
   Py_RETURN_NONE;
@@ -937,21 +972,29 @@ static PyObject *pair_fill_position(PyObject *self,
   static char *keywords[] = { "position", "follow", NULL };
   PyObject *position = NULL;
   int follow = 0;
+  int line, col;
+
+  if (SibNil_Check(self))
+    Py_RETURN_NONE;
 
   if (! PyArg_ParseTupleAndKeywords(args, kwds, "O|p", keywords,
 				    &position, &follow))
     return NULL;
 
+  if (! unpack_position(position, &line, &col))
+    return NULL;
+
+  if (line == SibPair_NOLINE)
+    Py_RETURN_NONE;
+
   if (follow) {
     PyObject *seen = PySet_New(NULL);
-    pwalk_fillpos(self, seen, position);
+    pwalk_fillpos(self, seen, line, col);
     Py_DECREF(seen);
 
-  } else {
-    if (! ((SibPair *) self)->position) {
-      Py_INCREF(position);
-      ((SibPair *) self)->position = position;
-    }
+  } else if (((SibPair *) self)->line == SibPair_NOLINE) {
+    ((SibPair *) self)->line = line;
+    ((SibPair *) self)->col = col;
   }
 
   Py_RETURN_NONE;
@@ -962,11 +1005,10 @@ static PyObject *pair_get_position(PyObject *self, PyObject *_noargs) {
 
   // checked
 
-  PyObject *position = ((SibPair *) self)->position;
+  SibPair *sp = (SibPair *) self;
 
-  if (position) {
-    Py_INCREF(position);
-    return position;
+  if (sp->line != SibPair_NOLINE) {
+    return Py_BuildValue("(ii)", sp->line, sp->col);
 
   } else {
     Py_RETURN_NONE;
@@ -1066,7 +1108,8 @@ PyObject *SibPair_New(PyObject *head, PyObject *tail) {
     self = PyObject_GC_New(SibPair, &SibPairType);
   }
 
-  self->position = NULL;
+  self->line = SibPair_NOLINE;
+  self->col = 0;
 
   Py_INCREF(head);
   self->head = head;
@@ -1188,7 +1231,8 @@ SibPair _SibNil = {
   },
   .head = NULL,
   .tail = NULL,
-  .position = NULL,
+  .line = SibPair_NOLINE,
+  .col = 0,
 };
 
 
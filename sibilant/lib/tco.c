@@ -34,6 +34,25 @@
 #define DOCSTR "Native TCO Implementation for Sibilant"
 
 
+#define TAILCALL_MAX_FREE 64
+
+
+/* Arguments are passed around here as a stack, in the manner of
+   CPython's fastcall convention -- an array of the positional
+   arguments followed by the values of any keyword arguments, the
+   names of which are given as a tuple. Where the interpreter supports
+   that convention, so do the functions exposed by this module. */
+
+#if PY_VERSION_HEX >= 0x03070000
+#define SIB_FASTCALL (METH_FASTCALL | METH_KEYWORDS)
+#elif PY_VERSION_HEX >= 0x03060000
+#define SIB_FASTCALL METH_FASTCALL
+#endif
+
+
+#define KWCOUNT(kwnames) ((kwnames)? PyTuple_GET_SIZE(kwnames): 0)
+
+
 /* === util === */
 
 
@@ -42,7 +61,15 @@ static PyObject *_tco_enable = NULL;
 static PyObject *_tco_original = NULL;
 
 
-static Tailcall *tailcall_free_list = NULL;
+/* Deallocated Tailcall instances are pooled here for reuse. Like
+   CPython's own free lists, this relies upon the GIL being held by
+   any thread allocating or deallocating a Tailcall. */
+
+static Tailcall *tailcall_free_list[TAILCALL_MAX_FREE];
+static int tailcall_free_count = 0;
+
+static Py_ssize_t tailcall_alloc_count = 0;
+static Py_ssize_t tailcall_reuse_count = 0;
 
 
 static PyObject *_getattro(PyObject *inst, PyObject *name) {
@@ -69,10 +96,196 @@ static PyObject *_getattro(PyObject *inst, PyObject *name) {
 }
 
 
+static PyObject *stack_from_call(PyObject *args, PyObject *kwds,
+				 PyObject **kwnames) {
+
+  /* Returns a new reference to a tuple of the positional args
+     followed by the values from kwds, and sets kwnames to a new
+     reference to a tuple of the matching keys. If there are no
+     keywords, kwnames is set to NULL and args itself is returned. */
+
+  Py_ssize_t nargs = PyTuple_GET_SIZE(args);
+  Py_ssize_t nkwds = kwds? PyDict_Size(kwds): 0;
+  Py_ssize_t index, pos = 0;
+  PyObject *stack, *names, *key, *value;
+
+  *kwnames = NULL;
+
+  if (! nkwds) {
+    Py_INCREF(args);
+    return args;
+  }
+
+  stack = PyTuple_New(nargs + nkwds);
+  names = PyTuple_New(nkwds);
+
+  if (unlikely(! (stack && names))) {
+    Py_XDECREF(stack);
+    Py_XDECREF(names);
+    return NULL;
+  }
+
+  for (index = 0; index < nargs; index++) {
+    value = PyTuple_GET_ITEM(args, index);
+    Py_INCREF(value);
+    PyTuple_SET_ITEM(stack, index, value);
+  }
+
+  for (index = 0; PyDict_Next(kwds, &pos, &key, &value); index++) {
+    Py_INCREF(key);
+    PyTuple_SET_ITEM(names, index, key);
+    Py_INCREF(value);
+    PyTuple_SET_ITEM(stack, nargs + index, value);
+  }
+
+  *kwnames = names;
+  return stack;
+}
+
+
+static PyObject *call_stack(PyObject *work, PyObject **stack,
+			    Py_ssize_t nargs, PyObject *kwnames) {
+
+  /* Like PyObject_Call, but accepting a stack of arguments */
+
+#ifdef SIB_FASTCALL
+  return _PyObject_FastCallKeywords(work, stack, nargs, kwnames);
+
+#else
+  PyObject *args, *kwds = NULL, *result = NULL;
+  Py_ssize_t index, nkwds = KWCOUNT(kwnames);
+
+  args = PyTuple_New(nargs);
+  if (unlikely(! args))
+    return NULL;
+
+  for (index = 0; index < nargs; index++) {
+    Py_INCREF(stack[index]);
+    PyTuple_SET_ITEM(args, index, stack[index]);
+  }
+
+  if (nkwds) {
+    kwds = PyDict_New();
+    if (unlikely(! kwds))
+      goto done;
+
+    for (index = 0; index < nkwds; index++) {
+      if (PyDict_SetItem(kwds, PyTuple_GET_ITEM(kwnames, index),
+			 stack[nargs + index]))
+	goto done;
+    }
+  }
+
+  result = PyObject_Call(work, args, kwds);
+
+ done:
+  Py_DECREF(args);
+  Py_XDECREF(kwds);
+  return result;
+#endif
+}
+
+
+#ifdef SIB_FASTCALL
+#define METH_STACK SIB_FASTCALL
+#define STACK_FUNCTION(name) ((PyCFunction) (name))
+#define STACK_WRAPPER(name)
+
+#else
+/* Without the fastcall convention, each stack function exposed by
+   this module is wrapped to accept an args tuple and kwds dict */
+
+#define METH_STACK (METH_VARARGS | METH_KEYWORDS)
+#define STACK_FUNCTION(name) ((PyCFunction) (name ## _varargs))
+
+#define STACK_WRAPPER(name)						\
+  static PyObject *name ## _varargs(PyObject *mod,			\
+				    PyObject *args, PyObject *kwds) {	\
+    PyObject *kwnames, *result;						\
+    PyObject *stack = stack_from_call(args, kwds, &kwnames);		\
+    if (unlikely(! stack))						\
+      return NULL;							\
+    result = name(mod, &PyTuple_GET_ITEM(stack, 0),			\
+		  PyTuple_GET_SIZE(args), kwnames);			\
+    Py_DECREF(stack);							\
+    Py_XDECREF(kwnames);						\
+    return result;							\
+  }
+
+#endif
+
+
+/* === Tailcall arguments === */
+
+
+static void tailcall_clear_args(Tailcall *tc) {
+
+  Py_ssize_t count;
+
+  if (tc->nargs < 0)
+    return;
+
+  if (tc->overflow) {
+    Py_CLEAR(tc->overflow);
+
+  } else {
+    for (count = tc->nargs + KWCOUNT(tc->kwnames); count--; ) {
+      Py_CLEAR(tc->stack[count]);
+    }
+  }
+
+  Py_CLEAR(tc->kwnames);
+  tc->nargs = -1;
+}
+
+
+static int tailcall_set_stack(Tailcall *tc, PyObject **stack,
+			      Py_ssize_t nargs, PyObject *kwnames) {
+
+  /* copies the stack of arguments into the tailcall, inline if they
+     will fit, otherwise into an overflow tuple. */
+
+  PyObject *overflow;
+  Py_ssize_t count;
+
+  tailcall_clear_args(tc);
+
+  if (kwnames && ! PyTuple_GET_SIZE(kwnames))
+    kwnames = NULL;
+
+  count = nargs + KWCOUNT(kwnames);
+
+  if (count > SibTailcall_STACK) {
+    overflow = PyTuple_New(count);
+    if (unlikely(! overflow))
+      return -1;
+
+    while (count--) {
+      Py_INCREF(stack[count]);
+      PyTuple_SET_ITEM(overflow, count, stack[count]);
+    }
+    tc->overflow = overflow;
+
+  } else {
+    while (count--) {
+      Py_INCREF(stack[count]);
+      tc->stack[count] = stack[count];
+    }
+  }
+
+  Py_XINCREF(kwnames);
+  tc->kwnames = kwnames;
+  tc->nargs = nargs;
+
+  return 0;
+}
+
+
 /* === SibTailcallType === */
 
 
-static PyObject *do_tc_full(PyObject *work, PyObject *args, PyObject *kwds) {
+static PyObject *do_tc_full(PyObject *work, PyObject **stack,
+			    Py_ssize_t nargs, PyObject *kwnames) {
 
   if (SibTrampoline_Check(work)) {
     // it's a trampoline, so we'll tailcall using the original
@@ -94,14 +307,22 @@ static PyObject *do_tc_full(PyObject *work, PyObject *args, PyObject *kwds) {
 
     } else {
       Py_XDECREF(tmp);
-      return PyObject_Call(work, args, kwds);
+      return call_stack(work, stack, nargs, kwnames);
     }
   }
 
   Tailcall *result = (Tailcall *) SibTailcall_New(NULL);
+  if (unlikely(! result)) {
+    Py_DECREF(work);
+    return NULL;
+  }
+
   result->work = work; // steal
-  result->args = args; Py_INCREF(args);
-  result->kwds = kwds; Py_XINCREF(kwds);
+
+  if (unlikely(tailcall_set_stack(result, stack, nargs, kwnames))) {
+    Py_DECREF(result);
+    return NULL;
+  }
 
   return (PyObject *) result;
 }
@@ -282,7 +503,7 @@ too_many_positional(PyCodeObject *co, Py_ssize_t given, Py_ssize_t defcount,
 static int apply_frame_vars(PyFrameObject *frame,
 			    PyObject *func,
 			    PyObject **args, Py_ssize_t argcount,
-			    PyObject *kwds_dict) {
+			    PyObject *kwnames, PyObject **kwargs) {
 
   /* adapted from cpython, this is a way for us to reset a frame's
      local and cell vars similarly to how they would be initialized
@@ -367,14 +588,14 @@ static int apply_frame_vars(PyFrameObject *frame,
     }
   }
 
-  // Handle keyword arguments passed as two strided arrays
-  if (kwds_dict && (PyDict_Size(kwds_dict))) {
-    Py_ssize_t pos = 0;
-    PyObject *keyword = NULL;
-    PyObject *value = NULL;
-
-    while (PyDict_Next(kwds_dict, &pos, &keyword, &value)) {
+  // Handle keyword arguments, named by kwnames with their values
+  // in kwargs
+  if (kwnames) {
+    Py_ssize_t k, kwcount = PyTuple_GET_SIZE(kwnames);
 
+    for (k = 0; k < kwcount; k++) {
+      PyObject *keyword = PyTuple_GET_ITEM(kwnames, k);
+      PyObject *value = kwargs[k];
       PyObject **co_varnames;
       Py_ssize_t j;
 
@@ -521,26 +742,33 @@ static int apply_frame_vars(PyFrameObject *frame,
 }
 
 
-static PyObject *m_tcr_frame_vars(PyObject *mod,
-				  PyObject *args, PyObject *kwds) {
+static PyObject *m_tcr_frame_vars(PyObject *mod, PyObject **args,
+				  Py_ssize_t nargs, PyObject *kwnames) {
 
   PyObject *result;
 
-  Py_ssize_t argc = args? PyTuple_GET_SIZE(args): 0;
-  if (argc < 2) {
+  if (unlikely(nargs < 2)) {
+    PyErr_SetString(PyExc_TypeError,
+		    "tcr_frame_vars requires selfref and work arguments");
     return NULL;
   }
 
-  PyObject *selfref = PyTuple_GET_ITEM(args, 0);
-  PyObject *work = PyTuple_GET_ITEM(args, 1);
+  PyObject *selfref = args[0];
+  PyObject *work = args[1];
 
   // note, this won't TCR on methods. We might make adapt that to work
   // later on (moving self ref over into args)
 
   if (work == selfref) {
-    PyObject **argptr = (argc > 2)? &PyTuple_GET_ITEM(args, 2): NULL;
 
-    if (apply_frame_vars(PyEval_GetFrame(), work, argptr, argc - 2, kwds)) {
+    // the defaults need to come from the function itself, not from
+    // the trampoline wrapping it
+    if (SibTrampoline_Check(work)) {
+      work = ((Trampoline *) work)->tco_original;
+    }
+
+    if (apply_frame_vars(PyEval_GetFrame(), work, args + 2, nargs - 2,
+			 kwnames, args + nargs)) {
       result = NULL;
 
     } else {
@@ -554,9 +782,7 @@ static PyObject *m_tcr_frame_vars(PyObject *mod,
     // 0. Instead, we'll be using tailcall_full to either wrap up the
     // function or invoke it inline if it's not TCO enabled.
 
-    args = PyTuple_GetSlice(args, 2, PyTuple_GET_SIZE(args));
-    PyObject *tc = do_tc_full(work, args, kwds);
-    Py_DECREF(args);
+    PyObject *tc = do_tc_full(work, args + 2, nargs - 2, kwnames);
 
     if (tc) {
       result = PyTuple_New(1);
@@ -578,31 +804,58 @@ static PyObject *m_tcr_frame_vars(PyObject *mod,
 }
 
 
-static PyObject *m_tailcall_full(PyObject *mod,
-				 PyObject *args, PyObject *kwds) {
+STACK_WRAPPER(m_tcr_frame_vars)
 
-  // checked
 
-  PyObject *work = NULL;
+static PyObject *m_tcr_reset_cells(PyObject *mod, PyObject *unused) {
 
-  if (PyTuple_GET_SIZE(args) <= 1) {
-    if (unlikely(! PyArg_ParseTuple(args, "O", &work))) {
+  /* replaces the cell variables of the current frame with new, empty
+     cells, so that closures created by a previous pass through the
+     frame keep the cells they already have. Called before the
+     arguments of an inlined tail recursion are assigned. */
+
+  PyFrameObject *frame = PyEval_GetFrame();
+  PyObject **cells, *cell;
+  Py_ssize_t i, n_cellvars;
+
+  if (unlikely(! frame)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "tcr_reset_cells invoked with no current frame");
+    return NULL;
+  }
+
+  n_cellvars = PyTuple_GET_SIZE(frame->f_code->co_cellvars);
+  cells = frame->f_localsplus + frame->f_code->co_nlocals;
+
+  for (i = 0; i < n_cellvars; i++) {
+    cell = PyCell_New(NULL);
+    if (unlikely(! cell))
       return NULL;
-    }
-    args = PyTuple_New(0);
 
-  } else {
-    work = PyTuple_GET_ITEM(args, 0);
-    args = PyTuple_GetSlice(args, 1, PyTuple_GET_SIZE(args));
+    Py_XSETREF(cells[i], cell);
   }
 
-  PyObject *result = do_tc_full(work, args, kwds);
-  Py_DECREF(args);
+  Py_RETURN_NONE;
+}
 
-  return result;
+
+static PyObject *m_tailcall_full(PyObject *mod, PyObject **args,
+				 Py_ssize_t nargs, PyObject *kwnames) {
+
+  // checked
+
+  if (unlikely(nargs < 1)) {
+    PyErr_SetString(PyExc_TypeError, "tailcall_full requires a function");
+    return NULL;
+  }
+
+  return do_tc_full(args[0], args + 1, nargs - 1, kwnames);
 }
 
 
+STACK_WRAPPER(m_tailcall_full)
+
+
 static PyObject *tailcall_new(PyTypeObject *type,
 			      PyObject *args, PyObject *kwds) {
 
@@ -658,13 +911,12 @@ static void tailcall_dealloc(PyObject *self) {
   // checked
 
   Py_CLEAR(((Tailcall *) self)->work);
-  Py_CLEAR(((Tailcall *) self)->args);
-  Py_CLEAR(((Tailcall *) self)->kwds);
+  tailcall_clear_args((Tailcall *) self);
 
-  if (tailcall_free_list) {
-    Py_TYPE(self)->tp_free(self);
+  if (tailcall_free_count < TAILCALL_MAX_FREE) {
+    tailcall_free_list[tailcall_free_count++] = (Tailcall *) self;
   } else {
-    tailcall_free_list = (Tailcall *) self;
+    Py_TYPE(self)->tp_free(self);
   }
 }
 
@@ -674,8 +926,19 @@ static PyObject *tailcall_call(PyObject *self,
 
   // checked
 
-  Py_ASSIGN(((Tailcall *) self)->args, args);
-  Py_ASSIGN(((Tailcall *) self)->kwds, kwds);
+  Tailcall *tc = (Tailcall *) self;
+  PyObject *kwnames;
+  PyObject *stack = stack_from_call(args, kwds, &kwnames);
+
+  if (unlikely(! stack))
+    return NULL;
+
+  // we already have a tuple from the caller, so hold onto that as
+  // the overflow rather than copying it
+  tailcall_clear_args(tc);
+  tc->overflow = stack;
+  tc->kwnames = kwnames;
+  tc->nargs = PyTuple_GET_SIZE(args);
 
   Py_INCREF(self);
   return self;
@@ -702,11 +965,11 @@ PyObject *SibTailcall_New(PyObject *work) {
 
   Tailcall *tc = NULL;
 
-  if (tailcall_free_list) {
+  if (tailcall_free_count) {
     // printf("using existing Tailcall instance\n");
 
-    tc = tailcall_free_list;
-    tailcall_free_list = NULL;
+    tc = tailcall_free_list[--tailcall_free_count];
+    tailcall_reuse_count++;
     Py_INCREF(tc);
 
   } else {
@@ -716,8 +979,11 @@ PyObject *SibTailcall_New(PyObject *work) {
     if (unlikely(! tc))
       return NULL;
 
-    tc->args = NULL;
-    tc->kwds = NULL;
+    tailcall_alloc_count++;
+
+    tc->nargs = -1;
+    tc->kwnames = NULL;
+    tc->overflow = NULL;
   }
 
   Py_XINCREF(work);
@@ -755,6 +1021,10 @@ static PyObject *trampoline_call(PyObject *self,
   PyObject *work = ((Trampoline *) self)->tco_original;
   PyObject *result = NULL;
 
+  PyObject *stack[SibTailcall_STACK];
+  PyObject **argv, *kwnames, *overflow;
+  Py_ssize_t nargs, count;
+
   if (unlikely(! work)) {
     PyErr_SetString(PyExc_ValueError, "trampoline invoked with no function");
     return NULL;
@@ -764,29 +1034,49 @@ static PyObject *trampoline_call(PyObject *self,
   result = PyObject_Call(work, args, kwds);
 
   while (SibTailcall_Check(result)) {
-    // each bounce comes with its own work and arguments
+    // each bounce comes with its own work and arguments. Any inline
+    // arguments are moved onto our own stack.
+
+    Tailcall *tc = (Tailcall *) result;
+
+    STEAL(work, tc->work);
+    STEAL(kwnames, tc->kwnames);
+    STEAL(overflow, tc->overflow);
 
-    STEAL(work, ((Tailcall *) result)->work);
-    STEAL(args, ((Tailcall *) result)->args);
-    STEAL(kwds, ((Tailcall *) result)->kwds);
+    nargs = tc->nargs;
+    tc->nargs = -1;
+
+    if (overflow) {
+      argv = &PyTuple_GET_ITEM(overflow, 0);
+      count = 0;
+
+    } else {
+      count = (nargs < 0)? 0: (nargs + KWCOUNT(kwnames));
+      memcpy(stack, tc->stack, count * sizeof(PyObject *));
+      argv = stack;
+    }
 
     // free up the Tailcall early so it can be reused. This also sets
     // result to a NULL in case we're in an error state.
     Py_CLEAR(result);
 
-    if (likely(work && args)) {
-      result = PyObject_Call(work, args, kwds);
+    if (likely(work && nargs >= 0)) {
+      result = call_stack(work, argv, nargs, kwnames);
 
     } else if (! work) {
       PyErr_SetString(PyExc_ValueError, "tailcall bounced with no function");
 
-    } else if (! args) {
+    } else {
       PyErr_SetString(PyExc_ValueError, "tailcall bounced with no args");
     }
 
     Py_XDECREF(work);
-    Py_XDECREF(args);
-    Py_XDECREF(kwds);
+    Py_XDECREF(kwnames);
+    Py_XDECREF(overflow);
+
+    while (count--) {
+      Py_DECREF(stack[count]);
+    }
   }
 
   return result;
@@ -1063,10 +1353,17 @@ static PyObject *m_trampoline_check(PyObject *self, PyObject *obj) {
 }
 
 
+static PyObject *m_tailcall_stats(PyObject *mod, PyObject *unused) {
+  return Py_BuildValue("{snsnsi}",
+		       "allocated", tailcall_alloc_count,
+		       "reused", tailcall_reuse_count,
+		       "pooled", tailcall_free_count);
+}
+
+
 static PyMethodDef methods[] = {
 
-  { "tailcall_full", (PyCFunction) m_tailcall_full,
-    METH_VARARGS|METH_KEYWORDS,
+  { "tailcall_full", STACK_FUNCTION(m_tailcall_full), METH_STACK,
     "tailcall_full(function, *args, **kwds) ->"
     " tailcall(function)(*args, **kwds)" },
 
@@ -1079,12 +1376,20 @@ static PyMethodDef methods[] = {
   { "is_trampoline", m_trampoline_check, METH_O,
     "True if an object is a trampoline." },
 
-  { "tcr_frame_vars", (PyCFunction) m_tcr_frame_vars,
-    METH_VARARGS|METH_KEYWORDS,
+  { "tailcall_stats", m_tailcall_stats, METH_NOARGS,
+    "tailcall_stats() -> dict of the count of Tailcall instances allocated,"
+    " the count reused from the free list, and the count currently pooled"
+    " in the free list" },
+
+  { "tcr_frame_vars", STACK_FUNCTION(m_tcr_frame_vars), METH_STACK,
     "resets local and cell variables for the current frame from args and"
     " kwargs if selfref and work are identical. Returns a tuple indicating"
     " whether a jump 0 is acceptable or not" },
 
+  { "tcr_reset_cells", m_tcr_reset_cells, METH_NOARGS,
+    "replaces the cell variables of the current frame with new, empty"
+    " cells" },
+
   { NULL, NULL, 0, NULL },
 };
 
@@ -33,10 +33,17 @@ typedef struct SibPair {
 
   PyObject *head;
   PyObject *tail;
-  PyObject *position;
+
+  // source position, packed rather than held as a tuple. A line of
+  // SibPair_NOLINE indicates that no position has been set.
+  int line;
+  int col;
 } SibPair;
 
 
+#define SibPair_NOLINE INT_MIN
+
+
 typedef struct SibValues {
   PyObject_HEAD
 
@@ -46,12 +53,24 @@ typedef struct SibValues {
 } SibValues;
 
 
+// tailcall arguments are held inline when there are few enough of
+// them, so that bouncing needn't allocate anything
+#define SibTailcall_STACK 8
+
+
 typedef struct {
   PyObject_HEAD
 
   PyObject *work;
-  PyObject *args;
-  PyObject *kwds;
+
+  // the positional arguments followed by the values of any keyword
+  // arguments named in kwnames. These are held either inline in
+  // stack or, if there are too many, in the overflow tuple. nargs is
+  // -1 until arguments have been set.
+  Py_ssize_t nargs;
+  PyObject *kwnames;
+  PyObject *overflow;
+  PyObject *stack[SibTailcall_STACK];
 } Tailcall;
 
 
@@ -39,8 +39,11 @@ license: LGPL v.3
 import sys
 
 from collections import MutableMapping
+from enum import Enum
 from functools import partial
-from os.path import split, getmtime, getsize
+from importlib.util import cache_from_source
+from os import environ, makedirs, stat
+from os.path import dirname, split, getmtime, getsize
 from types import ModuleType
 
 from sibilant.compiler import Mode, compiler_for_version
@@ -51,12 +54,68 @@ from sibilant.parse import default_reader, source_open, source_str
 __all__ = (
     "new_module", "fake_module_from_env",
     "init_module", "load_module", "iter_load_module", "load_module_1",
+    "load_module_fused",
     "parse_time", "compile_time", "hook_compile_time",
     "run_time", "partial_run_time",
-    "exec_marshal_module", "marshal_wrapper", "compile_to_file",
+    "exec_marshal_module", "marshal_wrapper", "unmarshal_wrapper",
+    "compile_to_file", "CACHE_VERSION",
+    "PycInvalidationMode", "HASH_PYC_SUPPORTED",
+    "default_invalidation_mode", "pyc_invalidation_mode", "source_hash",
 )
 
 
+# the sources of the compiler, and of the runtime support which its
+# bytecode relies on. Cached bytecode is only used by the same sources
+# that produced it.
+_CACHE_SOURCES = (
+    "basics.lspy", "bootstrap.py", "builtins.py", "module.py",
+    "operators.py", "parse.py", "specials.py",
+    "compiler/__init__.py",
+    "compiler/targets/cpython35.py",
+    "compiler/targets/cpython36.py",
+    "compiler/targets/cpython37.py",
+    "pseudops/__init__.py",
+    "pseudops/peephole.py",
+    "pseudops/stack.py",
+    "pseudops/targets/cpython35.py",
+    "pseudops/targets/cpython36.py",
+    "pseudops/targets/cpython37.py",
+)
+
+
+def _cache_version():
+    from hashlib import sha1
+    from pkgutil import get_data
+
+    digest = sha1()
+    for name in _CACHE_SOURCES:
+        digest.update(name.encode("utf8"))
+        try:
+            digest.update(get_data("sibilant", name) or b"")
+        except OSError:
+            pass
+
+    return "sibilant-" + digest.hexdigest()
+
+
+# identifies the compiler and runtime support which produced a
+# marshalled module, so that changing either invalidates it
+CACHE_VERSION = _cache_version()
+
+
+# PEP 552 hash-based pyc files are only understood from Python 3.7
+HASH_PYC_SUPPORTED = sys.version_info >= (3, 7)
+
+try:
+    from py_compile import PycInvalidationMode
+
+except ImportError:
+    class PycInvalidationMode(Enum):
+        TIMESTAMP = 1
+        CHECKED_HASH = 2
+        UNCHECKED_HASH = 3
+
+
 def new_module(name, package_name=None, system=False):
     mod = ModuleType(name)
     if package_name:
@@ -397,14 +456,97 @@ def load_module_1(module, parse_time=parse_time,
     return tailcall(run_time)(module, code_obj)
 
 
-def exec_marshal_module(glbls, code_objs, builtins=None):
+def load_module_fused(module, parse_time=parse_time, run_time=run_time):
+    """
+    Parse, compile, and evaluate all of the expressions in a module,
+    as with load_module. Returns a list of code objects which will
+    recreate the module when given to marshal_wrapper.
+
+    Each run of consecutive top-level expressions which can be fused
+    is fused into a single code object as it is compiled, so that
+    loading the module again takes one evaluation per run rather than
+    one per expression. An expression which cannot be fused ends the
+    run before it, and keeps its own code object.
+
+    Fusing generates the code for each expression a second time, so
+    this is only worthwhile when the result is to be marshalled.
+    """
+
+    factory = get_module_compiler_factory(module)
+    params = get_module_compiler_factory_params(module)
+
+    code_objs = []
+
+    # the code space for the current run, and the code objects of the
+    # expressions which have been fused into it
+    fused = None
+    fused_objs = []
+
+    def end_run():
+        nonlocal fused
+
+        if len(fused_objs) > 1:
+            with fused.active_context(module):
+                fused.pseudop_return_none()
+                code_objs.append(fused.complete())
+        else:
+            # nothing gained by fusing a lone expression
+            code_objs.extend(fused_objs)
+
+        fused = None
+        fused_objs.clear()
+
+    def compile_time_fusing(module, source_expr):
+        nonlocal fused
+
+        if fused is None:
+            fused = factory(**params)
+
+        compiler = get_module_compiler(module)
+
+        # the fused code won't be run by a trampoline, so the
+        # expression mustn't leave a tailcall for one to bounce
+        with compiler.active_context(module, auto_copy=True) as comp:
+            comp.add_expression(source_expr, False)
+            comp.pseudop_return()
+            code_obj = comp.complete()
+            fusable = fused.fuse(comp)
+
+        if fusable:
+            fused_objs.append(code_obj)
+        else:
+            end_run()
+            code_objs.append(code_obj)
+
+        return code_obj
+
+    load_module(module, parse_time=parse_time,
+                compile_time=compile_time_fusing, run_time=run_time)
+
+    end_run()
+    return code_objs
+
+
+def exec_marshal_module(glbls, code_objs, builtins=None, version=None):
     """
-    Invoked during loading of modules expored via marshal_wrapper
+    Invoked during loading of modules expored via marshal_wrapper.
+    Raises an ImportError if version does not match CACHE_VERSION, as
+    the code objects were compiled by another version of sibilant.
     """
 
+    if version != CACHE_VERSION:
+        name = glbls.get("__name__")
+        msg = "%s was compiled by another version of sibilant" % name
+        raise ImportError(msg, name=name)
+
     # mod = fake_module_from_env(glbls)
     mod = init_module(glbls, None, builtins=builtins)
 
+    # some macros will reference the __reader__ of the module they
+    # were defined in, which would have been assigned during parse
+    # time had we been loaded from source
+    get_module_reader(mod)
+
     # skips the read time and compile time stages of import, just
     # performs run time for every compiled expression to set up the
     # module
@@ -415,12 +557,65 @@ def exec_marshal_module(glbls, code_objs, builtins=None):
     return None
 
 
+def default_invalidation_mode():
+    """
+    The PycInvalidationMode used when none is specified. As with
+    py_compile, this is CHECKED_HASH if the SOURCE_DATE_EPOCH
+    environment variable is set for a reproducible build, and
+    TIMESTAMP otherwise.
+    """
+
+    if HASH_PYC_SUPPORTED and environ.get("SOURCE_DATE_EPOCH"):
+        return PycInvalidationMode.CHECKED_HASH
+    else:
+        return PycInvalidationMode.TIMESTAMP
+
+
+def source_hash(source_bytes):
+    """
+    The hash of a module's source, as recorded in a hash-based pyc
+    """
+
+    from importlib.util import source_hash
+    return source_hash(source_bytes)
+
+
+def pyc_invalidation_mode(data):
+    """
+    The PycInvalidationMode recorded in the header of the given
+    bytes, or None if they are too short to have a header.
+    """
+
+    # the flags field was introduced alongside hash-based pyc
+    if not HASH_PYC_SUPPORTED:
+        return PycInvalidationMode.TIMESTAMP if len(data) >= 12 else None
+
+    elif len(data) < 16:
+        return None
+
+    flags = int.from_bytes(data[4:8], "little")
+
+    if not flags & 0b01:
+        return PycInvalidationMode.TIMESTAMP
+    elif flags & 0b10:
+        return PycInvalidationMode.CHECKED_HASH
+    else:
+        return PycInvalidationMode.UNCHECKED_HASH
+
+
 def marshal_wrapper(code_objs, filename=None, mtime=0, source_size=0,
-                    builtins_name=None):
+                    builtins_name=None, invalidation_mode=None,
+                    source_hash=None):
 
     """
     Produce a collection of bytes representing the compiled form of a
     series of statements (as compiled code objects).
+
+    The header is validated against mtime and source_size if
+    invalidation_mode is TIMESTAMP (the default), and against
+    source_hash for either of the hash-based modes. Raises a
+    ValueError if a hash-based mode is not supported by this version
+    of python, or if source_hash is missing.
     """
 
     import importlib._bootstrap_external as ibe
@@ -429,6 +624,19 @@ def marshal_wrapper(code_objs, filename=None, mtime=0, source_size=0,
     except AttributeError:
         pyc = ibe._code_to_timestamp_pyc
 
+    if invalidation_mode is None:
+        invalidation_mode = PycInvalidationMode.TIMESTAMP
+
+    if invalidation_mode is not PycInvalidationMode.TIMESTAMP:
+        if not HASH_PYC_SUPPORTED:
+            raise ValueError("hash-based pyc requires Python 3.7")
+        if source_hash is None:
+            raise ValueError("hash-based pyc requires a source_hash")
+
+        checked = invalidation_mode is PycInvalidationMode.CHECKED_HASH
+        pyc = partial(ibe._code_to_hash_pyc,
+                      source_hash=source_hash, checked=checked)
+
     factory = compiler_for_version()
     codespace = factory(filename=filename, mode=Mode.MODULE)
 
@@ -474,43 +682,204 @@ def marshal_wrapper(code_objs, filename=None, mtime=0, source_size=0,
         else:
             codespace.pseudop_const(None)
 
-        codespace.pseudop_call(3)
+        # argument 4. the version of sibilant which compiled them
+        codespace.pseudop_const(CACHE_VERSION)
+
+        codespace.pseudop_call(4)
         codespace.pseudop_return()
 
         code = codespace.complete()
 
-    return pyc(code, mtime, source_size)
+    if invalidation_mode is PycInvalidationMode.TIMESTAMP:
+        return pyc(code, mtime, source_size)
+    else:
+        return pyc(code)
+
+
+def unmarshal_wrapper(data, name=None, filename=None, mtime=0,
+                      source_size=0, cache_filename=None,
+                      source_hash=None):
+
+    """
+    The inverse of marshal_wrapper. Validates the header of the
+    given bytes against the mtime and size of the original source
+    file, and produces the stub code object which, when executed in
+    a module's globals, will evaluate all of the marshalled
+    expressions.
+
+    Hash-based bytes are instead validated against source_hash, as
+    directed by their checked flag and by the interpreter's
+    --check-hash-based-pycs option. source_hash may be a callable
+    producing the hash, so that the source need only be read when it
+    is actually checked.
+
+    Raises an ImportError if the bytes are stale or were produced for
+    another version of python or of sibilant, and an EOFError if they
+    are truncated.
+    """
+
+    import importlib._bootstrap_external as ibe
+
+    # the header validation helpers are private, and have changed
+    # between versions. Python 3.7 introduced a flags field in the
+    # header, making it 16 bytes rather than 12
+    try:
+        classify = ibe._classify_pyc
+    except AttributeError:
+        stats = {"mtime": int(mtime), "size": source_size}
+        data = ibe._validate_bytecode_header(data, stats, name,
+                                             cache_filename)
+    else:
+        details = {"name": name, "path": cache_filename}
+        flags = classify(data, name, details)
+
+        if not flags & 0b01:
+            ibe._validate_timestamp_pyc(data, int(mtime), source_size,
+                                        name, details)
+
+        elif _check_hash_pyc(flags & 0b10):
+            if callable(source_hash):
+                source_hash = source_hash()
+            ibe._validate_hash_pyc(data, source_hash, name, details)
+
+        data = memoryview(data)[16:]
+
+    code = ibe._compile_bytecode(data, name, cache_filename, filename)
+
+    # the stub passes along the CACHE_VERSION it was produced with
+    if CACHE_VERSION not in code.co_consts:
+        raise ImportError("bytecode is from another version of sibilant",
+                          name=name, path=cache_filename)
+
+    return code
+
+
+def _check_hash_pyc(checked):
+    import _imp
+
+    check = _imp.check_hash_based_pycs
+    return check == "always" or (checked and check != "never")
 
 
 def compile_to_file(name, pkgname, source_file, dest_file,
-                    builtins_name=None):
+                    builtins_name=None, invalidation_mode=None):
 
     """
     Produce a python compiled bytecode file from a sibilant source
-    code file.
+    code file. If builtins_name is specified, then that module
+    provides the builtins both while compiling and when the bytecode
+    is later loaded. invalidation_mode is a PycInvalidationMode, and
+    defaults to that from default_invalidation_mode.
     """
 
+    if invalidation_mode is None:
+        invalidation_mode = default_invalidation_mode()
+
+    hashed = invalidation_mode is not PycInvalidationMode.TIMESTAMP
+    if hashed and not HASH_PYC_SUPPORTED:
+        raise ValueError("hash-based pyc requires Python 3.7")
+
     mtime = getmtime(source_file)
     source_size = getsize(source_file)
 
-    code_objs = []
+    shash = None
+    if hashed:
+        with open(source_file, "rb") as source_bytes:
+            shash = source_hash(source_bytes.read())
 
-    def accumulate(_mod, _sexpr, code):
-        code_objs.append(code)
+    builtins = None
+    if builtins_name:
+        from importlib import import_module
+        builtins = import_module(builtins_name)
 
     with source_open(source_file) as source_stream:
         mod = new_module(name, package_name=pkgname)
-        mod = init_module(mod, source_stream)
-        load_module(mod, compile_time=hook_compile_time(accumulate))
+        mod = init_module(mod, source_stream, builtins=builtins)
+        code_objs = load_module_fused(mod)
 
     bytecode = marshal_wrapper(code_objs, filename=source_file,
                                mtime=mtime, source_size=source_size,
-                               builtins_name=builtins_name)
+                               builtins_name=builtins_name,
+                               invalidation_mode=invalidation_mode,
+                               source_hash=shash)
 
     with open(dest_file, "wb") as dest_stream:
         dest_stream.write(bytecode)
 
 
+class _BasicsCache(object):
+    """
+    Manages the __pycache__ entry for the compiled form of
+    sibilant.basics, which uses sibilant.bootstrap as its builtins.
+    Any failure to read or write the cache simply results in the
+    source being used instead.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        try:
+            self.cache_filename = cache_from_source(filename)
+            st = stat(filename)
+        except (NotImplementedError, OSError):
+            self.cache_filename = None
+        else:
+            self.mtime = st.st_mtime
+            self.source_size = st.st_size
+
+
+    def source_hash(self):
+        with open(self.filename, "rb") as fd:
+            return source_hash(fd.read())
+
+
+    def get_code(self):
+        if not self.cache_filename:
+            return None
+
+        try:
+            with open(self.cache_filename, "rb") as fd:
+                data = fd.read()
+            return unmarshal_wrapper(data, "sibilant.basics", self.filename,
+                                     self.mtime, self.source_size,
+                                     self.cache_filename,
+                                     source_hash=self.source_hash)
+        except (OSError, ImportError, EOFError):
+            return None
+
+
+    def writable(self):
+        """
+        True if set_code will attempt to write the cache
+        """
+
+        return bool(self.cache_filename) and not sys.dont_write_bytecode
+
+
+    def set_code(self, code_objs):
+        import importlib._bootstrap_external as ibe
+
+        if not self.writable():
+            return
+
+        try:
+            mode = default_invalidation_mode()
+            shash = None
+            if mode is not PycInvalidationMode.TIMESTAMP:
+                shash = self.source_hash()
+
+            data = marshal_wrapper(code_objs, self.filename,
+                                   self.mtime, self.source_size,
+                                   builtins_name="sibilant.bootstrap",
+                                   invalidation_mode=mode,
+                                   source_hash=shash)
+            makedirs(dirname(self.cache_filename), exist_ok=True)
+            ibe._write_atomic(self.cache_filename, data,
+                              ibe._calc_mode(self.filename))
+        except (OSError, ValueError):
+            pass
+
+
 # ;; async variations
 
 async def async_parse_time(module):
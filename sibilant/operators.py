@@ -27,12 +27,12 @@ license: LGPL v.3
 from .compiler import Operator
 
 from .lib import (
-    symbol, pair, nil, is_pair, is_symbol,
+    symbol, pair, nil, is_pair, is_proper, is_symbol,
     build_tuple, build_list, build_set, build_dict,
     cons, _pass,
 )
 
-from functools import reduce
+from functools import reduce, wraps
 
 import operator as pyop
 from operator import (
@@ -97,6 +97,10 @@ _symbol_mod_ = symbol("%")
 _symbol_mult = symbol("multiply")
 _symbol_mult_ = symbol("*")
 _symbol_nil = symbol("nil")
+_symbol_None = symbol("None")
+_symbol_True = symbol("True")
+_symbol_False = symbol("False")
+_symbol_ellipsis = symbol("...")
 _symbol_not = symbol("not")
 _symbol_not_contains = symbol("not-contains")
 _symbol_not_eq = symbol("not-eq")
@@ -117,7 +121,17 @@ _symbol_sub = symbol("subtract")
 _symbol_sub_ = symbol("-")
 
 
-def operator(namesym, runtime, *aliases):
+def operator(namesym, runtime, *aliases, fold=False):
+    """
+    Decorator registering a compile function as an Operator with
+    the given runtime function.
+
+    If fold is True, or a callable which accepts the argument values
+    and returns True, then an application of the operator whose
+    arguments are all constant may be evaluated at compile time, by
+    calling runtime. See fold_constant
+    """
+
     name = str(namesym)
 
     # runtime = partial(runtime)
@@ -127,7 +141,12 @@ def operator(namesym, runtime, *aliases):
 
     def deco(compilefn):
         compilefn.__name__ = name
-        inst = Operator(name, compilefn, runtime)
+
+        if fold:
+            inst = Operator(name, _folding(compilefn), runtime)
+            _foldable[inst] = _pass_check if fold is True else fold
+        else:
+            inst = Operator(name, compilefn, runtime)
 
         __all__.append(name)
         glbls[name] = inst
@@ -142,6 +161,153 @@ def operator(namesym, runtime, *aliases):
     return deco
 
 
+# --- constant folding ---
+
+
+# maps operator instances to a check function, which is given the
+# constant argument values and decides whether the operator may be
+# applied at compile time
+_foldable = {}
+
+
+_CONST_TYPES = (
+    str, bytes,
+    bool, int, float, complex,
+    type(None), type(...),
+)
+
+
+# limits on the size of a folded value, so that compiling doesn't
+# produce (or take forever to produce) enormous constants
+_FOLD_MAX_BITS = 128
+_FOLD_MAX_LEN = 4096
+
+
+_FOLD_SYMBOLS = {
+    _symbol_None: None,
+    _symbol_True: True,
+    _symbol_False: False,
+    _symbol_ellipsis: ...,
+}
+
+
+def _pass_check(*vals):
+    return True
+
+
+def _foldable_value(value):
+    vtype = type(value)
+
+    if vtype is int:
+        return value.bit_length() <= _FOLD_MAX_BITS
+    elif vtype is str or vtype is bytes:
+        return len(value) <= _FOLD_MAX_LEN
+    elif vtype is tuple:
+        return (len(value) <= _FOLD_MAX_LEN and
+                all(map(_foldable_value, value)))
+    else:
+        return vtype in _CONST_TYPES
+
+
+def fold_constant(code, expr):
+    """
+    Attempt to evaluate expr at compile time. This is possible if
+    expr is a literal, a constant symbol (including those declared
+    via defconst), or an application of a folding operator upon
+    arguments which can themselves be folded. Returns a tuple of
+    (found, value)
+    """
+
+    if is_symbol(expr):
+        if expr in _FOLD_SYMBOLS:
+            return True, _FOLD_SYMBOLS[expr]
+        else:
+            return code.find_constant(expr)
+
+    elif expr is nil or not is_pair(expr):
+        if _foldable_value(expr):
+            return True, expr
+        else:
+            return False, None
+
+    head, args = expr
+    if not (is_symbol(head) and is_proper(args)):
+        return False, None
+
+    comp = code.find_compiled(head)
+    check = _foldable.get(comp) if comp is not None else None
+    if check is None:
+        return False, None
+
+    vals = []
+    for arg in args.unpack():
+        found, value = fold_constant(code, arg)
+        if not found:
+            return False, None
+        vals.append(value)
+
+    try:
+        if not check(*vals):
+            return False, None
+        value = comp(*vals)
+
+    except Exception:
+        # leave it to raise at runtime instead
+        return False, None
+
+    if _foldable_value(value):
+        return True, value
+    else:
+        return False, None
+
+
+def _folding(compilefn):
+
+    @wraps(compilefn)
+    def compile_folding(code, source, tc=False):
+        found, value = fold_constant(code, source)
+        if found:
+            code.pseudop_position_of(source)
+            code.pseudop_const(value)
+            return None
+        else:
+            return compilefn(code, source, tc)
+
+    return compile_folding
+
+
+def _check_multiply(*vals):
+    # repeating a sequence is only allowed if the result is small
+    size = 1
+    sequence = False
+    for val in vals:
+        if type(val) in (str, bytes, tuple):
+            sequence = True
+            size *= len(val)
+        elif type(val) is int:
+            size *= abs(val)
+    return size <= _FOLD_MAX_LEN if sequence else True
+
+
+def _check_power(base, exp, *mod):
+    if type(base) is int and type(exp) is int and exp > 0:
+        return base.bit_length() * exp <= _FOLD_MAX_BITS
+    else:
+        return True
+
+
+def _check_modulo(val, *vals):
+    # string formatting can produce arbitrarily large results
+    return type(val) not in (str, bytes)
+
+
+def _check_lshift(val, count):
+    if type(val) is int and type(count) is int:
+        return val.bit_length() + count <= _FOLD_MAX_BITS
+    else:
+        return True
+
+
 # --- oddball pass operator ---
 
 
@@ -169,7 +335,7 @@ def runtime_and(*vals):
     return val
 
 
-@operator(_symbol_and, runtime_and)
+@operator(_symbol_and, runtime_and, fold=True)
 def operator_and(code, source, tc=False):
     """
     (and EXPR...)
@@ -208,7 +374,7 @@ def runtime_or(*vals):
     return val
 
 
-@operator(_symbol_or, runtime=runtime_or)
+@operator(_symbol_or, runtime=runtime_or, fold=True)
 def operator_or(code, source, tc=False):
     """
     (or EXPR...)
@@ -245,7 +411,7 @@ def runtime_add(val, *vals):
     return reduce(__add__, vals, val) if vals else +val
 
 
-@operator(_symbol_add, runtime_add, _symbol_add_)
+@operator(_symbol_add, runtime_add, _symbol_add_, fold=True)
 def operator_add(code, source, tc=False):
     """
     (+ VAL)
@@ -301,7 +467,7 @@ def runtime_subtract(val, *vals):
     return reduce(__sub__, vals, val) if vals else -val
 
 
-@operator(_symbol_sub, runtime_subtract, _symbol_sub_)
+@operator(_symbol_sub, runtime_subtract, _symbol_sub_, fold=True)
 def operator_subtract(code, source, tc=False):
     """
     (- VAL)
@@ -385,7 +551,8 @@ def runtime_multiply(val, *vals):
     return reduce(__mul__, vals, val) if vals else (1 * val)
 
 
-@operator(_symbol_mult, runtime_multiply, _symbol_mult_)
+@operator(_symbol_mult, runtime_multiply, _symbol_mult_,
+          fold=_check_multiply)
 def operator_multiply(code, source, tc=False):
     """
     (* VAL)
@@ -402,7 +569,7 @@ def runtime_divide(val, *vals):
     return reduce(__truediv__, vals, val) if vals else (1 / val)
 
 
-@operator(_symbol_div, runtime_divide, _symbol_div_)
+@operator(_symbol_div, runtime_divide, _symbol_div_, fold=True)
 def operator_divide(code, source, tc=False):
     """
     (/ VAL)
@@ -420,7 +587,8 @@ def runtime_floor_divide(val, *vals):
     return reduce(__floordiv__, vals, val) if vals else (1 // val)
 
 
-@operator(_symbol_floordiv, runtime_floor_divide, _symbol_floordiv_)
+@operator(_symbol_floordiv, runtime_floor_divide, _symbol_floordiv_,
+          fold=True)
 def operator_floor_divide(code, source, tc=False):
     """
     (// VAL)
@@ -439,7 +607,8 @@ def runtime_bitwise_and(val1, val2, *vals):
     return reduce(__and__, vals, val) if vals else val
 
 
-@operator(_symbol_bit_and, runtime_bitwise_and, _symbol_bit_and_)
+@operator(_symbol_bit_and, runtime_bitwise_and, _symbol_bit_and_,
+          fold=True)
 def operator_bit_and(code, source, tc=False):
     """
     (& VALUE MASK)
@@ -457,7 +626,8 @@ def runtime_bitwise_or(val1, val2, *vals):
     return reduce(__or__, vals, val) if vals else val
 
 
-@operator(_symbol_bit_or, runtime_bitwise_or, _symbol_bit_or_)
+@operator(_symbol_bit_or, runtime_bitwise_or, _symbol_bit_or_,
+          fold=True)
 def operator_bit_or(code, source, tc=False):
     """
     (| VALUE SETMASK)
@@ -475,7 +645,8 @@ def runtime_bitwise_xor(val1, val2, *vals):
     return reduce(__xor__, vals, val) if vals else val
 
 
-@operator(_symbol_bit_xor, runtime_bitwise_xor, _symbol_bit_xor_)
+@operator(_symbol_bit_xor, runtime_bitwise_xor, _symbol_bit_xor_,
+          fold=True)
 def operator_bit_xor(code, source, tc=False):
     """
     (^ VALUE FLIPMASK)
@@ -555,7 +726,7 @@ def _helper_binary(code, source, opfun, flip=False):
     opfun()
 
 
-@operator(_symbol_item, pyop.getitem)
+@operator(_symbol_item, pyop.getitem, fold=True)
 def operator_item(code, source, tc=False):
     """
     (item OBJ KEY)
@@ -576,7 +747,7 @@ def operator_del_item(code, source, tc=False):
     code.pseudop_const(None)
 
 
-@operator(_symbol_pow, pyop.pow, _symbol_pow_)
+@operator(_symbol_pow, pyop.pow, _symbol_pow_, fold=_check_power)
 def operator_power(code, source, tc=False):
     """
     (** VAL EXPONENT)
@@ -586,7 +757,7 @@ def operator_power(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_binary_power)
 
 
-@operator(_symbol_mod, pyop.mod, _symbol_mod_)
+@operator(_symbol_mod, pyop.mod, _symbol_mod_, fold=_check_modulo)
 def operator_modulo(code, source, tc=False):
     """
     (% VAL MOD)
@@ -607,7 +778,8 @@ def operator_matmul(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_binary_matrix_multiply)
 
 
-@operator(_symbol_lshift, pyop.lshift, _symbol_lshift_)
+@operator(_symbol_lshift, pyop.lshift, _symbol_lshift_,
+          fold=_check_lshift)
 def operator_lshift(code, source, tc=False):
     """
     (<< VALUE COUNT)
@@ -617,7 +789,7 @@ def operator_lshift(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_binary_lshift)
 
 
-@operator(_symbol_rshift, pyop.rshift, _symbol_rshift_)
+@operator(_symbol_rshift, pyop.rshift, _symbol_rshift_, fold=True)
 def operator_rshift(code, source, tc=False):
     """
     (>> VALUE COUNT)
@@ -627,7 +799,7 @@ def operator_rshift(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_binary_rshift)
 
 
-@operator(_symbol_gt, pyop.gt, _symbol_gt_)
+@operator(_symbol_gt, pyop.gt, _symbol_gt_, fold=True)
 def operator_gt(code, source, tc=False):
     """
     (> VAL1 VAL2)
@@ -640,7 +812,7 @@ def operator_gt(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_gt)
 
 
-@operator(_symbol_ge, pyop.ge, _symbol_ge_)
+@operator(_symbol_ge, pyop.ge, _symbol_ge_, fold=True)
 def operator_ge(code, source, tc=False):
     """
     (>= VAL1 VAL2)
@@ -653,7 +825,7 @@ def operator_ge(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_gte)
 
 
-@operator(_symbol_contains, pyop.contains)
+@operator(_symbol_contains, pyop.contains, fold=True)
 def operator_contains(code, source, tc=False):
     """
     (contains SEQUENCE VALUE)
@@ -665,7 +837,7 @@ def operator_contains(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_in, True)
 
 
-@operator(_symbol_in, (lambda value, seq: value in seq))
+@operator(_symbol_in, (lambda value, seq: value in seq), fold=True)
 def operator_in(code, source, tc=False):
     """
     (in VALUE SEQUENCE)
@@ -677,7 +849,8 @@ def operator_in(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_in)
 
 
-@operator(_symbol_not_contains, (lambda seq, value: value not in seq))
+@operator(_symbol_not_contains, (lambda seq, value: value not in seq),
+          fold=True)
 def operator_not_contains(code, source, tc=False):
     """
     (not-contains SEQUENCE VALUE)
@@ -689,7 +862,8 @@ def operator_not_contains(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_not_in, True)
 
 
-@operator(_symbol_not_in, (lambda value, seq: value not in seq))
+@operator(_symbol_not_in, (lambda value, seq: value not in seq),
+          fold=True)
 def operator_not_in(code, source, tc=False):
     """
     (not-in VALUE SEQUENCE)
@@ -721,7 +895,7 @@ def operator_is_not(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_is_not)
 
 
-@operator(_symbol_lt, pyop.lt, _symbol_lt_)
+@operator(_symbol_lt, pyop.lt, _symbol_lt_, fold=True)
 def operator_lt(code, source, tc=False):
     """
     (< VAL1 VAL2)
@@ -733,7 +907,7 @@ def operator_lt(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_lt)
 
 
-@operator(_symbol_le, pyop.le, _symbol_le_)
+@operator(_symbol_le, pyop.le, _symbol_le_, fold=True)
 def operator_le(code, source, tc=False):
     """
     (<= VAL1 VAL2)
@@ -746,7 +920,7 @@ def operator_le(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_lte)
 
 
-@operator(_symbol_eq, pyop.eq, _symbol_eq_)
+@operator(_symbol_eq, pyop.eq, _symbol_eq_, fold=True)
 def operator_eq(code, source, tc=False):
     """
     (== VAL1 VAL2)
@@ -759,7 +933,7 @@ def operator_eq(code, source, tc=False):
     _helper_binary(code, source, code.pseudop_compare_eq)
 
 
-@operator(_symbol_not_eq, pyop.ne, _symbol_not_eq_)
+@operator(_symbol_not_eq, pyop.ne, _symbol_not_eq_, fold=True)
 def operator_not_eq(code, source, tc=False):
     """
     (!= VAL1 VAL2)
@@ -791,7 +965,7 @@ def _helper_unary(code, source, opfun):
     opfun()
 
 
-@operator(_symbol_not, pyop.not_)
+@operator(_symbol_not, pyop.not_, fold=True)
 def operator_not(code, source, tc=False):
     """
     (not VAL)
@@ -802,7 +976,7 @@ def operator_not(code, source, tc=False):
     _helper_unary(code, source, code.pseudop_unary_not)
 
 
-@operator(_symbol_invert, pyop.invert)
+@operator(_symbol_invert, pyop.invert, fold=True)
 def operator_invert(code, source, tc=False):
     """
     (~ VAL)
@@ -877,14 +1051,8 @@ def operator_raise(code, source, tc=False):
     return None
 
 
-_CONST_TYPES = (
-    str, bytes,
-    bool, int, float, complex,
-    type(None), type(...),
-)
-
-
-@operator(_symbol_build_tuple, build_tuple, _symbol_hash_tuple)
+@operator(_symbol_build_tuple, build_tuple, _symbol_hash_tuple,
+          fold=True)
 def operator_build_tuple(code, source, tc=False):
     """
     (build-tuple ITEM...)
@@ -1024,7 +1192,8 @@ def collapse_build_str(seq):
         yield "".join(tmp)
 
 
-@operator(_symbol_build_str, runtime_build_str, _symbol_hash_str)
+@operator(_symbol_build_str, runtime_build_str, _symbol_hash_str,
+          fold=True)
 def operator_build_str(code, source, tc=False):
     """
     (build-str VAL...)
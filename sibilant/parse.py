@@ -26,20 +26,23 @@ license: LGPL v.3
 from .lib import symbol, keyword, cons, nil, is_pair, setcdr
 from .lib import SibilantSyntaxError
 
-from codecs import decode
+from bisect import bisect_left
+from codecs import decode, getincrementaldecoder
 from contextlib import contextmanager
 from decimal import Decimal as decimal
 from fractions import Fraction as fraction
 from functools import partial
-from io import StringIO
 from os.path import exists
-from re import compile as regex, UNICODE, VERBOSE
+from re import compile as regex, error as RegexError, escape
+from re import DOTALL, UNICODE, VERBOSE
 
 
 __all__ = (
     "ReaderSyntaxError", "FormatStringSyntaxError",
-    "SourceStream", "source_open", "source_str", "source_stream",
+    "SourceStream", "StringSourceStream", "IncrementalReader",
+    "source_open", "source_str", "source_stream",
     "Reader", "default_reader",
+    "load", "loads", "iterload", "iterloads",
 )
 
 
@@ -55,6 +58,13 @@ _symbol_unquote = symbol("unquote")
 _symbol_unquote_splicing = symbol("unquote-splicing")
 
 
+_closers = {"(": ")", "[": "]", "{": "}"}
+
+
+# the maximum number of distinct symbol atoms a Reader will remember
+_SYMBOL_ATOMS_MAX = 4096
+
+
 IN_PROGRESS = keyword("work-in-progress")
 VALUE = keyword("value")
 ATOM = keyword("atom")
@@ -161,16 +171,33 @@ class Atom(str):
 
 class Reader(object):
 
-    def __init__(self, nodefaults=False):
+    def __init__(self, nodefaults=False, positions=True):
         self.reader_macros = {}
+
+        # when False, pairs are not given their source positions,
+        # which is useful for reading plain s-expression data
+        self.positions = positions
+
         self.atom_patterns = []
         self.terminating = ["\n", "\r", "\t", " "]
         self._terms = "".join(self.terminating)
 
+        self._atom_dispatch = None
+        self._symbol_atoms = {}
+
+        self._default_macros = {}
+        self._overridden = set()
+        self._pristine = False
+        self._tokenizers = {}
+        self._tokenizer_cache = None
+
         if not nodefaults:
             self._add_default_macros()
             self._add_default_atoms()
 
+            self._default_macros = dict(self.reader_macros)
+            self._pristine = True
+
 
     def read(self, reader_stream):
         """
@@ -231,6 +258,9 @@ class Reader(object):
 
 
     def _read(self, stream, raw=False):
+        if self._pristine and stream.buffered:
+            return self._read_fast(stream, raw)
+
         while True:
             stream.skip_whitespace()
 
@@ -253,7 +283,7 @@ class Reader(object):
                 # macro of _read_default
                 raise stream.error(ve.args[0], position) from None
 
-            if is_pair(value):
+            if self.positions and is_pair(value):
                 value.set_position(position)
 
             if event is SKIP:
@@ -264,6 +294,238 @@ class Reader(object):
         return event, position, value
 
 
+    def _read_fast(self, stream, raw=False):
+        """
+        The equivalent of _read for a buffered stream while the
+        default syntax is in place. Whitespace, comments, brackets,
+        strings, and plain atoms are recognized directly from the
+        underlying string by a tokenizing regex, and pairs are
+        assembled without re-entering the reader for each
+        element. Only the remaining macro characters are dispatched
+        as character events.
+        """
+
+        source = stream.source
+        position_at = stream.position_at
+        positions = self.positions
+        tokenizer = self._tokenizer()
+
+        # the pairs currently being read, innermost last. Each is a
+        # list of [closer, open char, open position, head, tail]
+        stack = []
+
+        while True:
+            offset = _skip_re(source, stream.offset).end()
+            position = position_at(offset)
+
+            match = tokenizer(source, offset)
+            if match is None:
+                stream.offset = offset
+                if stack:
+                    raise stream.error("unexpected EOF")
+                return EOF, position, None
+
+            kind = match.lastgroup
+            value = match.group(kind)
+            stream.offset = match.end()
+
+            if kind == "atom":
+                if value == ".":
+                    event = DOT
+                elif raw and not stack:
+                    return ATOM, position, value
+                else:
+                    event = VALUE
+                    try:
+                        value = self.process_atom(value)
+                    except ValueError as ve:
+                        raise stream.error(ve.args[0], position) from None
+
+                    if positions and is_pair(value):
+                        value.set_position(position)
+
+            elif kind == "open":
+                stack.append([_closers[value], value, position, nil, nil])
+                continue
+
+            elif kind == "close":
+                event = CLOSE_PAIR
+
+            elif kind == "macro":
+                event, value = self._read_fast_macro(stream, value,
+                                                     position,
+                                                     raw and not stack)
+                if event is SKIP:
+                    continue
+
+                if not self._pristine:
+                    # the macro has altered the default syntax, so
+                    # any pairs still in progress must be finished by
+                    # the character event machinery
+                    return self._read_fast_abandon(stream, stack,
+                                                   event, position, value)
+
+                tokenizer = self._tokenizer()
+
+            else:
+                # a complete single or triple quoted string
+                event = VALUE
+                value = _as_unicode(value)
+
+            # now we have an event. Either it's for the top-level, or
+            # it needs to be applied to the pair being read.
+            while stack:
+                frame = stack[-1]
+
+                if event is CLOSE_PAIR:
+                    stack.pop()
+                    event, position, value = \
+                        self._read_fast_close(stream, frame,
+                                              position, value)
+                    continue
+
+                elif event is DOT:
+                    stack.pop()
+                    event, position, value = \
+                        self._read_fast_dot(stream, frame, position)
+                    continue
+
+                elif event is EOF:
+                    raise stream.error("unexpected EOF")
+
+                cell = cons(value, nil)
+                if positions:
+                    cell.set_position(position)
+
+                if frame[3] is nil:
+                    frame[3] = cell
+                else:
+                    setcdr(frame[4], cell)
+                frame[4] = cell
+                break
+
+            else:
+                return event, position, value
+
+
+    def _read_fast_macro(self, stream, char, position, raw):
+        # dispatch a character macro in the same manner as _read
+
+        macro = self.reader_macros[char]
+
+        try:
+            event, value = macro(stream, char)
+            if not raw and event is ATOM:
+                event = VALUE
+                value = self.process_atom(value)
+
+        except ValueError as ve:
+            raise stream.error(ve.args[0], position) from None
+
+        if self.positions and is_pair(value):
+            value.set_position(position)
+
+        return event, value
+
+
+    def _read_fast_close(self, stream, frame, position, char):
+        # the equivalent of the end of _read_pair and _read_begin,
+        # followed by the positioning from _read
+
+        closer, opener, open_position, result, _work = frame
+
+        if char != closer:
+            raise stream.error("mismatched open and close characters",
+                               position)
+
+        if opener == "{":
+            new_result = cons(_symbol_begin, result)
+            if self.positions:
+                new_result.set_position(result.get_position())
+            result = new_result
+
+        if self.positions and is_pair(result):
+            result.set_position(open_position)
+
+        return VALUE, open_position, result
+
+
+    def _read_fast_dot(self, stream, frame, position):
+        # the dotted tail of a pair, handled exactly as _read_pair
+        # would, and then closed
+
+        closer, opener, open_position, result, work = frame
+
+        if result is nil:
+            raise stream.error("invalid dotted list", position)
+
+        dot_position = position
+
+        event, position, value = self._read(stream)
+        if event is not VALUE:
+            raise stream.error("invalid list syntax", position)
+        else:
+            setcdr(work, value)
+
+        event, position, value = self._read(stream)
+        if event is not CLOSE_PAIR:
+            raise stream.error("invalid use of dot in list", dot_position)
+
+        return self._read_fast_close(stream, frame, position, value)
+
+
+    def _read_fast_abandon(self, stream, stack, event, position, value):
+        # finish reading the pairs in progress via _read_pair_rest,
+        # innermost first, then return the completed top-level value
+
+        pending = (event, position, value)
+
+        while stack:
+            frame = stack.pop()
+            closer, _opener, _position, result, work = frame
+
+            _event, frame[3] = self._read_pair_rest(closer, stream,
+                                                    result, work, pending)
+            pending = self._read_fast_close(stream, frame, None, closer)
+
+        return pending
+
+
+    def _tokenizer(self):
+        # the atom terminating characters and the macro characters
+        # change temporarily during quasiquote and unquote, so we keep
+        # a tokenizer for each combination we've encountered
+
+        found = self._tokenizer_cache
+        if found is None:
+            key = (self._terms, "".join(sorted(self.reader_macros)))
+
+            found = self._tokenizers.get(key)
+            if found is None:
+                found = _tokenizer_regex(*key)
+                self._tokenizers[key] = found
+
+            self._tokenizer_cache = found
+
+        return found
+
+
+    def _check_pristine(self, char):
+        # the fast path in _read_fast is only correct while all of
+        # the default character macros are still in place
+
+        self._tokenizer_cache = None
+
+        default = self._default_macros.get(char)
+        if default is not None:
+            if self.reader_macros.get(char) is default:
+                self._overridden.discard(char)
+            else:
+                self._overridden.add(char)
+
+            self._pristine = not self._overridden
+
+
     def set_event_macro(self, char, macro_fn, terminating=False):
         """
         Adds a character event macro to parser
@@ -271,9 +533,11 @@ class Reader(object):
 
         for c in char:
             self.reader_macros[c] = macro_fn
-            if terminating:
+            if terminating and c not in self.terminating:
                 self.terminating.append(c)
 
+            self._check_pristine(c)
+
         if terminating:
             self._terms = "".join(self.terminating)
 
@@ -295,10 +559,13 @@ class Reader(object):
         """
 
         if char in self.reader_macros:
-            self.terminating.remove(char)
-            self._terms = "".join(self.terminating)
+            if char in self.terminating:
+                self.terminating.remove(char)
+                self._terms = "".join(self.terminating)
             del self.reader_macros[char]
 
+            self._check_pristine(char)
+
 
     @contextmanager
     def temporary_event_macro(self, char, macro_fn, terminating=False):
@@ -364,6 +631,13 @@ class Reader(object):
 
 
     def set_atom_pattern(self, namesym, match_fn, conversion_fn):
+        """
+        Adds an atom pattern to the reader. Atoms for which match_fn
+        returns a true value will be converted via conversion_fn. The
+        most recently added pattern takes precedence, unless it is
+        replacing an existing pattern of the same name.
+        """
+
         for patt in self.atom_patterns:
             if patt[0] is namesym:
                 patt[1] = match_fn
@@ -372,6 +646,9 @@ class Reader(object):
         else:
             self.atom_patterns.insert(0, [namesym, match_fn, conversion_fn])
 
+        self._atom_dispatch = None
+        self._symbol_atoms.clear()
+
 
     def get_atom_pattern(self, namesym):
         for patt in self.atom_patterns:
@@ -382,14 +659,17 @@ class Reader(object):
 
 
     def clear_atom_pattern(self, namesym):
-        for index, patt in self.atom_patterns:
+        for index, patt in enumerate(self.atom_patterns):
             if patt[0] is namesym:
-                del patt[0]
+                del self.atom_patterns[index]
                 break
 
+        self._atom_dispatch = None
+        self._symbol_atoms.clear()
+
 
     def set_atom_regex(self, namesym, regexstr, conversion_fn):
-        match = partial(regex(regexstr).match)
+        match = regex(regexstr).match
         self.set_atom_pattern(namesym, match, conversion_fn)
 
 
@@ -413,7 +693,7 @@ class Reader(object):
         matched.
         """
 
-        atom = c + stream.read_until(self._terms.__contains__)
+        atom = c + stream.read_until_any(self._terms)
 
         if atom == ".":
             return DOT, None
@@ -422,11 +702,32 @@ class Reader(object):
 
 
     def process_atom(self, atom):
-        for name, match, conv in self.atom_patterns:
-            if match(atom):
+        # most atoms are plain symbols, which no pattern matched the
+        # last time we saw them either
+        found = self._symbol_atoms.get(atom)
+        if found is not None:
+            return found
+
+        dispatch = self._atom_dispatch
+        if dispatch is None:
+            dispatch = _atom_dispatch(self.atom_patterns)
+            self._atom_dispatch = dispatch
+
+        for match, conv, convs in dispatch:
+            found = match(atom)
+            if found:
+                if convs is not None:
+                    conv = convs[found.lastgroup]
                 return conv(atom)
-        else:
-            return symbol(atom)
+
+        found = symbol(atom)
+
+        cache = self._symbol_atoms
+        if len(cache) >= _SYMBOL_ATOMS_MAX:
+            cache.clear()
+        cache[atom] = found
+
+        return found
 
 
     def read_pair(self, stream, openchar=None, closechar=None):
@@ -447,11 +748,24 @@ class Reader(object):
         The character macro handler for pair notation
         """
 
-        result = nil
-        work = result
+        return self._read_pair_rest(closer, stream, nil, nil)
+
+
+    def _read_pair_rest(self, closer, stream, result, work, pending=None):
+        """
+        Continues reading a pair whose leading items have already been
+        collected from result to work. If pending is specified, it is
+        the first event to be handled, rather than reading one.
+        """
+
+        positions = self.positions
 
         while True:
-            event, position, value = self._read(stream)
+            if pending is None:
+                event, position, value = self._read(stream)
+            else:
+                event, position, value = pending
+                pending = None
 
             if event is CLOSE_PAIR:
                 break
@@ -489,13 +803,15 @@ class Reader(object):
             elif result is nil:
                 # begin the list. This position will get overwritten.
                 result = cons(value, nil)
-                result.set_position(position)
+                if positions:
+                    result.set_position(position)
                 work = result
 
             else:
                 # append to the current list
                 new_work = cons(value, nil)
-                new_work.set_position(position)
+                if positions:
+                    new_work.set_position(position)
                 setcdr(work, new_work)
                 work = new_work
 
@@ -511,7 +827,8 @@ class Reader(object):
 
         if event is VALUE:
             new_result = cons(_symbol_begin, result)
-            new_result.set_position(result.get_position())
+            if self.positions:
+                new_result.set_position(result.get_position())
             result = new_result
 
         return event, result
@@ -543,7 +860,8 @@ class Reader(object):
 
         if event is VALUE:
             new_result = cons(symbol(name), result)
-            new_result.set_position(pos)
+            if self.positions:
+                new_result.set_position(pos)
             result = new_result
 
         return event, result
@@ -754,15 +1072,16 @@ class FormatStringReader(object):
 @contextmanager
 def source_open(filename, auto_skip_exec=True):
     with open(filename, "rt") as fs:
-        reader = SourceStream(fs, filename=filename,
-                              auto_skip_exec=auto_skip_exec)
-        yield reader
+        reader = StringSourceStream(fs.read(), filename=filename,
+                                    auto_skip_exec=auto_skip_exec)
+    yield reader
 
 
 def source_str(source_str, filename, auto_skip_exec=True,
                line_no=1, col_no=0):
-    return SourceStream(StringIO(source_str), filename,
-                        auto_skip_exec=auto_skip_exec)
+    return StringSourceStream(source_str, filename,
+                              auto_skip_exec=auto_skip_exec,
+                              line_no=line_no, col_no=col_no)
 
 
 def source_stream(source_stream, filename, auto_skip_exec=True):
@@ -772,6 +1091,9 @@ def source_stream(source_stream, filename, auto_skip_exec=True):
 
 class SourceStream(object):
 
+    buffered = False
+
+
     def __init__(self, stream, filename, auto_skip_exec=True,
                  line_no=1, col_no=0):
 
@@ -802,7 +1124,7 @@ class SourceStream(object):
         text = None
 
         if position is None:
-            position = self.lin, self.col
+            position = self.position()
 
         if exists(self.filename):
             with open(self.filename, "rt") as fin:
@@ -888,8 +1210,619 @@ class SourceStream(object):
         return self.read(i) if i else ""
 
 
+    def read_until_any(self, chars):
+        return self.read_until(chars.__contains__)
+
+
+class StringSourceStream(SourceStream):
+    """
+    A SourceStream over a single string held in memory. Reading
+    simply advances an offset into the string, and the line and
+    column of that offset are only computed when a position is
+    requested.
+    """
+
+    buffered = True
+
+
+    def __init__(self, source, filename, auto_skip_exec=True,
+                 line_no=1, col_no=0):
+
+        self.filename = filename
+        self.source = source
+        self.offset = 0
+
+        self.lin = line_no
+        self.col = col_no
+
+        self._breaks = None
+        self._newlines = None
+
+        if auto_skip_exec:
+            self.skip_exec()
+
+
+    def _index_breaks(self):
+        # the offsets of every line-breaking character, and the count
+        # of newlines up to and including each one. Carriage returns
+        # reset the column, but only newlines advance the line.
+
+        breaks = []
+        newlines = []
+        count = 0
+
+        for match in _breaks_re(self.source):
+            index = match.start()
+            if match.group() == "\n":
+                count += 1
+            breaks.append(index)
+            newlines.append(count)
+
+        self._breaks = breaks
+        self._newlines = newlines
+
+
+    def position(self):
+        """
+        The line and column of the next character to be read.
+
+        Line numbers start from 1, columns start from 0
+        """
+
+        return self.position_at(self.offset)
+
+
+    def position_at(self, offset):
+        """
+        The line and column of the character at the given offset
+        """
+
+        if self._breaks is None:
+            self._index_breaks()
+
+        index = bisect_left(self._breaks, offset)
+
+        if index:
+            index -= 1
+            return (self.lin + self._newlines[index],
+                    offset - self._breaks[index] - 1)
+        else:
+            return self.lin, self.col + offset
+
+
+    def error(self, message, position=None):
+        if position is None:
+            position = self.position()
+
+        # the offending line is already in memory, so there's no need
+        # to re-read it from the file
+        return ReaderSyntaxError(message, position,
+                                 text=self._line_text(position[0]),
+                                 filename=self.filename)
+
+
+    def _line_text(self, line):
+        if self._breaks is None:
+            self._index_breaks()
+
+        source = self.source
+
+        index = line - self.lin
+        if index > 0:
+            found = bisect_left(self._newlines, index)
+            if found >= len(self._breaks):
+                return None
+            start = self._breaks[found] + 1
+        else:
+            start = 0
+
+        end = source.find("\n", start)
+        return source[start:] if end < 0 else source[start:end + 1]
+
+
+    def read(self, count=1):
+        assert count >= 1, "nonsense read value"
+
+        start = self.offset
+        data = self.source[start:start + count]
+        self.offset = start + len(data)
+        return data
+
+
+    def readline(self):
+        source = self.source
+        start = self.offset
+
+        end = source.find("\n", start)
+        end = len(source) if end < 0 else (end + 1)
+
+        self.offset = end
+        return source[start:end]
+
+
+    def peek(self, count=1):
+        start = self.offset
+        return self.source[start:start + count]
+
+
+    def skip_whitespace(self):
+        start = self.offset
+        self.offset = _whitespace_re(self.source, start).end()
+        return self.source[start:self.offset]
+
+
+    def read_until(self, testf):
+        source = self.source
+        start = self.offset
+
+        end = len(source)
+        for index in range(start, end):
+            if testf(source[index]):
+                end = index
+                break
+
+        self.offset = end
+        return source[start:end]
+
+
+    def read_until_any(self, chars):
+        source = self.source
+        start = self.offset
+
+        self.offset = _until_any_regex(chars)(source, start).end()
+        return source[start:self.offset]
+
+
+class IncrementalReader(object):
+    """
+    Reads top-level forms from text which arrives a piece at a time,
+    such as from a pipe or socket. Text is handed to feed as it
+    arrives, and iterating over the IncrementalReader produces each
+    top-level form whose text is complete so far. Once the input is
+    exhausted, close must be called, after which iterating produces
+    any final forms.
+
+    Brackets, strings, and comments are tracked across the pieces of
+    text, so that a form is only read once it is known to be
+    complete. Only the text which has not yet been read is kept.
+    """
+
+    def __init__(self, reader=None, filename="<stream>"):
+        self.reader = reader or default_reader
+        self.filename = filename
+        self.closed = False
+
+        # the unread text is the buffer followed by the fed chunks
+        # which haven't been joined onto it yet
+        self._buffer = ""
+        self._chunks = []
+        self._size = 0
+
+        self._stream = None
+        self._lin = 1
+        self._col = 0
+
+        # how far the text has been scanned, the text after that
+        # point, the bracket depth and the string or comment state at
+        # that point, and the offset up to which the text holds only
+        # complete forms
+        self._scanned = 0
+        self._unscanned = ""
+        self._depth = 0
+        self._state = None
+        self._ready = 0
+
+        # the ready offset at which the last read came up short, so
+        # that it isn't attempted again until more forms are complete
+        self._waiting = -1
+
+
+    def feed(self, data):
+        """
+        Adds data to the text to be read
+        """
+
+        if self.closed:
+            raise ValueError("feed on a closed IncrementalReader")
+
+        self._discard_read()
+
+        self._chunks.append(data)
+        self._size += len(data)
+        self._scan(data)
+
+
+    def close(self):
+        """
+        Indicates that there is no more text to be fed. Any text still
+        unread is thereafter treated as complete.
+        """
+
+        self._discard_read()
+        self.closed = True
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        stream = self._stream
+        start = stream.offset if stream else 0
+
+        ready = self._size if self.closed else self._ready
+        if start >= ready or ready == self._waiting:
+            raise StopIteration()
+
+        if stream is None:
+            self._buffer += "".join(self._chunks)
+            self._chunks.clear()
+
+            stream = StringSourceStream(self._buffer, self.filename,
+                                        auto_skip_exec=False,
+                                        line_no=self._lin,
+                                        col_no=self._col)
+            self._stream = stream
+
+        try:
+            value = self.reader.read(stream)
+
+        except ReaderSyntaxError:
+            # an error found only upon running out of text, such as
+            # from a quote at the very end, may yet be resolved by the
+            # text which follows it
+            if self.closed or stream.offset < min(ready + 1, self._size):
+                # a genuine error in complete text. Skip past it, so
+                # that reading may continue afterwards.
+                stream.offset = max(stream.offset, start + 1)
+                raise
+
+            # the form simply isn't complete yet
+            stream.offset = start
+            self._waiting = ready
+            raise StopIteration() from None
+
+        if value is None or stream.offset > ready:
+            if not self.closed:
+                stream.offset = start
+                self._waiting = ready
+            raise StopIteration()
+
+        return value
+
+
+    def _discard_read(self):
+        # drops the text which has been read from the buffer
+
+        stream = self._stream
+        if stream is None:
+            return
+
+        done = min(stream.offset, self._size)
+        if done:
+            self._lin, self._col = stream.position_at(done)
+            self._buffer = self._buffer[done:]
+            self._size -= done
+            self._scanned = max(self._scanned - done, 0)
+            self._ready = max(self._ready - done, 0)
+            self._waiting -= done
+
+        self._stream = None
+
+
+    def _scan(self, data):
+        # advances the bracket, string, and comment tracking through
+        # the newly fed data. Anything which might be altered by the
+        # next piece of text, such as a backslash or a quote at the
+        # very end, is left to be scanned again next time.
+
+        text = self._unscanned + data
+        base = self._scanned
+        end = len(text)
+
+        offset = 0
+        depth = self._depth
+        state = self._state
+        ready = self._ready - base
+
+        while offset < end:
+            if state is None:
+                if depth:
+                    match = _scan_nested_re(text, offset)
+                else:
+                    match = _scan_top_re(text, offset)
+
+                if match is None:
+                    offset = end
+                    break
+
+                char = match.group()
+                index = match.start()
+                offset = match.end()
+
+                if char in "([{":
+                    depth += 1
+
+                elif char in ")]}":
+                    depth = max(depth - 1, 0)
+                    if not depth:
+                        ready = offset
+
+                elif char == ";":
+                    state = char
+
+                elif char == '"':
+                    if end - index < 3:
+                        # this may yet become a triple quote
+                        offset = index
+                        break
+                    elif text.startswith('"""', index):
+                        state = '"""'
+                        offset = index + 3
+                    else:
+                        state = char
+
+                else:
+                    # whitespace at the top level ends any atom
+                    ready = offset
+
+            elif state == ";":
+                index = text.find("\n", offset)
+                if index < 0:
+                    offset = end
+                    break
+
+                state = None
+                offset = index + 1
+                if not depth:
+                    ready = offset
+
+            else:
+                if state == '"':
+                    match = _scan_string_re(text, offset)
+                else:
+                    match = _scan_string3_re(text, offset)
+
+                if match is None:
+                    # a partial closing triple quote may be at the end
+                    offset = max(offset, end - len(state) + 1)
+                    break
+
+                if match.group() == "\\":
+                    if match.end() == end:
+                        offset = match.start()
+                        break
+                    offset = match.end() + 1
+
+                else:
+                    state = None
+                    offset = match.end()
+                    if not depth:
+                        ready = offset
+
+        self._scanned = base + offset
+        self._unscanned = text[offset:]
+        self._depth = depth
+        self._state = state
+        self._ready = base + ready
+
+
+_scan_top_re = regex(r"[()\[\]{}\";\s]").search
+_scan_nested_re = regex(r"[()\[\]{}\";]").search
+_scan_string_re = regex(r"[\"\\]").search
+_scan_string3_re = regex(r"\"\"\"|\\").search
+
+
+_breaks_re = regex(r"[\r\n]").finditer
+_whitespace_re = regex(r"\s*").match
+_skip_re = regex(r"(?:\s+|;[^\n]*\n?)*").match
+
+
+_until_any_cache = {}
+
+
+def _until_any_regex(chars):
+    found = _until_any_cache.get(chars)
+    if found is None:
+        found = regex("[^%s]*" % escape(chars)).match
+        _until_any_cache[chars] = found
+    return found
+
+
+def _tokenizer_regex(terms, macros):
+    """
+    Produces the tokenizing match function used by Reader._read_fast,
+    for the given atom terminating characters and macro characters.
+    """
+
+    pattern = r"""
+    (?P<open>[(\[{])
+    | (?P<close>[)\]}])
+    | \"\"\"(?P<string3>(?:\\.|[^\\])*?)\"\"\"
+    | \"(?!\"\")(?P<string>(?:\\.|[^\"\\])*)\"
+    | (?P<atom>[^\s%s][^%s]*)
+    | (?P<macro>.)
+    """ % (escape(macros), escape(terms))
+
+    return regex(pattern, DOTALL | VERBOSE).match
+
+
+_Pattern = type(_integer_re.__self__)
+_default_flags = regex("").flags
+_group_ref_re = regex(r"\\\d|\(\?P=|\(\?\(").search
+
+
+def _combinable_pattern(match_fn):
+    # if match_fn is the match method of a plain compiled regex, then
+    # return that regex
+
+    pattern = getattr(match_fn, "__self__", None)
+
+    if (isinstance(pattern, _Pattern) and
+            match_fn.__name__ == "match" and
+            isinstance(pattern.pattern, str) and
+            pattern.flags == _default_flags and
+            not _group_ref_re(pattern.pattern)):
+
+        return pattern
+
+    else:
+        return None
+
+
+def _atom_dispatch(atom_patterns):
+    """
+    Produces a sequence of (match, conversion, conversions) from a
+    reader's atom patterns, preserving their precedence. Each run of
+    consecutive regex patterns is combined into a single regex with a
+    named group per pattern, and conversions maps those group names
+    to the appropriate conversion function. Any other match function
+    is left as-is, with conversions of None.
+    """
+
+    dispatch = []
+    run = []
+
+    def flush():
+        if not run:
+            return
+
+        groups = []
+        convs = {}
+
+        for index, (pattern, conv) in enumerate(run):
+            name = "_atom_%i" % index
+            groups.append("(?P<%s>%s)" % (name, pattern.pattern))
+            convs[name] = conv
+
+        try:
+            combined = regex("|".join(groups)).match
+        except RegexError:
+            # the patterns didn't combine cleanly, perhaps due to
+            # conflicting group names. Use them individually.
+            for pattern, conv in run:
+                dispatch.append((pattern.match, conv, None))
+        else:
+            dispatch.append((combined, None, convs))
+
+        run.clear()
+
+    for _name, match, conv in atom_patterns:
+        pattern = _combinable_pattern(match)
+        if pattern is None:
+            flush()
+            dispatch.append((match, conv, None))
+        else:
+            run.append((pattern, conv))
+
+    flush()
+
+    return tuple(dispatch)
+
+
 default_reader = Reader()
 
 
+# the reader used by the load functions, which have no need of
+# source positions
+_data_reader = Reader(positions=False)
+
+
+# how much of a file iterload reads at a time
+_LOAD_CHUNK_SIZE = 1 << 16
+
+
+def loads(source, filename="<string>", reader=None):
+    """
+    Reads every top-level form from the string source, and returns
+    them as a list. Pairs are not given source positions.
+    """
+
+    return list(iterloads(source, filename, reader))
+
+
+def iterloads(source, filename="<string>", reader=None):
+    """
+    Reads the top-level forms from the string source, yielding each as
+    it is read. Pairs are not given source positions.
+    """
+
+    read = (reader or _data_reader).read
+    stream = StringSourceStream(source, filename, auto_skip_exec=False)
+
+    while True:
+        value = read(stream)
+        if value is None:
+            break
+        yield value
+
+
+def load(source, filename=None, reader=None, encoding="utf8"):
+    """
+    Reads every top-level form from source, and returns them as a
+    list. source may be a filename, a file object in text or binary
+    mode, or an mmap. Pairs are not given source positions.
+    """
+
+    return list(iterload(source, filename, reader, encoding))
+
+
+def iterload(source, filename=None, reader=None, encoding="utf8",
+             chunk_size=_LOAD_CHUNK_SIZE):
+    """
+    Reads the top-level forms from source, yielding each as it is
+    read. source may be a filename, a file object in text or binary
+    mode, or an mmap.
+
+    The source is consumed chunk_size characters at a time, and only
+    the unread remainder is kept, so memory use is bounded by the
+    largest single top-level form rather than by the size of the
+    whole source.
+    """
+
+    if isinstance(source, str):
+        with open(source, "rt", encoding=encoding) as fd:
+            yield from iterload(fd, filename or source, reader,
+                                encoding, chunk_size)
+        return
+
+    if filename is None:
+        filename = getattr(source, "name", "<stream>")
+
+    parser = IncrementalReader(reader or _data_reader, filename)
+
+    for data in _read_chunks(source, chunk_size, encoding):
+        parser.feed(data)
+        yield from parser
+
+    parser.close()
+    yield from parser
+
+
+def _read_chunks(source, chunk_size, encoding):
+    # yields decoded text from source in chunks. Binary files and
+    # mmaps are decoded incrementally, so that a multi-byte character
+    # may be split across reads.
+
+    decoder = None
+
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+
+        if not isinstance(data, str):
+            if decoder is None:
+                decoder = getincrementaldecoder(encoding)()
+            data = decoder.decode(data)
+
+        yield data
+
+    if decoder is not None:
+        data = decoder.decode(b"", True)
+        if data:
+            yield data
+
+
 #
 # The end.
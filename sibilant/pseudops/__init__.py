@@ -83,6 +83,10 @@ class PseudopsException(SibilantException):
 
 class OpcodeEnum(Enum):
 
+    # members are only ever equal to themselves, so they can be hashed
+    # by identity rather than by Enum's slower hash of their name
+    __hash__ = object.__hash__
+
     def hasconst(self):
         return self.value in dis.hasconst
 
@@ -125,6 +129,8 @@ class Block(Enum):
 
 
 class Pseudop(Enum):
+    __hash__ = object.__hash__
+
     BINARY_ADD = auto()
     BINARY_AND = auto()
     BINARY_FLOOR_DIVIDE = auto()
@@ -191,6 +197,7 @@ class Pseudop(Enum):
     POP_JUMP_IF_TRUE = auto()
     POSITION = auto()
     RAISE = auto()
+    RESET_CELLS = auto()
     RET_VAL = auto()
     ROT_THREE = auto()
     ROT_TWO = auto()
@@ -487,7 +494,8 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
     def __init__(self, parent=None, name=None, args=(), kwonly=0,
                  varargs=False, varkeywords=False,
                  filename=None, declared_at=None,
-                 tco_enabled=True, mode=Mode.EXPRESSION):
+                 tco_enabled=True, mode=Mode.EXPRESSION,
+                 peephole=True):
 
         self.parent = parent
         self.name = name
@@ -533,6 +541,9 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         # declare_const method
         self.consts = [None]
 
+        # the index of each value in consts, by its _const_key
+        self.const_indexes = {_const_key(None): 0}
+
         self.blocks = [CodeBlock(Block.BASE, 0, 0)]
 
         if parent:
@@ -552,6 +563,11 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         # ops
         self.compress_ext_arg = True
 
+        # the peephole optimization passes to apply to the pseudops
+        # before generating opcodes. True for the default passes, or
+        # False to disable optimization. Children inherit this.
+        self.peephole = peephole
+
 
     def __del__(self):
         del self.parent
@@ -566,6 +582,7 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
             self.blocks[0].clear()
         self.blocks = [CodeBlock(Block.BASE, 0, 0)]
         self.consts = [None]
+        self.const_indexes = {_const_key(None): 0}
 
         self.coroutine = False
         self.generator = False
@@ -584,6 +601,73 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         return base.gen_pseudops()
 
 
+    def fuse(self, other):
+        """
+        Takes the pseudops of the module-level code space other, which
+        must end by returning the value of its only expression, and
+        appends them to our own in place of that return. Afterwards,
+        other is left empty. This allows a series of expressions
+        compiled one at a time to be completed into a single code
+        object which evaluates each of them in turn.
+
+        Returns False without modifying either code space if other
+        could not be fused, eg. if it returns from some other point,
+        or has local variables.
+        """
+
+        base = other.blocks[0]
+        pseudops = base.pseudops
+
+        if other.fast_vars or other.free_vars or other.cell_vars or \
+           other.generator or other.coroutine or \
+           not (pseudops and pseudops[-1][0] is Pseudop.RET_VAL):
+            return False
+
+        returns = sum(1 for op, *_args in other.gen_pseudops()
+                      if op is Pseudop.RET_VAL)
+        if returns != 1:
+            return False
+
+        other.blocks = [CodeBlock(Block.BASE, 0, 0)]
+
+        pseudops[-1] = (Pseudop.POP,)
+        base.block_type = Block.BEGIN
+
+        block = self.blocks[-1]
+        block.children.append(base)
+        block.pseudops.append((Pseudop.BLOCK, base))
+
+        for value in other.consts:
+            self.declare_const(value)
+
+        for namesym in other.global_vars:
+            self.request_global(namesym)
+
+        for namesym in other.names:
+            self.request_name(namesym)
+
+        return True
+
+
+    def gen_optimized_pseudops(self):
+        """
+        The pseudops of this code space, after the peephole passes have
+        been applied to them
+        """
+
+        pseudops = self.gen_pseudops()
+
+        passes = self.peephole
+        if passes:
+            from .peephole import DEFAULT_PASSES, optimize
+
+            if passes is True:
+                passes = DEFAULT_PASSES
+            pseudops = optimize(pseudops, passes)
+
+        return pseudops
+
+
     def _push_block(self, block_type, init_stack=0, leftovers=0):
         # self.require_active()
         assert self.blocks, "no code blocks in stack"
@@ -777,6 +861,8 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
             elif isinstance(consts[0], str):
                 self.consts[0] = docstr
 
+        self._index_consts()
+
 
     def child(self, name=None, declared_at=None, **addtl):
         """
@@ -793,6 +879,7 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         addtl["declared_at"] = declared_at
 
         addtl.setdefault("filename", self.filename)
+        addtl.setdefault("peephole", self.peephole)
 
         return type(self)(parent=self, **addtl)
 
@@ -803,7 +890,41 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         """
 
         assert (type(value) in _CONST_TYPES), "invalid const type %r" % value
-        _list_unique_append(self.consts, value)
+
+        key = _const_key(value)
+        if key not in self.const_indexes:
+            self.const_indexes[key] = len(self.consts)
+            self.consts.append(value)
+
+
+    def const_index(self, value):
+        """
+        The index of value in the const pool, or -1 if it has not been
+        declared
+        """
+
+        return self.const_indexes.get(_const_key(value), -1)
+
+
+    def truncate_consts(self, count):
+        """
+        Discards all but the first count values from the const pool
+        """
+
+        indexes = self.const_indexes
+        for value in self.consts[count:]:
+            key = _const_key(value)
+            if indexes.get(key, 0) >= count:
+                del indexes[key]
+
+        del self.consts[count:]
+
+
+    def _index_consts(self):
+        indexes = {}
+        for index, value in enumerate(self.consts):
+            indexes.setdefault(_const_key(value), index)
+        self.const_indexes = indexes
 
 
     def declare_var(self, namesym: Symbol):
@@ -1080,6 +1201,19 @@ class PseudopsCompiler(metaclass=ABCPseudopsTarget):
         return self.pseudop(Pseudop.GET_AWAITABLE)
 
 
+    def pseudop_reset_cells(self, namesym: Symbol):
+        """
+        Pushes a pseudo op to replace the cells of the current frame
+        with new, empty ones, by calling the global function named
+        namesym. The call is only generated, and the global only
+        requested, if this code space turns out to have any cell vars
+        once it is complete.
+        """
+
+        # assert is_symbol(namesym)
+        return self.pseudop(Pseudop.RESET_CELLS, namesym)
+
+
     def pseudop_get_global(self, namesym: Symbol):
         # assert is_symbol(namesym)
         self.request_global(namesym)
@@ -1435,5 +1569,23 @@ def _list_unique_append(onto_list, value):
     return index
 
 
+def _const_key(value):
+    # constants are matched by type as well as by value, so that eg.
+    # 1 and True, 2 and 2.0, or 0.0 and -0.0 (which are all equal to
+    # one another) don't get collapsed into a single const pool entry
+
+    vtype = type(value)
+    if vtype is tuple:
+        return (vtype, tuple(map(_const_key, value)))
+    elif vtype is float or vtype is complex:
+        return (vtype, repr(value))
+    elif vtype is list or vtype is dict or vtype is set:
+        # mutable values are only ever the same as themselves. They
+        # are kept alive by the const pool, so their id is stable.
+        return (vtype, id(value))
+    else:
+        return (vtype, value)
+
+
 #
 # The end.
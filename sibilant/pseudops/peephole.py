@@ -0,0 +1,423 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+sibilant.pseudops.peephole
+
+Peephole optimization passes over a flat sequence of pseudops. Each
+pass is a function accepting a list of pseudop tuples and returning a
+new list with the same behavior. The passes run after the stack has
+been counted and before opcodes are generated.
+
+The passes defined here share a single incremental implementation, so
+that optimize can apply them together in one scan over the pseudops.
+
+author: Christopher O'Brien <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+from . import Pseudop
+
+
+__all__ = (
+    "DEFAULT_PASSES", "optimize",
+    "remove_unused_labels", "remove_dead_code", "remove_noop_pairs",
+    "fold_const_branches", "thread_jumps",
+)
+
+
+_P = Pseudop
+
+
+# these groupings are tuples rather than sets, as checking for a
+# Pseudop in a short tuple is faster than hashing it
+
+# pseudops which generate no opcodes at all
+_NO_CODE = (
+    _P.LABEL, _P.POSITION, _P.DEBUG_STACK, _P.FAUX_PUSH, _P.FAUX_POP,
+)
+
+# pseudops whose first argument is a label
+_LABEL_OPS = (
+    _P.JUMP, _P.JUMP_FORWARD,
+    _P.JUMP_IF_FALSE_OR_POP, _P.JUMP_IF_TRUE_OR_POP,
+    _P.POP_JUMP_IF_FALSE, _P.POP_JUMP_IF_TRUE,
+    _P.SETUP_LOOP, _P.SETUP_WITH, _P.SETUP_EXCEPT, _P.SETUP_FINALLY,
+    _P.CONTINUE_LOOP, _P.FOR_ITER,
+)
+
+# pseudops after which execution never continues to the next op
+_NO_FALLTHROUGH = (
+    _P.JUMP, _P.JUMP_FORWARD, _P.RET_VAL, _P.RAISE,
+    _P.BREAK_LOOP, _P.CONTINUE_LOOP,
+)
+
+# pseudops which jump to their label, rather than registering it
+_JUMPS = (
+    _P.JUMP, _P.JUMP_FORWARD,
+    _P.JUMP_IF_FALSE_OR_POP, _P.JUMP_IF_TRUE_OR_POP,
+    _P.POP_JUMP_IF_FALSE, _P.POP_JUMP_IF_TRUE,
+)
+
+_CONDITIONAL = (
+    _P.JUMP_IF_FALSE_OR_POP, _P.JUMP_IF_TRUE_OR_POP,
+    _P.POP_JUMP_IF_FALSE, _P.POP_JUMP_IF_TRUE,
+)
+
+_POP_JUMPS = (_P.POP_JUMP_IF_FALSE, _P.POP_JUMP_IF_TRUE)
+
+_IF_TRUE = (_P.POP_JUMP_IF_TRUE, _P.JUMP_IF_TRUE_OR_POP)
+
+_UNCONDITIONAL = (_P.JUMP, _P.JUMP_FORWARD)
+
+# pseudops which any of the passes might alter
+_EXAMINED = _JUMPS + (_P.LABEL, _P.POP)
+
+_STORES = (_P.SET_LOCAL, _P.SET_VAR, _P.SET_GLOBAL)
+
+
+def optimize(pseudops, passes):
+    """
+    Applies the passes to pseudops, and returns the resulting list of
+    pseudops. The passes from this module are applied together, until
+    none of them can make any further change. Any other pass is
+    applied once, in turn.
+    """
+
+    pseudops = list(pseudops)
+    rules = []
+
+    for opt in passes:
+        if opt in _RULES:
+            rules.append(opt)
+            continue
+
+        if rules:
+            pseudops = _optimize(pseudops, rules)
+            rules = []
+        pseudops = opt(pseudops)
+
+    if rules:
+        pseudops = _optimize(pseudops, rules)
+
+    return pseudops
+
+
+def remove_unused_labels(pseudops):
+    """
+    Labels which no pseudop refers to are removed, so that they don't
+    prevent other passes from seeing adjacent operations.
+    """
+
+    return _optimize(pseudops, (remove_unused_labels,))
+
+
+def remove_dead_code(pseudops):
+    """
+    Operations following an unconditional jump, return, or raise
+    cannot be reached unless there is a label between. These are
+    removed.
+    """
+
+    return _optimize(pseudops, (remove_dead_code,))
+
+
+def remove_noop_pairs(pseudops):
+    """
+    Removes operations which are undone immediately afterwards. A
+    CONST or DUP followed by a POP is removed entirely, and a DUP
+    followed by a store and then a POP leaves only the store.
+    """
+
+    return _optimize(pseudops, (remove_noop_pairs,))
+
+
+def fold_const_branches(pseudops):
+    """
+    Conditional jumps on a constant value are replaced with either an
+    unconditional jump or nothing at all, as appropriate.
+    """
+
+    return _optimize(pseudops, (fold_const_branches,))
+
+
+def thread_jumps(pseudops):
+    """
+    Jumps to a label which is immediately followed by an unconditional
+    jump are redirected to that jump's destination. An unconditional
+    jump to a return is replaced by the return itself, and a jump to
+    a label which immediately follows it is removed.
+    """
+
+    return _optimize(pseudops, (thread_jumps,))
+
+
+def _optimize(pseudops, rules):
+    # applies rules, which are passes from this module, to pseudops
+    # together. Rather than repeating whole passes until nothing
+    # changes, each pseudop is examined once in order, and a change
+    # causes only those pseudops which it may affect to be examined
+    # again.
+
+    ops = list(pseudops)
+    count = len(ops)
+
+    unused_labels = remove_unused_labels in rules
+    dead_code = remove_dead_code in rules
+    noop_pairs = remove_noop_pairs in rules
+    const_branches = fold_const_branches in rules
+    threading = thread_jumps in rules
+
+    # the pseudops are linked together by their original indexes, so
+    # that they may be removed cheaply while their order can still be
+    # compared. A removed pseudop becomes None.
+    nxt = list(range(1, count + 1))
+    prv = list(range(-1, count - 1))
+
+    # label to the index of its LABEL, label to the number of pseudops
+    # referring to it, and label to the indexes of jumps to it
+    labels = {}
+    refs = {}
+    users = {}
+
+    for index, op_args in enumerate(ops):
+        op = op_args[0]
+        if op is _P.LABEL:
+            labels[op_args[1]] = index
+        elif op in _LABEL_OPS:
+            label = op_args[1]
+            refs[label] = refs.get(label, 0) + 1
+            if op in _JUMPS:
+                users.setdefault(label, set()).add(index)
+
+    # pseudops which have already been examined once, but which must
+    # be examined again
+    current = 0
+    pending = []
+
+    def recheck(index):
+        if index <= current:
+            pending.append(index)
+
+    def last_code(index):
+        # the index of the last pseudop before index which generates
+        # code, provided no label occurs after it. Otherwise None.
+        index = prv[index]
+        while index >= 0:
+            op = ops[index][0]
+            if op is _P.LABEL:
+                return None
+            elif op not in _NO_CODE:
+                return index
+            index = prv[index]
+        return None
+
+    def next_code(index):
+        # the index of the first pseudop at or after index which
+        # generates code, or None if there are no more
+        while index < count:
+            if ops[index][0] not in _NO_CODE:
+                return index
+            index = nxt[index]
+        return None
+
+    def touched(index):
+        # the code at index is changing. Jumps to the labels just
+        # before it may need threading differently, and a jump just
+        # before it may become a jump to the next code.
+        index = prv[index]
+        while index >= 0:
+            op_args = ops[index]
+            op = op_args[0]
+            if op is _P.LABEL:
+                for user in users.get(op_args[1], ()):
+                    recheck(user)
+            elif op not in _NO_CODE:
+                if op in _UNCONDITIONAL:
+                    recheck(index)
+                break
+            index = prv[index]
+
+    def ref(index, op_args):
+        if op_args[0] in _LABEL_OPS:
+            label = op_args[1]
+            refs[label] = refs.get(label, 0) + 1
+            if op_args[0] in _JUMPS:
+                users.setdefault(label, set()).add(index)
+
+    def unref(index, op_args):
+        if op_args[0] in _LABEL_OPS:
+            label = op_args[1]
+            refs[label] -= 1
+            if label in users:
+                users[label].discard(index)
+            if not refs[label] and label in labels:
+                # the label may now be unused
+                recheck(labels[label])
+
+    def remove(index):
+        op_args = ops[index]
+
+        if op_args[0] is _P.LABEL:
+            del labels[op_args[1]]
+        else:
+            unref(index, op_args)
+            if threading and op_args[0] not in _NO_CODE:
+                touched(index)
+
+        before, after = prv[index], nxt[index]
+        if before >= 0:
+            nxt[before] = after
+        if after < count:
+            prv[after] = before
+            recheck(after)
+
+        ops[index] = None
+
+    def replace(index, op_args):
+        unref(index, ops[index])
+        ref(index, op_args)
+
+        if threading:
+            touched(index)
+
+        ops[index] = op_args
+        recheck(index)
+        if nxt[index] < count:
+            recheck(nxt[index])
+
+    def examine(index):
+        op_args = ops[index]
+        op = op_args[0]
+
+        if op is _P.LABEL:
+            if unused_labels and not refs.get(op_args[1]):
+                remove(index)
+            return
+
+        if dead_code:
+            before = prv[index]
+            if before >= 0 and ops[before][0] in _NO_FALLTHROUGH:
+                remove(index)
+                return
+
+        if op is _P.POP:
+            prev = last_code(index) if noop_pairs else None
+
+            if prev is not None:
+                prev_op = ops[prev][0]
+
+                if prev_op is _P.CONST or prev_op is _P.DUP:
+                    remove(prev)
+                    remove(index)
+
+                elif prev_op in _STORES:
+                    dup = last_code(prev)
+                    if dup is not None and ops[dup][0] is _P.DUP:
+                        remove(dup)
+                        remove(index)
+
+        elif op in _CONDITIONAL and const_branches:
+            prev = last_code(index)
+
+            if prev is not None and ops[prev][0] is _P.CONST:
+                jumps = bool(ops[prev][1]) is (op in _IF_TRUE)
+
+                if op in _POP_JUMPS or not jumps:
+                    # the const is consumed either way
+                    remove(prev)
+
+                if jumps:
+                    replace(index, (_P.JUMP, op_args[1]))
+                else:
+                    remove(index)
+
+            elif threading:
+                thread(index, op_args)
+
+        elif op in _JUMPS and threading:
+            thread(index, op_args)
+
+    def thread(index, op_args):
+        op, dest = op_args[:2]
+
+        # jumps to the implicit label at the start of the code (as
+        # used for tail recursion) are left alone
+        if dest not in labels:
+            return
+
+        seen = set()
+        while dest in labels and dest not in seen:
+            seen.add(dest)
+            target = next_code(labels[dest])
+            if target is None or ops[target][0] not in _UNCONDITIONAL:
+                break
+            dest = ops[target][1]
+
+        if op in _UNCONDITIONAL and dest in labels:
+            target = next_code(labels[dest])
+
+            if target is not None and ops[target][0] is _P.RET_VAL:
+                replace(index, ops[target])
+                return
+
+            if labels[dest] > index and next_code(nxt[index]) == target:
+                # jumping to where we'd be anyway
+                remove(index)
+                return
+
+        if op is _P.JUMP_FORWARD and labels.get(dest, 0) < index:
+            # relative jumps can only go forward
+            op = _P.JUMP
+
+        if dest != op_args[1] or op is not op_args[0]:
+            replace(index, (op, dest))
+
+    while current < count:
+        # only a pseudop which one of the rules might apply to needs
+        # examining at all
+        before = prv[current]
+        if ops[current][0] in _EXAMINED or \
+           (before >= 0 and ops[before][0] in _NO_FALLTHROUGH):
+
+            examine(current)
+
+            while pending:
+                index = pending.pop()
+                if ops[index] is not None:
+                    examine(index)
+
+        # a removed pseudop still leads to the one which followed it
+        current = nxt[current]
+        while current < count and ops[current] is None:
+            current = nxt[current]
+
+    return [op_args for op_args in ops if op_args is not None]
+
+
+DEFAULT_PASSES = (
+    remove_unused_labels,
+    remove_dead_code,
+    remove_noop_pairs,
+    fold_const_branches,
+    thread_jumps,
+)
+
+_RULES = frozenset(DEFAULT_PASSES)
+
+
+#
+# The end.
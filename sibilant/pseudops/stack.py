@@ -233,6 +233,13 @@ class StackCounter(metaclass=MetaStackCounter):
         push(Opcode.POP_BLOCK.stack_effect())
 
 
+    @stacker(Pseudop.RESET_CELLS)
+    def stacker_reset_cells(self, pseudop, args, push, pop):
+        if self.compiler.cell_vars:
+            push()  # function, then its result
+            pop()
+
+
     @stacker(Pseudop.LABEL)
     def stacker_label(self, pseudop, args, push, pop):
         stac = self.stack_count
@@ -213,7 +213,7 @@ class PseudopsCPython35(PseudopsCompiler):
         _p_pos = Pseudop.POSITION
         _p_lab = Pseudop.LABEL
 
-        for op, *args in self.gen_pseudops():
+        for op, *args in self.gen_optimized_pseudops():
             if op is _p_pos:
                 declare_position(*args)
 
@@ -307,8 +307,8 @@ class PseudopsCPython35(PseudopsCompiler):
 
         code, default_count, kwonly_count = args
 
-        ci = self.consts.index(code)
-        ni = self.consts.index(code.co_name)
+        ci = _const_index(self, code)
+        ni = _const_index(self, code.co_name)
 
         _Opcode = Opcode
 
@@ -342,7 +342,7 @@ class PseudopsCPython35(PseudopsCompiler):
 
     @translator(Pseudop.CONST)
     def translate_load_const(self, pseudop, args):
-        i = _const_index(self.consts, args[0])
+        i = _const_index(self, args[0])
         yield Opcode.LOAD_CONST, i, 0
 
 
@@ -442,6 +442,16 @@ class PseudopsCPython35(PseudopsCompiler):
             assert False, "missing global name %r" % n
 
 
+    @translator(Pseudop.RESET_CELLS)
+    def translate_reset_cells(self, pseudop, args):
+        if self.cell_vars:
+            self.request_global(args[0])
+            i = self.names.index(args[0])
+            yield Opcode.LOAD_GLOBAL, i, 0
+            yield Opcode.CALL_FUNCTION, 0, 0
+            yield (Opcode.POP_TOP, )
+
+
     @translator(Pseudop.SET_GLOBAL)
     def translate_set_global(self, pseudop, args):
         n = args[0]
@@ -541,22 +551,10 @@ class PseudopsCPython35(PseudopsCompiler):
         return StackCounterCPython35(self, start_size)
 
 
-def _const_index(of_list, value):
-    # have to use an `is` comparator, because the list.index method
-    # will consider False and 0, and True and 1 to be equivalent,
-    # breaking any constant pools containing those values.
-
-    if value in [0, 1]:
-        for index, found in enumerate(of_list):
-            if found is value:
-                return index
-        else:
-            assert False, "missing constant pool index for value %r" % value
-
-    try:
-        return of_list.index(value)
-    except ValueError:
-        assert False, "missing constant pool index for value %r" % value
+def _const_index(compiler, value):
+    index = compiler.const_index(value)
+    assert (index >= 0), "missing constant pool index for value %r" % value
+    return index
 
 
 class StackCounterCPython35(StackCounter):
@@ -23,7 +23,12 @@ license: LGPL v.3
 """
 
 
-from sibilant.pseudops import PseudopsCompiler, Pseudop, Opcode, translator
+from itertools import chain
+
+from sibilant.pseudops import (
+    PseudopsCompiler, Pseudop, Opcode,
+    translator,
+)
 from sibilant.pseudops.stack import StackCounter, stacker
 from sibilant.lib import symbol
 
@@ -47,6 +52,25 @@ def direct(opcode, hardarg=None):
 _P = Pseudop
 _O = Opcode
 
+_EXTENDED_ARG = Opcode.EXTENDED_ARG.value
+
+# looked up once here, as fetching the value of an Opcode is slow
+# compared to checking for it in a tuple or a dict
+_JABS = tuple(op for op in Opcode if op.hasjabs())
+_JREL = tuple(op for op in Opcode if op.hasjrel())
+_OPCODE_VALUES = {op: op.value for op in Opcode}
+
+
+def _arg_size(arg):
+    # the number of bytes needed for an instruction with the given
+    # argument, including any EXTENDED_ARG prefixes
+    size = 2
+    arg >>= 8
+    while arg > 0:
+        size += 2
+        arg >>= 8
+    return size
+
 
 class PseudopsCPython36(PseudopsCompiler):
     """
@@ -134,67 +158,54 @@ class PseudopsCPython36(PseudopsCompiler):
 
 
     def code_bytes(self, lnt):
-        offset = 0
         coll = []
+        positions = []
 
         labels = {0: 0}
 
         def add_label(name):
-            labels[name] = offset
+            labels[name] = len(coll)
 
         jabs = []
-
-        def mark_jabs(label_name):
-            jabs.append((len(coll), label_name))
-
         jrel = []
 
-        def mark_jrel(label_name):
-            jrel.append((len(coll), label_name, offset))
-
         def set_position(line, col):
-            lnt.append((offset, line, col))
+            positions.append((len(coll), line, col))
 
         for opa in self.gen_opcode(add_label, set_position):
             op, arg = opa
 
-            if op.hasjabs():
+            if op in _JABS:
                 # deal with jumps, so we can set their argument
                 # to an appropriate label offset later
-
-                mark_jabs(arg)
-                # we are being lazy here, and padding out our
-                # jumps with an EXTENDED_ARG, in case we need more
-                # than 8 bits of address once labels are applied.
-                coll.append([Opcode.EXTENDED_ARG, 0])
+                jabs.append((len(coll), arg))
                 coll.append([op, 0])
-                offset += 4
 
-            elif op.hasjrel():
+            elif op in _JREL:
                 # relative jump!
-
-                mark_jrel(arg)
-                coll.append([Opcode.EXTENDED_ARG, 0])
+                jrel.append((len(coll), arg))
                 coll.append([op, 0])
-                offset += 4
 
             else:
-                if arg > 0xff:
-                    coll.append([Opcode.EXTENDED_ARG, arg >> 8])
-                    coll.append([op, arg & 0xff])
-                    offset += 4
-                else:
-                    coll.append(opa)
-                    offset += 2
+                coll.append(opa)
 
-        if jabs or jrel or labels:
-            # Given our labels, modify jmp calls to point to the label
-            self.apply_jump_labels(coll, jabs, jrel, labels)
+        # Given our labels, modify jmp calls to point to the label,
+        # and find out where each instruction ended up
+        offsets = self.apply_jump_labels(coll, jabs, jrel, labels)
+
+        for index, line, col in positions:
+            lnt.append((offsets[index], line, col))
+
+        values = _OPCODE_VALUES
 
         result = []
-        for c, a in coll:
-            result.append(c.value)
-            result.append(a)
+        for index, (c, a) in enumerate(coll):
+            size = offsets[index + 1] - offsets[index]
+            for shift in range(size * 4 - 8, 0, -8):
+                result.append(_EXTENDED_ARG)
+                result.append((a >> shift) & 0xff)
+            result.append(values[c])
+            result.append(a & 0xff)
 
         return bytes(result)
 
@@ -209,7 +220,7 @@ class PseudopsCPython36(PseudopsCompiler):
         _p_pos = Pseudop.POSITION
         _p_lab = Pseudop.LABEL
 
-        for op, *args in self.gen_pseudops():
+        for op, *args in self.gen_optimized_pseudops():
             if op is _p_pos:
                 declare_position(*args)
 
@@ -222,24 +233,43 @@ class PseudopsCPython36(PseudopsCompiler):
 
 
     def apply_jump_labels(self, coll, jabs, jrel, labels):
-        for coll_offset, name in jabs:
-            target = labels[name]
+        """
+        Sets the argument of each jump in coll to the offset of its
+        label, which is given as an index into coll. Returns the
+        offset of each instruction (plus one for the end of the code)
+        once any EXTENDED_ARG prefixes are accounted for.
+
+        Every jump starts out assuming it needs no EXTENDED_ARG, and
+        is only widened once its argument no longer fits. Widening a
+        jump moves the instructions after it, so this repeats until
+        every jump fits. Jumps only ever grow, so it must settle.
+        """
+
+        sizes = [_arg_size(arg) for _op, arg in coll]
 
-            coll_ext = coll[coll_offset]
-            coll_jmp = coll[coll_offset + 1]
+        while True:
+            offsets = [0]
+            offset = 0
+            for size in sizes:
+                offset += size
+                offsets.append(offset)
 
-            coll_ext[1] = (target >> 8) & 0xff
-            coll_jmp[1] = target & 0xff
+            for coll_offset, name in jabs:
+                coll[coll_offset][1] = offsets[labels[name]]
 
-        for coll_offset, name, off in jrel:
-            target = labels[name]
-            target -= (off + 4)
+            for coll_offset, name in jrel:
+                target = offsets[labels[name]]
+                coll[coll_offset][1] = target - offsets[coll_offset + 1]
 
-            coll_ext = coll[coll_offset]
-            coll_jmp = coll[coll_offset + 1]
+            grew = False
+            for coll_offset, _name in chain(jabs, jrel):
+                size = _arg_size(coll[coll_offset][1])
+                if size > sizes[coll_offset]:
+                    sizes[coll_offset] = size
+                    grew = True
 
-            coll_ext[1] = (target >> 8) & 0xff
-            coll_jmp[1] = target & 0xff
+            if not grew:
+                return offsets
 
 
     def lnt_compile(self, lnt, firstline=None):
@@ -334,8 +364,8 @@ class PseudopsCPython36(PseudopsCompiler):
         # as per pseudop_lambda, the args will be a triplet
         code, default_count, kwonly_count = args
 
-        ci = self.consts.index(code)
-        ni = self.consts.index(code.co_name)
+        ci = _const_index(self, code)
+        ni = _const_index(self, code.co_name)
 
         _Opcode = Opcode
 
@@ -381,7 +411,7 @@ class PseudopsCPython36(PseudopsCompiler):
 
     @translator(Pseudop.CONST)
     def translator_const(self, pseudop, args):
-        i = _const_index(self.consts, args[0])
+        i = _const_index(self, args[0])
         yield Opcode.LOAD_CONST, i
 
 
@@ -481,6 +511,16 @@ class PseudopsCPython36(PseudopsCompiler):
             assert False, "missing global name %r" % n
 
 
+    @translator(Pseudop.RESET_CELLS)
+    def translator_reset_cells(self, pseudop, args):
+        if self.cell_vars:
+            self.request_global(args[0])
+            i = self.names.index(args[0])
+            yield Opcode.LOAD_GLOBAL, i
+            yield Opcode.CALL_FUNCTION, 0
+            yield Opcode.POP_TOP, 0
+
+
     @translator(Pseudop.SET_GLOBAL)
     def translator_set_global(self, pseudop, args):
         n = args[0]
@@ -540,28 +580,10 @@ class PseudopsCPython36(PseudopsCompiler):
         return StackCounterCPython36(self, start_size)
 
 
-def _const_index(of_list, value):
-    # have to use an `is` comparator, because the list.index method
-    # will consider False and 0, and True and 1 to be equivalent,
-    # breaking any constant pools containing those values.
-
-    index = -1
-
-    if value in [0, 1]:
-        for index, found in enumerate(of_list):
-            if found is value:
-                return index
-    else:
-        try:
-            index = of_list.index(value)
-        except ValueError:
-            pass
-        else:
-            return index
-
-    if index == -1:
-        print("missing const pool", list(map(repr, of_list)))
-        assert False, "missing constant pool index for value %r" % value
+def _const_index(compiler, value):
+    index = compiler.const_index(value)
+    assert (index >= 0), "missing constant pool index for value %r" % value
+    return index
 
 
 class StackCounterCPython36(StackCounter):
@@ -573,6 +595,12 @@ class StackCounterCPython36(StackCounter):
         push()            # result
 
 
+    @stacker(Pseudop.CALL_KW)
+    def stacker_call_kw(self, pseudop, args, push, pop):
+        pop(args[0] + 2)  # arguments, keyword names, function
+        push()            # result
+
+
     @stacker(Pseudop.CALL_VAR)
     def stacker_call_var(self, pseudop, args, push, pop):
         pop(2)  # args, function
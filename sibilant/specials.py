@@ -32,7 +32,12 @@ from .lib import (
     trampoline, tailcall,
 )
 
-from .compiler import Special, gather_formals, gather_parameters, Mode
+from .compiler import (
+    Special, InlineScopeEscape, InlineLoop,
+    gather_formals, gather_parameters, Mode,
+)
+
+from .operators import fold_constant
 
 from textwrap import dedent
 
@@ -52,6 +57,7 @@ _symbol_cond = symbol("cond")
 _symbol_cons = symbol("cons")
 _symbol_continue = symbol("continue")
 _symbol_declare_async = symbol("declare-async")
+_symbol_defconst = symbol("defconst")
 _symbol_define = symbol("define")
 _symbol_define_global = symbol("define-global")
 _symbol_define_values = symbol("define-values")
@@ -155,9 +161,14 @@ def _helper_keyword(code, kwd):
     Pushes the pseudo ops necessary to put a keyword on the stack
     """
 
-    code.pseudop_get_global(_symbol_keyword)
-    code.pseudop_const(str(kwd))
-    code.pseudop_call(1)
+    name = str(kwd)
+
+    def build(code):
+        code.pseudop_get_global(_symbol_keyword)
+        code.pseudop_const(name)
+        code.pseudop_call(1)
+
+    code.pseudop_get_hoisted((_symbol_keyword, name), build)
     return None
 
 
@@ -166,9 +177,14 @@ def _helper_symbol(code, sym):
     Pushes the pseudo ops necessary to put a symbol on the stack
     """
 
-    code.pseudop_get_global(_symbol_symbol)
-    code.pseudop_const(str(sym))
-    code.pseudop_call(1)
+    name = str(sym)
+
+    def build(code):
+        code.pseudop_get_global(_symbol_symbol)
+        code.pseudop_const(name)
+        code.pseudop_call(1)
+
+    code.pseudop_get_hoisted((_symbol_symbol, name), build)
     return None
 
 
@@ -311,6 +327,10 @@ def special_quote(code, source, tc=False):
 
     'FORM
     Same as (quote FORM)
+
+    Within a module, quoted symbols and keywords are created once,
+    when the module runs, and kept in globals named _hoisted#N.
+    Quoted lists are created every time the quote is evaluated.
     """
 
     called_by, body = source
@@ -341,6 +361,8 @@ def _helper_quote(code, body, tc=False):
         return _helper_symbol(code, body)
 
     elif is_pair(body):
+        # pairs are mutable, so unlike the symbols and keywords within
+        # it, the structure is built anew every time
         if is_proper(body):
             code.pseudop_get_var(_symbol_build_proper)
         else:
@@ -358,6 +380,36 @@ def _helper_quote(code, body, tc=False):
         return None
 
 
+def _helper_quasi_constant(marked):
+    """
+    True if marked contains no unquote, unquote-splicing, or nested
+    quasiquote, and so would evaluate the same as if it were quoted
+    """
+
+    if marked is nil:
+        return True
+
+    elif is_pair(marked):
+        for p_expr in marked.follow():
+            if p_expr is nil:
+                break
+
+            elif is_pair(p_expr):
+                expr, _tail = p_expr
+                if not _helper_quasi_constant(expr):
+                    return False
+
+            elif not _helper_quasi_constant(p_expr):
+                return False
+
+        return True
+
+    else:
+        return not (marked is _symbol_unquote or
+                    marked is _symbol_splice or
+                    marked is _symbol_quasiquote)
+
+
 @special(_symbol_quasiquote)
 def special_quasiquote(code, source, tc=False):
     """
@@ -394,6 +446,9 @@ def _helper_quasiquote(code, marked, level=0):
         return tailcall(_helper_symbol)(code, marked)
 
     elif is_pair(marked):
+        if _helper_quasi_constant(marked):
+            return tailcall(_helper_quote)(code, marked)
+
         if is_proper(marked):
             head, tail = marked
 
@@ -594,7 +649,10 @@ def _helper_quasiquote_p(code, marked, level):
                         continue
 
             push_curr()
-            _helper_quasiquote_p(code, expr, level)
+            if _helper_quasi_constant(expr):
+                _helper_quote(code, expr)
+            else:
+                _helper_quasiquote_p(code, expr, level)
 
         else:
             push_curr()
@@ -805,15 +863,15 @@ def special_let(code, source, tc=False):
     else:
         named = None
 
-    args = []
+    names = []
     vals = []
     for arg in bindings.unpack():
         name, val = _helper_binding(code, arg)
-        args.append(name)
+        names.append(name)
         vals.append(val)
 
-    if args:
-        args = cons(*args, nil)
+    if names:
+        args = cons(*names, nil)
     else:
         args = nil
 
@@ -821,7 +879,13 @@ def special_let(code, source, tc=False):
     if declared_at:
         code.pseudop_position(*declared_at)
 
-    if named:
+    if named and _helper_inline_named_let(code, named, names,
+                                          vals, body, tc):
+        # the let was compiled in place as a loop, so its result is
+        # already at TOS
+        return None
+
+    elif named:
         # wrap a really short lambda around the let, in order to give
         # it a binding to itself by its name as a freevar
         kid = code.child_context(declared_at=declared_at)
@@ -845,6 +909,11 @@ def special_let(code, source, tc=False):
         code.pseudop_lambda(kid_code)
         code.pseudop_call(0)
 
+    elif _helper_inline_let(code, names, vals, body, tc):
+        # the bindings were stored in locals and the body compiled
+        # in place, so the result of the let is already at TOS
+        return None
+
     else:
         _helper_function(code, "<let>", args, body,
                          declared_at=declared_at)
@@ -852,6 +921,11 @@ def special_let(code, source, tc=False):
     # after both the named or unnamed variations, we now have the let
     # bound as a callable at TOS
 
+    while isinstance(tc, InlineLoop):
+        # this let is the tail of an inline loop's body, but it is
+        # not a call to that loop
+        tc = tc.tc
+
     pvals = cons(*vals, nil) if vals else nil
     code.complete_apply(pvals, declared_at, tc, lambda e, t: None)
 
@@ -859,6 +933,94 @@ def special_let(code, source, tc=False):
     return None
 
 
+def _helper_inline_let(code, names, vals, body, tc):
+    """
+    Attempts to compile an unnamed let directly into code, storing
+    its bindings in renamed locals rather than creating and calling a
+    nested function. If the body needs a function of its own (eg. a
+    closure captures one of the bindings, or it yields or returns),
+    code is rewound and False is returned.
+    """
+
+    if code.mode is Mode.MODULE:
+        # module-level code has no locals to rename into
+        return False
+
+    if any(name in names[:index] for index, name in enumerate(names)):
+        # duplicate names are left to the function to complain about
+        return False
+
+    mark = code.mark()
+
+    # the binding values are evaluated outside of the scope
+    for val in vals:
+        code.add_expression(val, False)
+
+    scope = None
+    try:
+        with code.inline_scope() as scope:
+            for name in reversed(names):
+                code.declare_var(name)
+                code.pseudop_set_var(name)
+
+            _helper_begin(code, body, tc)
+
+    except InlineScopeEscape as esc:
+        if esc.scope is not scope:
+            raise
+        code.rewind(mark)
+        return False
+
+    return True
+
+
+def _helper_inline_named_let(code, named, names, vals, body, tc):
+    """
+    Attempts to compile a named let directly into code as a loop. The
+    bindings are stored in renamed locals as with an unnamed let, and
+    each tailcall to the let by name in its body stores new values
+    into them and jumps back to the top. If the name is used in any
+    other way (eg. called from a non-tail position, or passed as a
+    value), code is rewound and False is returned.
+    """
+
+    if code.mode is Mode.MODULE or is_lazygensym(named):
+        return False
+
+    if named in names or \
+       any(name in names[:index] for index, name in enumerate(names)):
+        return False
+
+    mark = code.mark()
+
+    for val in vals:
+        code.add_expression(val, False)
+
+    scope = None
+    try:
+        with code.inline_scope() as scope:
+            for name in reversed(names):
+                code.declare_var(name)
+                code.pseudop_set_var(name)
+
+            scope.opaque.add(named)
+            bindings = [scope.local(name) for name in names]
+
+            top = code.gen_label()
+            code.pseudop_label(top)
+
+            loop = InlineLoop(named, scope, bindings, top, tc)
+            _helper_begin(code, body, loop)
+
+    except InlineScopeEscape as esc:
+        if esc.scope is not scope:
+            raise
+        code.rewind(mark)
+        return False
+
+    return True
+
+
 def _helper_function(code, name, args, body,
                      self_ref=None, declared_at=None):
 
@@ -897,6 +1059,8 @@ def _helper_function(code, name, args, body,
 
     kid = code.child_context(name=name,
                              self_ref=self_ref,
+                             defaults=defaults,
+                             kwdefaults=kwonly,
                              args=argnames,
                              kwonly=len(kwonly),
                              varargs=varargs,
@@ -1238,6 +1402,8 @@ def special_continue(code, source, tc=False):
     else:
         raise code.error("continue called without while", source)
 
+    code.require_function_scope(block)
+
     if is_nil(rest):
         value = None
 
@@ -1272,6 +1438,8 @@ def special_break(code, source, tc=False):
     else:
         raise code.error("break called without while", source)
 
+    code.require_function_scope(block)
+
     if is_nil(rest):
         value = None
 
@@ -1294,6 +1462,8 @@ def special_return(code, source, tc=False):
 
     called_by, rest = source
 
+    code.require_function_scope()
+
     if is_nil(rest):
         value = None
         code.pseudop_return_none()
@@ -1840,6 +2010,52 @@ def special_define_global(code, source, tc=False):
     return None
 
 
+@special(_symbol_defconst)
+def special_defconst(code, source, tc=False):
+    """
+    (defconst SYM EXPRESSION)
+
+    Defines a value in global context, as with define-global. If
+    EXPRESSION can be evaluated at compile time, SYM is also declared
+    to be a constant, and later references to SYM compiled within the
+    same module will use the value directly rather than looking up
+    the global. SYM should therefore never be reassigned. The
+    declaration is repeated when the module runs, so that it holds
+    even if the module was loaded from cached bytecode.
+    """
+
+    try:
+        called_by, (binding, (body, rest)) = source
+    except ValueError:
+        raise code.error("too few arguments to defconst", source)
+
+    if rest:
+        raise code.error("too many arguments to defconst", source)
+
+    if not is_symbol(binding):
+        raise code.error("defconst with non-symbol binding", source)
+
+    if code.parent is not None:
+        raise code.error("defconst is only allowed at the top level",
+                         source)
+
+    found, value = fold_constant(code, body)
+    if found:
+        code.define_constant(binding, value)
+        code.pseudop_define_constant(binding, value)
+        code.pseudop_const(value)
+    else:
+        code.add_expression(body, False)
+
+    code.pseudop_position_of(source)
+    code.pseudop_set_global(binding)
+
+    # defconst expression evaluates to None
+    code.pseudop_const(None)
+
+    return None
+
+
 @special(_symbol_define)
 def special_define(code, source, tc=False):
     """
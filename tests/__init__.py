@@ -57,6 +57,21 @@ def compile_expr_no_tco(src_str, **base):
     return result, mod.__dict__
 
 
+def compile_expr_no_peephole(src_str, **base):
+    mod = fake_module_from_env(base)
+
+    params = {"peephole": False}
+
+    init_module(mod, source_str(src_str, "<unittest>"),
+                compiler_factory_params=params)
+
+    partial_run_time = partial(partial, run_time)
+
+    result = load_module_1(mod, run_time=partial_run_time)
+
+    return result, mod.__dict__
+
+
 def compile_dis_expr(src_str, **base):
     mod = fake_module_from_env(base)
     init_module(mod, source_str(src_str, "<unittest>"))
@@ -0,0 +1,302 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+Benchmarks for sibilant. These aren't unittests, run them via
+
+  python -m tests.benchmark [compile FILENAME...]
+  python -m tests.benchmark load [FILENAME...]
+  python -m tests.benchmark pairs [LENGTH...]
+  python -m tests.benchmark tco [BOUNCES...]
+  python -m tests.benchmark import [MODULE...]
+
+author: Christopher O'Brien  <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+import sys
+
+from os.path import basename, dirname, join
+from time import perf_counter
+
+from sibilant.lib import cons, nil, setcdr, tailcall, trampoline
+from sibilant.module import (
+    new_module, init_module, load_module, parse_time, compile_time,
+)
+
+from sibilant.parse import source_open
+
+from . import compile_expr
+
+
+def load_forms(filename, builtins=None):
+    """
+    Loads the sibilant module source at filename, returning the new
+    module and a list of the top-level forms parsed from it.
+    """
+
+    forms = []
+
+    def parse_and_keep(module):
+        form = parse_time(module)
+        if form is not None:
+            forms.append(form)
+        return form
+
+    name = basename(filename).rsplit(".", 1)[0]
+    module = new_module("benchmark." + name)
+
+    with source_open(filename) as stream:
+        init_module(module, stream, builtins=builtins)
+        load_module(module, parse_time=parse_and_keep)
+
+    return module, forms
+
+
+def bench_compile(filename, builtins=None, repeat=10):
+    """
+    Compiles each of the top-level forms of the sibilant module at
+    filename, after it has been loaded once. Returns the fastest time
+    of repeat attempts, and the count of forms.
+    """
+
+    module, forms = load_forms(filename, builtins)
+
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        for form in forms:
+            compile_time(module, form)
+        elapsed = perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, len(forms)
+
+
+def bench_load(filename, builtins=None, repeat=10):
+    """
+    Loads the sibilant module source at filename, parsing, compiling,
+    and running each of its top-level forms. Returns the fastest time
+    of repeat attempts.
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        load_forms(filename, builtins)
+        elapsed = perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def source_jobs(filenames):
+    """
+    (filename, builtins) pairs for the compile and load benchmarks.
+    Without any filenames, sibilant.basics is used along with the
+    bootstrap builtins that it is normally built from.
+    """
+
+    if not filenames:
+        import sibilant.bootstrap as bootstrap
+
+        basics = join(dirname(dirname(__file__)), "sibilant", "basics.lspy")
+        return [(basics, bootstrap)]
+    else:
+        return [(filename, None) for filename in filenames]
+
+
+def main_compile(filenames):
+    for filename, builtins in source_jobs(filenames):
+        best, count = bench_compile(filename, builtins)
+        print("%s: %i forms in %.4fs, %.0f forms/s" %
+              (filename, count, best, count / best))
+
+
+def main_load(filenames):
+    for filename, builtins in source_jobs(filenames):
+        best = bench_load(filename, builtins)
+        print("%s: loaded from source in %.4fs" % (filename, best))
+
+
+def bench_call(fn, repeat=10, number=10):
+    """
+    Calls fn number times, repeat times over. Returns the fastest
+    average time for a single call.
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best / number
+
+
+def long_pairs(length, recursive=False):
+    """
+    A pair list of the given length, which loops back on itself half
+    way along if recursive is True.
+    """
+
+    items = cons(*range(length), nil)
+    if recursive:
+        links = list(items.follow())
+        setcdr(links[-2], links[length // 2])
+    return items
+
+
+def main_pairs(lengths):
+    lengths = [int(length) for length in lengths] or [10, 1000, 100000]
+
+    for length in lengths:
+        for recursive in (False, True):
+            items = long_pairs(length, recursive)
+            other = long_pairs(length, recursive)
+
+            tests = (
+                ("is_proper", items.is_proper),
+                ("is_recursive", items.is_recursive),
+                ("length", items.length),
+                ("unpack", lambda: tuple(items.unpack())),
+                ("==", lambda: items == other),
+            )
+
+            for name, fn in tests:
+                best = bench_call(fn)
+                print("%s pairs%s: %s in %.3fus" %
+                      (length, " (recursive)" if recursive else "",
+                       name, best * 1000000))
+
+
+TCO_SRC = """
+(begin
+  (defun even [num]
+    (if (== num 0) True (odd (- num 1))))
+  (defun odd [num]
+    (if (== num 0) False (even (- num 1))))
+  (defun ping [num total: 0]
+    (if (== num 0) total (pong (- num 1) total: (+ total 1))))
+  (defun pong [num total: 0]
+    (if (== num 0) total (ping (- num 1) total: (+ total 2))))
+  (values even ping))
+"""
+
+
+@trampoline
+def py_even(num):
+    return True if num == 0 else tailcall(py_odd)(num - 1)
+
+
+@trampoline
+def py_odd(num):
+    return False if num == 0 else tailcall(py_even)(num - 1)
+
+
+def main_tco(counts):
+    counts = [int(count) for count in counts] or [100000]
+
+    stmt, _env = compile_expr(TCO_SRC)
+    even, ping = stmt()
+
+    for count in counts:
+        tests = (
+            ("tailcall", lambda: py_even(count)),
+            ("tailcall-full", lambda: even(count)),
+            ("tailcall-full keywords", lambda: ping(count)),
+        )
+
+        for name, fn in tests:
+            best = bench_call(fn, number=1)
+            print("%s bounces: %s in %.4fs, %.0fns per bounce" %
+                  (count, name, best, best * 1000000000 / count))
+
+
+# a pure-Python import graph, which the sibilant importer has no
+# business finding anything in
+IMPORT_MODULES = (
+    "argparse", "asyncio", "csv", "email.mime.multipart", "http.server",
+    "json", "logging.handlers", "unittest", "urllib.request",
+    "xml.dom.minidom", "xmlrpc.client",
+)
+
+
+def main_import(names):
+    from importlib import import_module, invalidate_caches
+    from sibilant.importlib import SibilantPathFinder
+
+    names = names or IMPORT_MODULES
+
+    before = set(sys.modules)
+    for name in names:
+        import_module(name)
+
+    # every module the graph pulled in, with the path its parent
+    # package would have had the finder search
+    lookups = []
+    for name in sorted(set(sys.modules) - before):
+        parent = name.rpartition(".")[0]
+        path = getattr(sys.modules.get(parent), "__path__", None)
+        if parent and path is None:
+            continue
+        lookups.append((name, path))
+
+    def find_all():
+        for name, path in lookups:
+            assert SibilantPathFinder.find_spec(name, path) is None
+
+    invalidate_caches()
+    start = perf_counter()
+    find_all()
+    cold = perf_counter() - start
+
+    best = bench_call(find_all)
+
+    print("%i modules: importer finder overhead %.0fus cold,"
+          " %.2fus per import warm" %
+          (len(lookups), cold * 1000000, best * 1000000 / len(lookups)))
+
+
+BENCHMARKS = {
+    "compile": main_compile,
+    "load": main_load,
+    "pairs": main_pairs,
+    "tco": main_tco,
+    "import": main_import,
+}
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    which, args = (args[0], args[1:]) if args else ("compile", [])
+    BENCHMARKS[which](args)
+
+
+if __name__ == "__main__":
+    main()
+
+
+#
+# The end.
@@ -0,0 +1,259 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+unittest for sibilant.compileall
+
+author: Christopher O'Brien  <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+import sys
+
+from contextlib import redirect_stderr
+from importlib import import_module, invalidate_caches
+from importlib.util import cache_from_source
+from io import StringIO
+from os import makedirs, utime
+from os.path import dirname, exists, getmtime, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipIf, skipUnless
+
+import sibilant.bootstrap
+import sibilant.importlib
+
+from sibilant.compileall import (
+    cli_option_parser, compile_dir, compile_file, is_current, iter_sources,
+)
+from sibilant.module import HASH_PYC_SUPPORTED, PycInvalidationMode
+
+
+tree = {
+    "sibcompall/__init__.lspy": """
+(define tacos 5)
+""",
+    "sibcompall/beer.lspy": """
+(def import-from sibcompall tacos)
+(define beer (+ tacos 3))
+""",
+    "sibcompall/sub/wine.lspy": """
+(define wine 11)
+""",
+    "sibcompall/boot.lspy": """
+(define whiskey 7)
+""",
+    "sibcompall/not-a-pkg/ignored.lspy": """
+(raise (Exception "not a package"))
+""",
+}
+
+
+class CompileAllTest(TestCase):
+
+
+    def setUp(self):
+        sibilant.importlib.install()
+
+        self.tmpdir = mkdtemp()
+        self.path = list(sys.path)
+
+        for name, source in tree.items():
+            filename = join(self.tmpdir, name)
+            makedirs(dirname(filename), exist_ok=True)
+            with open(filename, "wt") as out:
+                out.write(source)
+
+
+    def tearDown(self):
+        sys.path[:] = self.path
+        for name in list(sys.modules):
+            if name.startswith("sibcompall"):
+                del sys.modules[name]
+        rmtree(self.tmpdir)
+
+
+    def cached(self, name):
+        return exists(cache_from_source(join(self.tmpdir, name)))
+
+
+    def test_iter_sources(self):
+        found = [name for name, _ in iter_sources(self.tmpdir)]
+        self.assertEqual(found, ["sibcompall", "sibcompall.beer",
+                                 "sibcompall.boot", "sibcompall.sub.wine"])
+
+        pkgdir = join(self.tmpdir, "sibcompall")
+        found = [name for name, _ in iter_sources(pkgdir, "sibcompall")]
+        self.assertEqual(len(found), 4)
+
+
+    def test_compile_dir(self):
+        pkgdir = join(self.tmpdir, "sibcompall")
+        compiled = compile_dir(pkgdir, "sibcompall",
+                               bootstrap=["sibcompall.boot"], workers=2)
+
+        self.assertEqual(len(compiled), 4)
+        self.assertEqual(sys.path, self.path)
+        self.assertTrue(self.cached("sibcompall/__init__.lspy"))
+        self.assertTrue(self.cached("sibcompall/sub/wine.lspy"))
+        self.assertFalse(self.cached("sibcompall/not-a-pkg/ignored.lspy"))
+
+        # everything is current, so nothing is rebuilt
+        self.assertEqual(compile_dir(pkgdir, "sibcompall"), [])
+
+        # only the touched module is stale
+        filename = join(pkgdir, "beer.lspy")
+        mtime = getmtime(filename) + 10
+        utime(filename, (mtime, mtime))
+        self.assertEqual(compile_dir(pkgdir, "sibcompall"),
+                         ["sibcompall.beer"])
+
+        # the importer picks up the precompiled modules, which never
+        # creates a compiler
+        sys.path.insert(0, self.tmpdir)
+        invalidate_caches()
+        beer = import_module("sibcompall.beer")
+        self.assertFalse(hasattr(beer, "__compiler__"))
+        self.assertEqual(beer.beer, 8)
+
+        boot = import_module("sibcompall.boot")
+        self.assertEqual(boot.whiskey, 7)
+        self.assertIs(boot.__builtins__, sibilant.bootstrap)
+
+
+    @skipUnless(HASH_PYC_SUPPORTED, "requires PEP 552")
+    def test_invalidation_mode(self):
+        pkgdir = join(self.tmpdir, "sibcompall")
+        filename = join(pkgdir, "sub", "wine.lspy")
+        cached = cache_from_source(filename)
+
+        timestamp = PycInvalidationMode.TIMESTAMP
+        checked = PycInvalidationMode.CHECKED_HASH
+
+        compile_dir(pkgdir, "sibcompall", invalidation_mode=checked)
+        self.assertTrue(is_current(filename, cached, checked))
+        self.assertFalse(is_current(filename, cached, timestamp))
+
+        # a change of mode rebuilds everything
+        self.assertEqual(len(compile_dir(pkgdir, "sibcompall",
+                                         invalidation_mode=timestamp)), 4)
+        self.assertTrue(is_current(filename, cached, timestamp))
+
+        # hash-based caches follow the contents rather than the mtime
+        compile_dir(pkgdir, "sibcompall", invalidation_mode=checked)
+        mtime = getmtime(filename) + 10
+        utime(filename, (mtime, mtime))
+        self.assertTrue(is_current(filename, cached, checked))
+
+        with open(filename, "at") as out:
+            out.write("(define beer 12)\n")
+        self.assertFalse(is_current(filename, cached, checked))
+
+
+    @skipIf(HASH_PYC_SUPPORTED, "PEP 552 is supported")
+    def test_hash_unsupported(self):
+        filename = join(self.tmpdir, "sibcompall", "sub", "wine.lspy")
+        unchecked = PycInvalidationMode.UNCHECKED_HASH
+
+        with self.assertRaises(ValueError):
+            compile_file("sibcompall.sub.wine", filename,
+                         invalidation_mode=unchecked)
+        self.assertFalse(self.cached("sibcompall/sub/wine.lspy"))
+
+        parser = cli_option_parser("compileall")
+        with self.assertRaises(SystemExit), redirect_stderr(StringIO()):
+            parser.parse_args(["--invalidation-mode", "unchecked-hash",
+                               self.tmpdir])
+
+
+class BuildPyTest(TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.path = list(sys.path)
+
+        pkgdir = join(self.tmpdir, "sibcompall")
+        makedirs(pkgdir)
+        for name in ("__init__.lspy", "beer.lspy"):
+            with open(join(pkgdir, name), "wt") as out:
+                out.write(tree["sibcompall/" + name])
+
+
+    def tearDown(self):
+        sys.path[:] = self.path
+        for name in list(sys.modules):
+            if name.startswith("sibcompall"):
+                del sys.modules[name]
+        rmtree(self.tmpdir)
+
+
+    def build_py(self):
+        from setuptools.dist import Distribution
+        from sibilant.site.setuptools import build_py
+
+        dist = Distribution({
+            "name": "sibcompall",
+            "packages": ["sibcompall"],
+            "package_dir": {"": self.tmpdir},
+            "package_data": {"sibcompall": ["*.lspy"]},
+            "cmdclass": {"build_py": build_py},
+        })
+        dist.script_name = "setup.py"
+
+        return dist.get_command_obj("build_py")
+
+
+    def test_build_py(self):
+        build_lib = join(self.tmpdir, "build")
+
+        cmd = self.build_py()
+        cmd.build_lib = build_lib
+        cmd.sibilant_workers = 1
+        cmd.ensure_finalized()
+        cmd.run()
+
+        for name in ("__init__.lspy", "beer.lspy"):
+            filename = join(build_lib, "sibcompall", name)
+            self.assertTrue(exists(cache_from_source(filename)))
+
+
+    def test_bad_options(self):
+        from distutils.errors import DistutilsOptionError
+
+        cmd = self.build_py()
+        cmd.sibilant_workers = "many"
+        self.assertRaises(DistutilsOptionError, cmd.ensure_finalized)
+
+        cmd = self.build_py()
+        cmd.sibilant_workers = "-1"
+        self.assertRaises(DistutilsOptionError, cmd.ensure_finalized)
+
+        cmd = self.build_py()
+        cmd.sibilant_invalidation_mode = "sometimes"
+        self.assertRaises(DistutilsOptionError, cmd.ensure_finalized)
+
+        cmd = self.build_py()
+        cmd.sibilant_workers = "2"
+        cmd.sibilant_invalidation_mode = "timestamp"
+        cmd.ensure_finalized()
+        self.assertEqual(cmd.sibilant_workers, 2)
+        self.assertIs(cmd.sibilant_invalidation_mode,
+                      PycInvalidationMode.TIMESTAMP)
+
+
+#
+# The end.
@@ -21,6 +21,7 @@ license: LGPL v.3
 """
 
 
+from dis import get_instructions
 from fractions import Fraction as fraction
 from unittest import TestCase
 
@@ -30,6 +31,7 @@ from sibilant.lib import (
 )
 
 from sibilant.compiler import (
+    Compiled,
     is_alias, Alias,
     is_macro, Macro,
     is_special, Special,
@@ -292,6 +294,57 @@ class TestCompiler(TestCase):
         self.assertEqual(res, ("X", 123, "Y", 456))
 
 
+    def test_deep_nested_apply(self):
+        def curry(*args):
+            return lambda arg: curry(*args, arg) if arg else args
+
+        src = "(%s None)" % ("(" * 50 + "curry" + "".join(
+            " %i)" % i for i in range(50)))
+
+        stmt, env = compile_expr(src, curry=curry)
+        res = stmt()
+        self.assertEqual(res, tuple(range(50)))
+
+
+    def test_transformed_head(self):
+        # when the head of an application is itself transformed (by a
+        # macro in this case), the whole application is compiled anew
+        pick = Macro("pick", lambda which: symbol(which))
+
+        src = """
+        (#tuple ((pick "+") 1 2 3)
+                ((pick "#tuple") 1 2 3)
+                ((pick "str") 123))
+        """
+        stmt, env = compile_expr(src, pick=pick)
+        res = stmt()
+        self.assertEqual(res, (6, (1, 2, 3), "123"))
+
+
+    def test_keyword_head(self):
+        # the head of an application may itself be an application
+        # which passes keyword arguments
+        def make(**kwds):
+            return lambda value: (kwds["a"], value)
+
+        stmt, env = compile_expr("((make a: 1) 2)", make=make)
+        res = stmt()
+        self.assertEqual(res, (1, 2))
+
+
+    def test_compiled_cont(self):
+        # a Compiled is handed a continuation, which it passes the
+        # source it transformed into
+        class Twice(Compiled):
+            def compile(self, compiler, source_obj, tc, cont):
+                called_by, (expr, rest) = source_obj
+                return cont(cons(symbol("+"), expr, expr, nil), tc)
+
+        stmt, env = compile_expr("(twice (twice 3))", twice=Twice("twice"))
+        res = stmt()
+        self.assertEqual(res, 12)
+
+
 class KeywordArgs(TestCase):
 
     def _test_gather_formals(self):
@@ -644,5 +697,51 @@ class KeywordArgs(TestCase):
         stmt()(self)
 
 
+class JumpWidth(TestCase):
+
+
+    def extended_args(self, func):
+        return [i for i in get_instructions(func)
+                if i.opname == "EXTENDED_ARG"]
+
+
+    def test_short_jumps(self):
+        src = """
+        (function short [x]
+          (while (< 0 x)
+            (setq x (- x 1)))
+          (cond [(== x 0) 'zero]
+                [else: 'other]))
+        """
+        stmt, env = compile_expr(src)
+        short = stmt()
+
+        self.assertEqual(short(5), symbol("zero"))
+        self.assertEqual(self.extended_args(short), [])
+
+
+    def test_long_jumps(self):
+        # enough branches that the later jumps need more than 8 bits
+        branches = " ".join("[(== x %i) (#tuple x %i x)]" % (i, i * 2)
+                            for i in range(100))
+
+        src = """
+        (function long [x]
+          (while (< 100 x)
+            (setq x (- x 1)))
+          (cond %s [else: None]))
+        """ % branches
+
+        stmt, env = compile_expr(src)
+        long = stmt()
+
+        self.assertTrue(len(long.__code__.co_code) > 0x100)
+        self.assertTrue(self.extended_args(long))
+
+        for i in range(100):
+            self.assertEqual(long(i), (i, i * 2, i))
+        self.assertEqual(long(150), None)
+
+
 #
 # The end.
@@ -0,0 +1,300 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+unittest for sibilant.importlib
+
+author: Christopher O'Brien  <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+import marshal
+import sys
+
+from importlib import import_module, invalidate_caches
+from importlib.util import cache_from_source
+from os import environ, makedirs, utime
+from os.path import dirname, exists, getmtime, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import sibilant.importlib
+
+from sibilant.compileall import compile_file, is_current
+from sibilant.compiler import is_macro
+from sibilant.importlib import (
+    SibilantFileFinder, SibilantSourceFileLoader, SOURCE_SUFFIXES,
+)
+from sibilant.module import (
+    HASH_PYC_SUPPORTED, PycInvalidationMode, pyc_invalidation_mode,
+)
+
+
+mod_source_1 = """
+(define tacos 5)
+(define beer 3)
+
+(defmacro twice [expr] `(#tuple ,expr ,expr))
+
+(define doubled (twice (+ tacos beer)))
+"""
+
+
+mod_source_2 = """
+(define tacos 10)
+(define beer 30)
+(define doubled (#tuple 40 40 40))
+"""
+
+
+class ImportCacheTest(TestCase):
+
+
+    def setUp(self):
+        sibilant.importlib.install()
+
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = False
+
+        self.tmpdir = mkdtemp()
+        sys.path.insert(0, self.tmpdir)
+
+
+    def tearDown(self):
+        environ.pop("SOURCE_DATE_EPOCH", None)
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        sys.path.remove(self.tmpdir)
+        sys.modules.pop("sibilant_cached_test", None)
+        rmtree(self.tmpdir)
+
+
+    def write_source(self, source):
+        filename = join(self.tmpdir, "sibilant_cached_test.lspy")
+        with open(filename, "wt") as out:
+            out.write(source)
+        return filename
+
+
+    def import_fresh(self):
+        sys.modules.pop("sibilant_cached_test", None)
+        invalidate_caches()
+        return import_module("sibilant_cached_test")
+
+
+    def test_cache(self):
+        filename = self.write_source(mod_source_1)
+        cached = cache_from_source(filename)
+        self.assertFalse(exists(cached))
+
+        mod = self.import_fresh()
+        self.assertTrue(exists(cached))
+        self.assertTrue(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.doubled, (8, 8))
+
+        # this time around it should come from the cache, which never
+        # creates a compiler
+        mod = self.import_fresh()
+        self.assertFalse(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.tacos, 5)
+        self.assertEqual(mod.beer, 3)
+        self.assertEqual(mod.doubled, (8, 8))
+        self.assertTrue(is_macro(mod.twice))
+
+
+    def test_constants(self):
+        self.write_source("""
+        (defconst WIDTH (* 4 8))
+        (defconst NAME (#str "w" "idth"))
+        """)
+
+        mod = self.import_fresh()
+        self.assertTrue(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.__constants__, {"WIDTH": 32, "NAME": "width"})
+
+        # the cached module declares the same constants as it runs,
+        # for anything compiled against it later
+        mod = self.import_fresh()
+        self.assertFalse(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.__constants__, {"WIDTH": 32, "NAME": "width"})
+
+
+    def test_stale(self):
+        filename = self.write_source(mod_source_1)
+        mtime = getmtime(filename)
+
+        mod = self.import_fresh()
+        self.assertEqual(mod.doubled, (8, 8))
+
+        # make sure the mtime changes even on a fast filesystem
+        self.write_source(mod_source_2)
+        utime(filename, (mtime + 10, mtime + 10))
+
+        mod = self.import_fresh()
+        self.assertTrue(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.tacos, 10)
+        self.assertEqual(mod.doubled, (40, 40, 40))
+
+        mod = self.import_fresh()
+        self.assertFalse(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.doubled, (40, 40, 40))
+
+
+    def test_version(self):
+        filename = self.write_source(mod_source_1)
+        cached = cache_from_source(filename)
+        self.import_fresh()
+
+        with open(cached, "rb") as cache:
+            data = cache.read()
+
+        # a cache written by another version of sibilant is stale
+        with patch("sibilant.module.CACHE_VERSION", "sibilant-cache-0"):
+            self.assertFalse(is_current(filename, cached))
+
+            mod = self.import_fresh()
+            self.assertTrue(hasattr(mod, "__compiler__"))
+            self.assertEqual(mod.doubled, (8, 8))
+
+            mod = self.import_fresh()
+            self.assertFalse(hasattr(mod, "__compiler__"))
+
+        # and the stub itself refuses to run, such as when the cache is
+        # loaded by the default importer
+        code = marshal.loads(data[16 if HASH_PYC_SUPPORTED else 12:])
+        glbls = {"__name__": "sibilant_cached_test"}
+        with patch("sibilant.module.CACHE_VERSION", "sibilant-cache-0"):
+            self.assertRaises(ImportError, exec, code, glbls)
+
+
+    def cache_mode(self, filename):
+        with open(cache_from_source(filename), "rb") as cache:
+            return pyc_invalidation_mode(cache.read())
+
+
+    @skipUnless(HASH_PYC_SUPPORTED, "requires PEP 552")
+    def test_checked_hash(self):
+        environ["SOURCE_DATE_EPOCH"] = "1"
+
+        filename = self.write_source(mod_source_1)
+        mtime = getmtime(filename)
+
+        mod = self.import_fresh()
+        self.assertTrue(hasattr(mod, "__compiler__"))
+        self.assertEqual(self.cache_mode(filename),
+                         PycInvalidationMode.CHECKED_HASH)
+
+        # a new mtime alone doesn't invalidate a hash-based cache
+        utime(filename, (mtime + 10, mtime + 10))
+        mod = self.import_fresh()
+        self.assertFalse(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.doubled, (8, 8))
+
+        # but new contents do
+        self.write_source(mod_source_2)
+        mod = self.import_fresh()
+        self.assertTrue(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.doubled, (40, 40, 40))
+
+
+    @skipUnless(HASH_PYC_SUPPORTED, "requires PEP 552")
+    def test_unchecked_hash(self):
+        filename = self.write_source(mod_source_1)
+        compile_file("sibilant_cached_test", filename,
+                     invalidation_mode=PycInvalidationMode.UNCHECKED_HASH)
+
+        # an unchecked cache is used without ever consulting the
+        # source, so even changed contents don't invalidate it
+        self.write_source(mod_source_2)
+        mod = self.import_fresh()
+        self.assertFalse(hasattr(mod, "__compiler__"))
+        self.assertEqual(mod.doubled, (8, 8))
+
+
+    def test_dont_write(self):
+        sys.dont_write_bytecode = True
+
+        filename = self.write_source(mod_source_1)
+
+        # nothing will be cached, so nothing is fused
+        with patch("sibilant.importlib.load_module_fused") as fused:
+            mod = self.import_fresh()
+        fused.assert_not_called()
+
+        self.assertEqual(mod.doubled, (8, 8))
+        self.assertFalse(exists(cache_from_source(filename)))
+
+
+
+class FinderIndexTest(TestCase):
+
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+
+    def touch(self, *path):
+        filename = join(self.tmpdir, *path)
+        makedirs(dirname(filename), exist_ok=True)
+        with open(filename, "wt") as out:
+            out.write("(define tacos 5)\n")
+
+
+    def finder(self):
+        details = (SibilantSourceFileLoader, SOURCE_SUFFIXES)
+        return SibilantFileFinder(self.tmpdir, details)
+
+
+    def test_index(self):
+        self.touch("pymod.py")
+        self.touch("sibmod.lspy")
+        self.touch("pypkg", "__init__.py")
+        self.touch("sibpkg", "__init__.sibilant")
+
+        finder = self.finder()
+
+        self.assertIsNone(finder.find_spec("pymod"))
+        self.assertIsNone(finder.find_spec("pypkg"))
+        self.assertIsNone(finder.find_spec("missing"))
+
+        spec = finder.find_spec("sibmod")
+        self.assertEqual(spec.name, "sibmod")
+        self.assertEqual(spec.origin, join(self.tmpdir, "sibmod.lspy"))
+
+        spec = finder.find_spec("sibpkg")
+        self.assertEqual(spec.name, "sibpkg")
+        self.assertIsNotNone(spec.submodule_search_locations)
+
+
+    def test_invalidate(self):
+        finder = self.finder()
+        self.assertIsNone(finder.find_spec("later"))
+
+        # the index isn't refreshed until the caches are invalidated
+        self.touch("later.lspy")
+        self.assertIsNone(finder.find_spec("later"))
+
+        finder.invalidate_caches()
+        self.assertIsNotNone(finder.find_spec("later"))
+
+
+#
+# The end.
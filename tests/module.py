@@ -21,10 +21,23 @@ license: LGPL v.3
 """
 
 
-from unittest import TestCase
+import sys
+
+from importlib.util import cache_from_source
+from os import environ, utime
+from os.path import dirname, exists, getmtime, join
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+
+import sibilant.bootstrap
 
 from sibilant.lib import car, cdr, cons, nil, symbol
-from sibilant.module import new_module, init_module, load_module
+from sibilant.module import (
+    new_module, init_module, load_module, load_module_fused,
+    exec_marshal_module, CACHE_VERSION, HASH_PYC_SUPPORTED,
+    _BasicsCache,
+)
 from sibilant.parse import source_str
 
 
@@ -87,5 +100,173 @@ class ModuleTest(TestCase):
         self.assertEqual(add_9(1), 10)
 
 
+    def test_fused(self):
+        getter, setter = getter_setter(None)
+
+        defaults = {"set_result": setter}
+
+        source = source_str(mod_source_1, "<unittest>")
+        test_module = new_module("test_module")
+
+        init_module(test_module, source, defaults=defaults)
+        code_objs = load_module_fused(test_module)
+
+        # every top-level expression went into the one code object
+        self.assertEqual(len(code_objs), 1)
+        self.assertEqual(getter(), 108)
+
+        # and evaluating that code object recreates the module
+        getter, setter = getter_setter(None)
+        glbls = {"__name__": "test_module", "set_result": setter}
+        exec_marshal_module(glbls, tuple(code_objs), version=CACHE_VERSION)
+
+        self.assertEqual(getter(), 108)
+        self.assertEqual(glbls["tacos"], 5)
+        self.assertEqual(glbls["beer"], 3)
+
+        add_9 = glbls["make_adder"](9)
+        self.assertEqual(add_9(1), 10)
+
+
+    def test_fused_runs(self):
+        # an expression which returns early can't be fused, but the
+        # runs of expressions either side of it still are
+        source = source_str("""
+        (define tacos 5)
+        (define beer 3)
+        (if tacos (return 7) 9)
+        (define wine 11)
+        (define whiskey (+ tacos beer wine))
+        """, "<unittest>")
+
+        test_module = new_module("test_module")
+        init_module(test_module, source)
+        code_objs = load_module_fused(test_module)
+
+        self.assertEqual(len(code_objs), 3)
+        self.assertEqual(test_module.whiskey, 19)
+
+        glbls = {"__name__": "test_module"}
+        exec_marshal_module(glbls, tuple(code_objs), version=CACHE_VERSION)
+        self.assertEqual(glbls["whiskey"], 19)
+
+
+class BasicsCacheTest(TestCase):
+
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source = join(dirname(sibilant.__file__), "basics.lspy")
+
+        with open(cls.source, "rt", encoding="utf8") as fd:
+            source_stream = source_str(fd.read(), cls.source)
+
+        mod = new_module("sibilant.basics")
+        init_module(mod, source_stream, builtins=sibilant.bootstrap)
+        cls.code_objs = load_module_fused(mod)
+
+
+    def setUp(self):
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = False
+
+        self.tmpdir = mkdtemp()
+        self.filename = join(self.tmpdir, "basics.lspy")
+        copyfile(self.source, self.filename)
+
+
+    def tearDown(self):
+        environ.pop("SOURCE_DATE_EPOCH", None)
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        rmtree(self.tmpdir)
+
+
+    def cached_code(self):
+        # the source is stat'd when the cache is created
+        return _BasicsCache(self.filename).get_code()
+
+
+    def test_hit(self):
+        self.assertIsNone(self.cached_code())
+
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        self.assertTrue(exists(cache_from_source(self.filename)))
+
+        code = self.cached_code()
+        self.assertIsNotNone(code)
+
+        basics = new_module("sibilant.basics")
+        exec(code, basics.__dict__)
+        self.assertIs(basics.__builtins__, sibilant.bootstrap)
+        self.assertTrue(basics.__dict__["within?"](1, 5, 3))
+
+
+    def test_stale(self):
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        mtime = getmtime(self.filename)
+
+        utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertIsNone(self.cached_code())
+
+        utime(self.filename, (mtime, mtime))
+        self.assertIsNotNone(self.cached_code())
+
+        # a change in size is stale even with the same mtime
+        with open(self.filename, "at") as out:
+            out.write("\n")
+        utime(self.filename, (mtime, mtime))
+        self.assertIsNone(self.cached_code())
+
+
+    @skipUnless(HASH_PYC_SUPPORTED, "requires PEP 552")
+    def test_stale_hash(self):
+        environ["SOURCE_DATE_EPOCH"] = "1"
+
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        self.assertIsNotNone(self.cached_code())
+
+        # same size, new contents
+        with open(self.filename, "r+b") as out:
+            data = out.read()
+            out.seek(0)
+            out.write(data.replace(b"author:", b"AUTHOR:", 1))
+        self.assertIsNone(self.cached_code())
+
+
+    def test_corrupt(self):
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        cached = cache_from_source(self.filename)
+
+        with open(cached, "rb") as cache:
+            data = cache.read()
+
+        for broken in (b"", data[:10], data[:len(data) // 2],
+                       data[:16] + b"garbage"):
+            with open(cached, "wb") as cache:
+                cache.write(broken)
+            self.assertIsNone(self.cached_code())
+
+        # the source is used instead, and its compilation replaces the
+        # broken cache
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        self.assertIsNotNone(self.cached_code())
+
+
+    def test_unwritable(self):
+        # __pycache__ can't be created where a file is in the way
+        with open(join(self.tmpdir, "__pycache__"), "wb"):
+            pass
+
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        self.assertIsNone(self.cached_code())
+
+
+    def test_dont_write(self):
+        sys.dont_write_bytecode = True
+
+        _BasicsCache(self.filename).set_code(self.code_objs)
+        self.assertFalse(exists(cache_from_source(self.filename)))
+
+
 #
 # The end.
@@ -2164,6 +2164,118 @@ class TypeBuilders(TestCase):
         self.assertEqual(res, slice(0, 1, -1))
 
 
+class ConstantFolding(TestCase):
+
+    def test_fold(self):
+        src = """
+        (function f []
+          (#tuple (+ 1 2 3.0) (* "ab" 2) (** 2 10) (< 1 2) (not 0)
+                  (#str "a" "b") (item "abc" 1) (^ 12 (~ 5))
+                  (in 1 (#tuple 1 2))))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+
+        expected = (6.0, "abab", 1024, True, True, "ab", "b", -10, True)
+        self.assertEqual(fn(), expected)
+        self.assertIn(expected, fn.__code__.co_consts)
+        self.assertEqual(fn.__code__.co_names, ())
+
+
+    def test_no_fold(self):
+        src = """
+        (function f []
+          (#tuple (** 2 1000) (* "ab" 10000) (% "%05d" 1)))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+
+        consts = fn.__code__.co_consts
+        self.assertIn(1000, consts)
+        self.assertIn(10000, consts)
+        self.assertIn("%05d", consts)
+        self.assertEqual(fn(), (2 ** 1000, "ab" * 10000, "00001"))
+
+        src = """
+        (function f [] (/ 1 0))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+        self.assertRaises(ZeroDivisionError, fn)
+
+
+    def test_const_types(self):
+        # equal constants of differing types must not be merged in
+        # the constant pool
+        src = """
+        (function f []
+          (#tuple (+ 1 1) (+ 1.0 1) (- 0.0) 0.0 (< 0 1) 1))
+        """
+        stmt, env = compile_expr(src)
+        res = stmt()()
+
+        self.assertEqual(list(map(type, res)),
+                         [int, float, float, float, bool, int])
+        self.assertEqual(str(res), "(2, 2.0, -0.0, 0.0, True, 1)")
+
+
+    def test_const_doc(self):
+        # a doc string shifts the rest of the constant pool along, and
+        # may itself be used as a constant
+        src = """
+        (function f []
+          "tacos"
+          (#tuple "tacos" 1.0 (+ 1 1) None))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+
+        self.assertEqual(fn.__doc__, "tacos")
+        self.assertEqual(fn(), ("tacos", 1.0, 2, None))
+
+
+    def test_defconst(self):
+        src = """
+        (begin
+          (defconst WIDTH (* 4 8))
+          (defconst NAME (#str "w" "idth"))
+          (defconst LATER (len NAME))
+          (function f [] (#tuple WIDTH (+ WIDTH 1) NAME LATER)))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+
+        self.assertEqual(fn(), (32, 33, "width", 5))
+        self.assertEqual(fn.__code__.co_names, ("LATER",))
+        self.assertEqual(env["WIDTH"], 32)
+        self.assertEqual(env["LATER"], 5)
+
+
+    def test_defconst_shadowed(self):
+        src = """
+        (begin
+          (defconst N 5)
+          (function f [N] (+ N 1)))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+        self.assertEqual(fn(10), 11)
+
+        src = """
+        (begin
+          (defconst N 5)
+          (function f [] (let ((N 100)) (+ N 1))))
+        """
+        stmt, env = compile_expr(src)
+        fn = stmt()
+        self.assertEqual(fn(), 101)
+
+        src = """
+        (function f [] (defconst N 5))
+        """
+        self.assertRaises(SyntaxError, compile_expr, src)
+
+
 class Format(TestCase):
 
     def test_format(self):
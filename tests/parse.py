@@ -21,11 +21,16 @@ license: LGPL v.3
 """
 
 
-from io import StringIO
+from io import BytesIO, StringIO
+from os.path import dirname, join
 from unittest import TestCase
 
-from sibilant.lib import cons, symbol, keyword, nil, car, cdr
-from sibilant.parse import default_reader, source_str
+from sibilant.lib import cons, symbol, keyword, nil, car, cdr, is_pair
+from sibilant.parse import (
+    default_reader, source_str, source_stream,
+    Reader, ReaderSyntaxError, IncrementalReader,
+    load, loads, iterload, iterloads,
+)
 
 
 def parse_source(src_str):
@@ -508,5 +513,383 @@ class Positions(TestCase):
         self.assertEqual(expr.get_position(), (3, 17))
 
 
+    def test_position_crlf(self):
+        src = "\r\n  (hello\r\n   world)\r\n"
+        strm = source_str(src, "<unittest>")
+        expr = default_reader.read(strm)
+
+        self.assertEqual(expr.get_position(), (2, 2))
+        expr = cdr(expr)
+        self.assertEqual(expr.get_position(), (3, 3))
+
+
+    def test_position_offset(self):
+        src = "(hello\n world)"
+        strm = source_str(src, "<unittest>", line_no=10, col_no=4)
+        expr = default_reader.read(strm)
+
+        self.assertEqual(expr.get_position(), (10, 4))
+        expr = cdr(expr)
+        self.assertEqual(expr.get_position(), (11, 1))
+
+        self.assertIs(default_reader.read(strm), None)
+        self.assertEqual(strm.position(), (11, 7))
+
+
+    def test_position_disabled(self):
+        src = """
+        (hello {world} #(how [are] . you) `(,doing))
+        """
+        reader = Reader(positions=False)
+        expected = default_reader.read(source_str(src, "<unittest>"))
+
+        self.assertEqual(reader.read(source_str(src, "<unittest>")),
+                         expected)
+
+        for strm in (source_str(src, "<unittest>"),
+                     source_stream(StringIO(src), "<unittest>")):
+
+            flat = read_all_positioned(reader, strm)
+            self.assertFalse([pos for pos in flat if type(pos) is tuple])
+
+
+    def test_position_packed(self):
+        expr = cons(symbol("hello"), cons(symbol("world"), nil), nil)
+        self.assertEqual(expr.get_position(), None)
+
+        expr.set_position((5, 9), True)
+        self.assertEqual(expr.get_position(), (5, 9))
+        self.assertEqual(cdr(expr).get_position(), (5, 9))
+
+        expr.clear_position()
+        self.assertEqual(expr.get_position(), None)
+        self.assertEqual(cdr(expr).get_position(), (5, 9))
+
+        expr.fill_position((1, 2), True)
+        self.assertEqual(expr.get_position(), (1, 2))
+        self.assertEqual(cdr(expr).get_position(), (5, 9))
+
+        expr.set_position(None)
+        self.assertEqual(expr.get_position(), None)
+
+        self.assertRaises(TypeError, expr.set_position, "hi")
+        self.assertRaises(TypeError, expr.set_position, (1, 2, 3))
+
+
+def read_all_positioned(reader, stream):
+    """
+    Flattens everything read from stream into a list of values and
+    pair positions, suitable for comparing two reads for equality
+    """
+
+    result = []
+
+    def walk(value):
+        while is_pair(value) and value is not nil:
+            result.append(value.get_position())
+            walk(car(value))
+            value = cdr(value)
+        result.append(repr(value))
+
+    try:
+        while True:
+            value = reader.read(stream)
+            if value is None:
+                break
+            walk(value)
+
+    except ReaderSyntaxError as rse:
+        result.append((rse.message, rse.location))
+
+    return result
+
+
+class AtomPatterns(TestCase):
+
+
+    def test_regex_precedence(self):
+        reader = Reader()
+        self.assertEqual(reader.process_atom("123"), 123)
+        self.assertIs(reader.process_atom("c-add-r"), symbol("c-add-r"))
+
+        # newer patterns take precedence over the defaults
+        reader.set_atom_regex(symbol("digits"), r"^\d+$", str)
+        reader.set_atom_regex(symbol("cxr"), r"^c[ad\-]+r$", keyword)
+
+        self.assertEqual(reader.process_atom("123"), "123")
+        self.assertEqual(reader.process_atom("-123"), -123)
+        self.assertIs(reader.process_atom("c-add-r"), keyword("c-add-r"))
+
+        # replacing a pattern keeps its original precedence
+        reader.set_atom_regex(symbol("int"), r"^-?\d+$", float)
+        self.assertEqual(reader.process_atom("123"), "123")
+        self.assertEqual(reader.process_atom("-123"), -123.0)
+
+        reader.clear_atom_pattern(symbol("digits"))
+        reader.clear_atom_pattern(symbol("cxr"))
+        self.assertEqual(reader.process_atom("123"), 123.0)
+        self.assertIs(reader.process_atom("c-add-r"), symbol("c-add-r"))
+
+
+    def test_function_precedence(self):
+        reader = Reader()
+
+        seen = []
+
+        def match_fn(atom):
+            seen.append(atom)
+            return atom.startswith("1")
+
+        reader.set_atom_pattern(symbol("ones"), match_fn, len)
+        reader.set_atom_regex(symbol("twos"), r"^2", len)
+
+        self.assertEqual(reader.process_atom("2000"), 4)
+        self.assertEqual(seen, [])
+
+        self.assertEqual(reader.process_atom("100"), 3)
+        self.assertEqual(reader.process_atom("300"), 300)
+        self.assertIs(reader.process_atom("tacos"), symbol("tacos"))
+        self.assertEqual(seen, ["100", "300", "tacos"])
+
+
+class FastReader(TestCase):
+    """
+    The buffered stream from source_str takes the tokenizing fast
+    path, which must produce exactly the same results as the
+    character event path taken for other streams.
+    """
+
+
+    def assertSameRead(self, src, reader=default_reader, factory=None):
+        fast = source_str(src, "<unittest>")
+        slow = source_stream(StringIO(src), "<unittest>")
+
+        if factory:
+            self.assertEqual(read_all_positioned(factory(), fast),
+                             read_all_positioned(factory(), slow))
+        else:
+            self.assertEqual(read_all_positioned(reader, fast),
+                             read_all_positioned(reader, slow))
+
+
+    def test_basics(self):
+        import sibilant
+
+        filename = join(dirname(sibilant.__file__), "basics.lspy")
+        with open(filename, "rt", encoding="utf8") as fd:
+            self.assertSameRead(fd.read())
+
+
+    def test_syntax(self):
+        self.assertSameRead("(a b . c) {a b} {} #(1 2) #{a 1} #[x] #foo")
+        self.assertSameRead("`(a ,b ,@c ,(d @e)) `(x,y) a,b 'a '(b c)")
+        self.assertSameRead('"abc" """tri"ple""" "esc\\"aped" f"x{y}z"')
+        self.assertSameRead("(a ; comment\n b)\r\n(c\r\n d)")
+        self.assertSameRead("1 2.5 0x1f :kw kw: 1/2 1.5d 3+4j f fo\"o\"")
+
+
+    def test_errors(self):
+        for src in ("(a b . c d)", "( . a)", "(a]", "(a", ")", " . ",
+                    '"unterminated', '"""unterminated', "(a .)"):
+            self.assertSameRead(src)
+
+
+    def test_macros(self):
+        def factory():
+            reader = Reader()
+            reader.set_macro_character("~", lambda s, c: symbol("T"), True)
+
+            def bang(stream, char):
+                # alters the default syntax mid-read
+                reader.set_macro_character("[", lambda s, c: symbol("B"),
+                                           True)
+                return symbol("bang")
+
+            reader.set_macro_character("!", bang, True)
+            return reader
+
+        self.assertSameRead("(a ~b c~d) (a (b ! [c) d) [e)", factory=factory)
+        self.assertSameRead("(x (y ! z . w) v)", factory=factory)
+
+
+class Load(TestCase):
+
+
+    def basics_source(self):
+        import sibilant
+
+        filename = join(dirname(sibilant.__file__), "basics.lspy")
+        with open(filename, "rt", encoding="utf8") as fd:
+            return filename, fd.read()
+
+
+    def test_loads(self):
+        src = "(a b . c) 1 'x ; comment\n\"str\" {y}"
+
+        forms = loads(src)
+        self.assertEqual(forms, [parse_source("(a b . c)"), 1,
+                                 parse_source("'x"), "str",
+                                 parse_source("{y}")])
+
+        self.assertEqual(list(iterloads(src)), forms)
+        self.assertEqual(forms[0].get_position(), None)
+
+        self.assertEqual(loads(""), [])
+        self.assertEqual(loads("  ; nothing\n"), [])
+        self.assertRaises(ReaderSyntaxError, loads, "(a b")
+
+
+    def test_load(self):
+        filename, src = self.basics_source()
+        expected = loads(src)
+
+        self.assertEqual(load(filename), expected)
+
+        for chunk_size in (1, 5, 64, 4096):
+            found = iterload(StringIO(src), chunk_size=chunk_size)
+            self.assertEqual(list(found), expected)
+
+
+    def test_load_binary(self):
+        src = '(h\u00e9llo "w\u00f6rld") ; \u00e7\n(\u03bb x)'
+        expected = loads(src)
+
+        for chunk_size in (1, 2, 3, 4096):
+            found = iterload(BytesIO(src.encode("utf8")),
+                             chunk_size=chunk_size)
+            self.assertEqual(list(found), expected)
+
+
+    def test_load_error(self):
+        src = "(a b)\n (c d"
+
+        for chunk_size in (1, 3, 4096):
+            found = iterload(StringIO(src), chunk_size=chunk_size)
+            self.assertEqual(next(found), parse_source("(a b)"))
+
+            with self.assertRaises(ReaderSyntaxError) as cm:
+                next(found)
+            self.assertEqual(cm.exception.location, (2, 5))
+
+
+    def test_load_prefixes(self):
+        src = "(a)\n' b\n(c) ` ; x\n(d ,e) '\n'f 'g\n"
+        expected = loads(src)
+
+        for chunk_size in range(1, len(src) + 1):
+            found = iterload(StringIO(src), chunk_size=chunk_size)
+            self.assertEqual(list(found), expected)
+
+
+class Incremental(TestCase):
+
+
+    def feed_all(self, parser, pieces):
+        result = []
+        for piece in pieces:
+            parser.feed(piece)
+            result.append(list(parser))
+        return result
+
+
+    def test_complete_forms(self):
+        parser = IncrementalReader()
+
+        found = self.feed_all(parser, ["(def", "ine x", " 1)", " y", " "])
+        self.assertEqual(found, [[], [], [parse_source("(define x 1)")],
+                                 [], [symbol("y")]])
+
+        # an atom at the very end might continue in the next piece
+        found = self.feed_all(parser, ["tac", "os\n"])
+        self.assertEqual(found, [[], [symbol("tacos")]])
+
+        parser.feed("beer")
+        self.assertEqual(list(parser), [])
+        parser.close()
+        self.assertEqual(list(parser), [symbol("beer")])
+
+        self.assertRaises(ValueError, parser.feed, "(more)")
+
+
+    def test_prefixes(self):
+        parser = IncrementalReader()
+
+        # a quote at the end applies to whatever form follows it
+        found = self.feed_all(parser, ["' ", "(a)", "'", "; c\n", "b "])
+        self.assertEqual(found, [[], [parse_source("'(a)")], [], [],
+                                 [parse_source("'b")]])
+
+        parser.feed("'")
+        parser.close()
+        self.assertRaises(ReaderSyntaxError, list, parser)
+
+
+    def test_strings_and_comments(self):
+        parser = IncrementalReader()
+
+        pieces = ['"a', ')b', '\\', '"c" ; (', ' x\n', '""', '"x")"""',
+                  ' ""', ' ']
+        found = self.feed_all(parser, pieces)
+        self.assertEqual(found, [[], [], [], ['a)b"c'], [], [], ['x")'],
+                                 [], [""]])
+
+
+    def test_positions(self):
+        import sibilant
+
+        filename = join(dirname(sibilant.__file__), "basics.lspy")
+        with open(filename, "rt", encoding="utf8") as fd:
+            src = fd.read()
+
+        expected = read_all_positioned(default_reader,
+                                       source_str(src, filename))
+
+        for size in (1, 7, 500):
+            parser = IncrementalReader(filename=filename)
+            found = []
+
+            for index in range(0, len(src), size):
+                parser.feed(src[index:index + size])
+                found.extend(parser)
+
+            parser.close()
+            found.extend(parser)
+
+            stream = source_str("", filename)
+            flat = read_all_positioned(IterReader(found), stream)
+            self.assertEqual(flat, expected)
+
+
+    def test_errors(self):
+        parser = IncrementalReader()
+
+        parser.feed("(a b)\n (c]\n")
+        self.assertEqual(next(parser), parse_source("(a b)"))
+        with self.assertRaises(ReaderSyntaxError) as cm:
+            next(parser)
+        self.assertEqual(cm.exception.location, (2, 3))
+
+        # reading carries on past the error
+        parser.feed("(d)")
+        self.assertEqual(list(parser), [parse_source("(d)")])
+
+        parser.feed(" (e")
+        parser.close()
+        self.assertRaises(ReaderSyntaxError, list, parser)
+
+
+class IterReader(object):
+    """
+    Stands in for a Reader, producing already read values
+    """
+
+    def __init__(self, values):
+        self.values = iter(values)
+
+
+    def read(self, _stream):
+        return next(self.values, None)
+
+
 #
 # The end.
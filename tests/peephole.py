@@ -0,0 +1,392 @@
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 3 of the
+# License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, see
+# <http://www.gnu.org/licenses/>.
+
+
+"""
+unittest for sibilant.pseudops.peephole
+
+author: Christopher O'Brien  <obriencj@gmail.com>
+license: LGPL v.3
+"""
+
+
+from types import GeneratorType
+from unittest import TestCase
+
+from sibilant.pseudops import Pseudop
+from sibilant.pseudops.peephole import (
+    DEFAULT_PASSES, optimize,
+    remove_unused_labels, remove_dead_code, remove_noop_pairs,
+    fold_const_branches, thread_jumps,
+)
+
+from . import (
+    compile_expr, compile_expr_no_peephole,
+    make_accumulator, make_raise_accumulator,
+)
+
+
+_P = Pseudop
+
+
+class Passes(TestCase):
+
+    def test_unused_labels(self):
+        ops = [(_P.LABEL, 1),
+               (_P.CONST, 5),
+               (_P.LABEL, 2),
+               (_P.RET_VAL,),
+               (_P.JUMP, 2)]
+
+        self.assertEqual(remove_unused_labels(ops),
+                         [(_P.CONST, 5),
+                          (_P.LABEL, 2),
+                          (_P.RET_VAL,),
+                          (_P.JUMP, 2)])
+
+
+    def test_dead_code(self):
+        ops = [(_P.CONST, 5),
+               (_P.RET_VAL,),
+               (_P.CONST, 6),
+               (_P.POP,),
+               (_P.LABEL, 1),
+               (_P.CONST, 7),
+               (_P.RAISE, 1),
+               (_P.CONST, 8)]
+
+        self.assertEqual(remove_dead_code(ops),
+                         [(_P.CONST, 5),
+                          (_P.RET_VAL,),
+                          (_P.LABEL, 1),
+                          (_P.CONST, 7),
+                          (_P.RAISE, 1)])
+
+
+    def test_noop_pairs(self):
+        ops = [(_P.CONST, 5),
+               (_P.POP,),
+               (_P.GET_VAR, "x"),
+               (_P.DUP,),
+               (_P.SET_VAR, "y"),
+               (_P.POP,),
+               (_P.GET_VAR, "y"),
+               (_P.RET_VAL,)]
+
+        self.assertEqual(remove_noop_pairs(ops),
+                         [(_P.GET_VAR, "x"),
+                          (_P.SET_VAR, "y"),
+                          (_P.GET_VAR, "y"),
+                          (_P.RET_VAL,)])
+
+
+    def test_noop_pairs_label(self):
+        # a label between the pair means the POP may be reached from
+        # elsewhere, so nothing can be removed
+        ops = [(_P.CONST, 5),
+               (_P.LABEL, 1),
+               (_P.POP,),
+               (_P.JUMP, 1)]
+
+        self.assertEqual(remove_noop_pairs(ops), ops)
+
+
+    def test_const_branches(self):
+        ops = [(_P.CONST, True),
+               (_P.POP_JUMP_IF_FALSE, 1),
+               (_P.CONST, 0),
+               (_P.POP_JUMP_IF_FALSE, 2),
+               (_P.CONST, None),
+               (_P.JUMP_IF_FALSE_OR_POP, 3),
+               (_P.CONST, 1),
+               (_P.JUMP_IF_FALSE_OR_POP, 4)]
+
+        self.assertEqual(fold_const_branches(ops),
+                         [(_P.JUMP, 2),
+                          (_P.CONST, None),
+                          (_P.JUMP, 3)])
+
+
+    def test_thread_jumps(self):
+        ops = [(_P.JUMP, 1),
+               (_P.LABEL, 2),
+               (_P.POP_JUMP_IF_TRUE, 1),
+               (_P.LABEL, 1),
+               (_P.JUMP, 3),
+               (_P.LABEL, 3),
+               (_P.GET_VAR, "x"),
+               (_P.JUMP_FORWARD, 4),
+               (_P.LABEL, 4),
+               (_P.RET_VAL,)]
+
+        self.assertEqual(thread_jumps(ops),
+                         [(_P.JUMP, 3),
+                          (_P.LABEL, 2),
+                          (_P.POP_JUMP_IF_TRUE, 3),
+                          (_P.LABEL, 1),
+                          (_P.LABEL, 3),
+                          (_P.GET_VAR, "x"),
+                          (_P.RET_VAL,),
+                          (_P.LABEL, 4),
+                          (_P.RET_VAL,)])
+
+
+    def test_thread_jumps_cycle(self):
+        ops = [(_P.LABEL, 1),
+               (_P.JUMP, 2),
+               (_P.LABEL, 2),
+               (_P.JUMP, 1)]
+
+        # mostly we just want this to terminate
+        result = optimize(ops, DEFAULT_PASSES)
+        self.assertTrue(result)
+
+
+    def test_start_label(self):
+        # label 0 is the implicit start of the code, used by tail
+        # recursion, and is never defined by a LABEL pseudop
+        ops = [(_P.GET_VAR, "x"),
+               (_P.POP_JUMP_IF_FALSE, 1),
+               (_P.JUMP, 0),
+               (_P.LABEL, 1),
+               (_P.CONST, None),
+               (_P.RET_VAL,)]
+
+        self.assertEqual(optimize(ops, DEFAULT_PASSES), ops)
+
+
+    def test_optimize(self):
+        ops = [(_P.CONST, False),
+               (_P.POP_JUMP_IF_FALSE, 1),
+               (_P.GET_VAR, "x"),
+               (_P.RET_VAL,),
+               (_P.LABEL, 1),
+               (_P.CONST, 5),
+               (_P.POP,),
+               (_P.GET_VAR, "y"),
+               (_P.RET_VAL,)]
+
+        self.assertEqual(optimize(ops, DEFAULT_PASSES),
+                         [(_P.GET_VAR, "y"),
+                          (_P.RET_VAL,)])
+
+
+        self.assertEqual(optimize(ops, ()), ops)
+
+
+    def test_optimize_backwards(self):
+        # folding the branch at the end leaves label 2 unused, which
+        # makes the code after it dead, and then the jump over it
+        # redundant
+        ops = [(_P.JUMP, 3),
+               (_P.LABEL, 2),
+               (_P.GET_VAR, "x"),
+               (_P.RET_VAL,),
+               (_P.LABEL, 3),
+               (_P.CONST, False),
+               (_P.POP_JUMP_IF_TRUE, 2),
+               (_P.CONST, None),
+               (_P.RET_VAL,)]
+
+        self.assertEqual(optimize(ops, DEFAULT_PASSES),
+                         [(_P.CONST, None),
+                          (_P.RET_VAL,)])
+
+        # passes from elsewhere are simply applied in turn
+        self.assertEqual(optimize(ops, (remove_dead_code, list)),
+                         remove_dead_code(ops))
+
+
+class Semantics(TestCase):
+    """
+    Each source is compiled and run both with and without the
+    peephole optimizer, and the results compared.
+    """
+
+    def check(self, src, **base):
+        accu1, good_guy = make_accumulator()
+        accu2, bad_guy = make_raise_accumulator()
+
+        stmt, env = compile_expr_no_peephole(src, good_guy=good_guy,
+                                             bad_guy=bad_guy, **base)
+        expected = stmt()
+        if isinstance(expected, GeneratorType):
+            expected = list(expected)
+        expected = (expected, list(accu1), list(accu2))
+
+        del accu1[:]
+        del accu2[:]
+
+        stmt, env = compile_expr(src, good_guy=good_guy,
+                                 bad_guy=bad_guy, **base)
+        result = stmt()
+        if isinstance(result, GeneratorType):
+            result = list(result)
+        result = (result, list(accu1), list(accu2))
+
+        self.assertEqual(result, expected)
+        return result
+
+
+    def test_cond(self):
+        src = """
+        (begin
+          (define classify
+            (function classify [x]
+              (cond [(< x 0) (good_guy 'negative) -1]
+                    [(== x 0) (good_guy 'zero) 0]
+                    [else: (good_guy 'positive) 1])))
+          (#tuple (classify -5) (classify 0) (classify 5)))
+        """
+        self.check(src)
+
+
+    def test_if_constant(self):
+        src = """
+        (#tuple (if True 1 2) (if False 1 2) (if None 1)
+                (and 1 2 None 3) (or None 0 4) (and) (or))
+        """
+        self.assertEqual(self.check(src)[0],
+                         (1, 2, False, None, 4, True, False))
+
+
+    def test_while(self):
+        src = """
+        (while keep_going
+          (setq x (- x 1))
+          (cond
+            [(< 0 x)
+             (good_guy (+ 100 x))
+             (continue 987)]
+            [(< x -3) (break x)]
+            [else:
+             (setq keep_going (good_guy x))
+             654]))
+        """
+        self.check(src, keep_going=True, x=5)
+        self.check(src, keep_going=True, x=-6)
+
+
+    def test_for_each(self):
+        src = """
+        (let ((z 0))
+          (for-each [i (range 8)]
+            (cond [(% i 2) (continue)]
+                  [(== i 6) (break 'done)]
+                  [else: (setq z (+ z i)) (good_guy z)])))
+        """
+        self.check(src)
+
+
+    def test_let(self):
+        src = """
+        (let ((a 1) (b 2))
+          (setq a (+ a b))
+          (let ((c (+ a b)))
+            (good_guy c)
+            (#tuple a b c)))
+        """
+        self.assertEqual(self.check(src)[0], (3, 2, 5))
+
+
+    def test_try(self):
+        src = """
+        (let ((counter 5))
+          (while (< 0 counter)
+            (setq counter (- counter 1))
+            (try
+              (if (% counter 2) (bad_guy counter) (good_guy counter))
+              ((Exception as: e) (good_guy -111))
+              (else: (good_guy 456))
+              (finally: (good_guy 789)))))
+        """
+        self.check(src)
+
+
+    def test_with(self):
+        src = """
+        (let ((ctx (manager)))
+          (with (m ctx)
+            (good_guy m)
+            (try
+              (with (n ctx)
+                (bad_guy n))
+              ((Exception) (good_guy 2)))))
+        """
+
+        from contextlib import contextmanager
+
+        @contextmanager
+        def manager():
+            yield 100
+
+        self.check(src, manager=manager)
+
+
+    def test_recursion(self):
+        src = """
+        (begin
+          (define count-down
+            (function count-down [x accu: 0]
+              (cond [(< x 1) accu]
+                    [else: (good_guy x)
+                           (count-down (- x 1) (+ accu x))])))
+          (count-down 20))
+        """
+        self.assertEqual(self.check(src)[0], 210)
+
+
+    def test_generator(self):
+        src = """
+        (let ((x 5) (y 0))
+          (while x
+            (yield (values x y))
+            (setq y (+ y 1))
+            (setq x (- x 1))))
+        """
+        self.assertEqual(self.check(src)[0],
+                         [(5, 0), (4, 1), (3, 2), (2, 3), (1, 4)])
+
+
+    def test_define(self):
+        src = """
+        (begin
+          (define x 5)
+          (define y (+ x 1))
+          (setq x (* x y))
+          (#tuple x y))
+        """
+        self.assertEqual(self.check(src)[0], (30, 6))
+
+
+class Effect(TestCase):
+
+    def test_smaller(self):
+        src = """
+        (function f [x]
+          (cond [True (while x (setq x (- x 1)) 5)]
+                [else: None]))
+        """
+
+        stmt, env = compile_expr_no_peephole(src)
+        plain = stmt().__code__.co_code
+
+        stmt, env = compile_expr(src)
+        optimized = stmt().__code__.co_code
+
+        self.assertLess(len(optimized), len(plain))
+
+
+#
+# The end.
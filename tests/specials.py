@@ -24,12 +24,12 @@ license: LGPL v.3
 import dis
 
 from functools import partial
-from types import GeneratorType
+from types import CodeType, GeneratorType
 from unittest import TestCase
 from asynctest import TestCase as AsyncTestCase
 
 from sibilant.lib import (
-    symbol, keyword, cons, nil, is_nil,
+    symbol, keyword, cons, nil, is_nil, setcar,
     getderef, setderef, clearderef,
 )
 
@@ -355,6 +355,40 @@ class Quasiquote(TestCase):
                 A=range(1, 4))
 
 
+    def test_hoisted(self):
+        src = """
+        (function quoting [x]
+          (values 'tacos '(1 (2 3) beer: . 4) `(1 ,x (2 3))))
+        """
+        stmt, env = compile_expr(src)
+        quoting = stmt()
+
+        sym, quoted, quasi = quoting(5)
+        self.assertEqual(sym, symbol("tacos"))
+        self.assertEqual(quoted, cons(1, cons(2, 3, nil),
+                                      keyword("beer"), 4))
+        self.assertEqual(quasi, cons(1, 5, cons(2, 3, nil), nil))
+
+        # symbols and keywords are created once when the module runs,
+        # rather than every time the function is called
+        names = quoting.__code__.co_names
+        self.assertNotIn("symbol", names)
+        self.assertNotIn("keyword", names)
+
+        # but lists are mutable, and so are created every time
+        again = quoting(6)
+        self.assertIsNot(again[1], quoted)
+        self.assertIsNot(list(again[2].unpack())[2],
+                         list(quasi.unpack())[2])
+
+        setcar(quoted, 100)
+        setcar(list(quasi.unpack())[2], 200)
+        again = quoting(7)
+        self.assertEqual(again[1], cons(1, cons(2, 3, nil),
+                                        keyword("beer"), 4))
+        self.assertEqual(again[2], cons(1, 7, cons(2, 3, nil), nil))
+
+
 class CompilerSpecials(TestCase):
 
 
@@ -440,6 +474,193 @@ class SpecialLet(TestCase):
             self.assertEqual(res, expected)
 
 
+    def test_inline_let(self):
+        src = """
+        (function inlined [x]
+          (let ((a (+ x 1)) (b 2))
+            (setq a (* a b))
+            (let ((a 10) (c a))
+              (setq x (#tuple a b c)))
+            (#tuple a b x)))
+        """
+        stmt, env = compile_expr(src)
+        inlined = stmt()
+
+        self.assertEqual(inlined(5), (12, 2, (10, 2, 12)))
+
+        # the lets were compiled into locals of the function, rather
+        # than as closures
+        code = inlined.__code__
+        self.assertEqual(code.co_cellvars, ())
+        self.assertFalse(any(isinstance(c, CodeType)
+                             for c in code.co_consts))
+
+
+    def test_inline_let_shadow(self):
+        src = """
+        (function count-down [x]
+          (let ((x (- x 1)))
+            (cond
+              [(< x 0) 'done]
+              [else: (count-down x)])))
+        """
+        stmt, env = compile_expr(src)
+        count_down = stmt()
+        self.assertEqual(count_down(5000), symbol("done"))
+
+
+    def test_let_escapes(self):
+        # each of these needs the let to be its own function
+
+        src = """
+        (function captured []
+          (let ((found (list)))
+            (for-each [i (range 3)]
+              (let ((j i))
+                (found.append (lambda () j))))
+            found))
+        """
+        stmt, env = compile_expr(src)
+        captured = stmt()
+        self.assertEqual([f() for f in captured()], [0, 1, 2])
+
+        src = """
+        (function yielding [x]
+          (let ((a x))
+            (yield a)
+            (yield (+ a 1))))
+        """
+        stmt, env = compile_expr(src)
+        yielding = stmt()
+        self.assertEqual(type(yielding(5)), GeneratorType)
+        self.assertEqual(list(yielding(5)), [5, 6])
+
+        src = """
+        (function returning [x]
+          (let ((a x))
+            (return 9))
+          x)
+        """
+        stmt, env = compile_expr(src)
+        returning = stmt()
+        self.assertEqual(returning(5), 5)
+
+        src = """
+        (function defining [x]
+          (let ((a 1))
+            (setq x (+ x a))
+            (define x 3)
+            x)
+          x)
+        """
+        stmt, env = compile_expr(src)
+        defining = stmt()
+        self.assertEqual(defining(5), 3)
+
+        src = """
+        (function defining [x]
+          (let ((a 1))
+            (define x 3)
+            x)
+          x)
+        """
+        stmt, env = compile_expr(src)
+        defining = stmt()
+        self.assertEqual(defining(5), 5)
+
+        src = """
+        (function breaking [x]
+          (while True
+            (let ((a x))
+              (break a))))
+        """
+        self.assertRaises(SyntaxError, compile_expr, src)
+
+
+    def test_inline_named_let(self):
+        src = """
+        (function summing [x]
+          (+ 1 (let loop ((i 0) (total 0))
+                 (cond
+                   [(< i x) (loop (+ i 1) (+ total i))]
+                   [else: total]))))
+        """
+        stmt, env = compile_expr(src)
+        summing = stmt()
+
+        # deeper than the recursion limit would allow for calls
+        self.assertEqual(summing(50000), 1249975001)
+
+        code = summing.__code__
+        self.assertEqual(code.co_cellvars, ())
+        self.assertFalse(any(isinstance(c, CodeType)
+                             for c in code.co_consts))
+
+        src = """
+        (function nested [x]
+          (let outer ((i 0) (total 0))
+            (cond
+              [(< i 3)
+               (let inner ((j 0) (total total))
+                 (cond
+                   [(< j x) (inner (+ j 1) (+ total 1))]
+                   [else: (outer (+ i 1) total)]))]
+              [else: total])))
+        """
+        stmt, env = compile_expr(src)
+        nested = stmt()
+        self.assertEqual(nested(10), 30)
+        self.assertFalse(any(isinstance(c, CodeType)
+                             for c in nested.__code__.co_consts))
+
+
+    def test_named_let_escapes(self):
+        # each of these needs the named let to be its own function
+
+        src = """
+        (function non-tail [x]
+          (let loop ((i x))
+            (cond
+              [(< i 1) 0]
+              [else: (+ 2 (loop (- i 1)))])))
+        """
+        stmt, env = compile_expr(src)
+        non_tail = stmt()
+        self.assertEqual(non_tail(10), 20)
+
+        src = """
+        (function passed [x]
+          (let loop ((i x))
+            (cond
+              [(< i 1) loop]
+              [else: (loop (- i 1))])))
+        """
+        stmt, env = compile_expr(src)
+        passed = stmt()
+        self.assertTrue(callable(passed(3)))
+        self.assertTrue(callable(passed(3)(5)))
+
+        src = """
+        (function guarded [x]
+          (let loop ((i 0))
+            (cond
+              [(< i x) (try (loop (+ i 1)) ((Exception) -1))]
+              [else: i])))
+        """
+        stmt, env = compile_expr(src)
+        guarded = stmt()
+        self.assertEqual(guarded(10), 10)
+
+        src = """
+        (function wrong [x]
+          (let loop ((i x))
+            (loop i i)))
+        """
+        stmt, env = compile_expr(src)
+        wrong = stmt()
+        self.assertRaises(TypeError, wrong, 5)
+
+
 class SpecialCond(TestCase):
 
 
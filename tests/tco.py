@@ -28,7 +28,9 @@ from unittest import TestCase
 
 import sibilant.builtins
 
-from sibilant.lib import trampoline, is_trampoline, tailcall
+from sibilant.lib import trampoline, is_trampoline, tailcall, tailcall_stats
+from sibilant.lib import tailcall_full
+from sibilant.lib import car, nil
 
 from . import compile_expr
 
@@ -81,6 +83,27 @@ def tco_odd(num):
     return False if num == 0 else tailcall(tco_even)(num - 1)
 
 
+@trampoline
+def tco_collect(*args, **kwds):
+    return args, kwds
+
+
+@trampoline
+def tco_rotate(num, *args, **kwds):
+    # bounces through tailcall_full, which packs the arguments onto
+    # the Tailcall's inline stack when they fit
+    if num == 0:
+        return tailcall_full(tco_collect, *args, **kwds)
+    else:
+        return tailcall_full(tco_rotate, num - 1,
+                             *(args[1:] + args[:1]), **kwds)
+
+
+@trampoline
+def tco_bounce(held):
+    return held
+
+
 def even(num):
     return True if num == 0 else odd(num - 1)
 
@@ -149,6 +172,107 @@ class TestTailcall(TestCase):
         self.assertFalse(tco_odd(num))
 
 
+    def test_free_list(self):
+        # warm up, so there's a Tailcall in the free list
+        self.assertTrue(tco_even(10))
+
+        before = tailcall_stats()
+        self.assertTrue(before["pooled"] > 0)
+
+        self.assertTrue(tco_even(1000))
+
+        after = tailcall_stats()
+        self.assertEqual(after["allocated"], before["allocated"])
+        self.assertEqual(after["reused"], before["reused"] + 1000)
+
+        # holding onto several at once draws them from the pool
+        held = [tailcall(tco_even) for _ in range(4)]
+        self.assertEqual(tailcall_stats()["allocated"],
+                         before["allocated"] + max(0, 4 - after["pooled"]))
+        del held
+
+        self.assertTrue(tailcall_stats()["pooled"] >= 4)
+
+
+    def test_many_args(self):
+        # either side of the inline stack size, which is 8
+        for count in (0, 1, 7, 8, 9, 12, 40):
+            args = tuple(range(count))
+            self.assertEqual(tco_rotate(0, *args), (args, {}))
+            self.assertEqual(tco_rotate(count, *args), (args, {}))
+            self.assertEqual(tco_rotate(count + 1, *args),
+                             (args[1:] + args[:1], {}))
+
+
+    def test_keywords(self):
+        kwds = {"a": 1, "b": 2}
+        self.assertEqual(tco_rotate(3, 10, 20, **kwds),
+                         ((20, 10), kwds))
+
+        # keywords which push the total past the inline stack
+        args = tuple(range(7))
+        more = dict(("k%i" % i, i) for i in range(5))
+        self.assertEqual(tco_rotate(7, *args, **more), (args, more))
+        self.assertEqual(tco_rotate(0, **more), ((), more))
+
+        # and through the Tailcall's own call
+        @trampoline
+        def via_call(*args, **kwds):
+            return tailcall(tco_collect)(*args, **kwds)
+
+        self.assertEqual(via_call(*args, **more), (args, more))
+        self.assertEqual(via_call(x=1), ((), {"x": 1}))
+
+
+    def test_star_args(self):
+        src = """
+        (begin
+          (defun collect [*: args **: kwds]
+            (#tuple args kwds))
+          (defun spread [args kwds]
+            (collect *: args **: kwds))
+          (defun spread-more [args kwds]
+            (collect 0 extra: 1 *: args **: kwds))
+          (values spread spread-more))
+        """
+        stmt, env = compile_expr(src)
+        spread, spread_more = stmt()
+
+        args = tuple(range(10))
+        kwds = {"a": 1, "b": 2}
+
+        self.assertEqual(spread(args, kwds), (args, kwds))
+        self.assertEqual(spread((), {}), ((), {}))
+        self.assertEqual(spread_more(args, kwds),
+                         ((0,) + args, dict(kwds, extra=1)))
+
+
+    def test_held(self):
+        # a Tailcall which is held onto rather than immediately
+        # bounced mustn't be disturbed by the pool reusing others
+        held = tailcall_full(tco_collect, *range(3), k=1)
+        big = tailcall_full(tco_collect, *range(12))
+        bare = tailcall(tco_collect)
+
+        self.assertTrue(tco_even(100))
+        self.assertEqual(tco_rotate(9, *range(9), z=2)[1], {"z": 2})
+
+        self.assertEqual(tco_bounce(held), ((0, 1, 2), {"k": 1}))
+        self.assertEqual(tco_bounce(big), (tuple(range(12)), {}))
+
+        # a Tailcall which was never given arguments can't bounce
+        never = tailcall(tco_collect)
+        self.assertRaises(ValueError, tco_bounce, never)
+
+        # the arguments given to a held Tailcall replace any it had
+        bare(*range(20))
+        self.assertEqual(tco_bounce(bare(1, 2, x=3)), ((1, 2), {"x": 3}))
+
+        # and bouncing it consumes it
+        self.assertRaises(ValueError, tco_bounce, bare)
+        self.assertRaises(ValueError, tco_bounce, held)
+
+
 class TestTCOCompiler(TestCase):
 
     def test_factorial(self):
@@ -222,6 +346,77 @@ class TestTCOCompiler(TestCase):
         self.assertTrue(odd(count - 1))
 
 
+    def test_inline_defaults(self):
+        src = """
+        (begin
+          (define seed 100)
+          (defun count-up [num total: seed step: 1]
+            (if (== num 0) total
+                (count-up (- num 1) step: step total: (+ total step))))
+          (defun reseed [num total: seed]
+            (if (<= num 0) total (reseed (- num total))))
+          (defun bump [num *: rest extra: 0 **: kwds]
+            (if (== num 0) (values rest extra kwds)
+                (bump (- num 1) 7 8 extra: (+ extra 1))))
+          (values count-up reseed bump))
+        """
+        stmt, env = compile_expr(src)
+        count_up, reseed, bump = stmt()
+
+        count = getrecursionlimit() * 2
+
+        # each of these should recur via a jump, rather than by
+        # calling __tcr_frame_vars__
+        for fun in (count_up, reseed, bump):
+            self.assertNotIn("__tcr_frame_vars__", fun.__code__.co_names)
+
+            # and without any cells, they've none to reset
+            self.assertNotIn("__tcr_reset_cells__", fun.__code__.co_names)
+
+        self.assertEqual(count_up(count), count + 100)
+        self.assertEqual(count_up(count, step=2), (count * 2) + 100)
+        self.assertEqual(count_up(3, total=0), 3)
+
+        # defaults are fetched from the function on every pass, so
+        # replacing them is seen beyond the first call
+        self.assertEqual(reseed(250), 100)
+        self.assertEqual(reseed(250, 1), 100)
+        env["count-up"].__defaults__ = (5, 1)
+        self.assertEqual(count_up(3), 8)
+        env["count-up"].__defaults__ = (0, 10)
+        self.assertEqual(count_up(3), 30)
+
+        rest, extra, kwds = bump(count)
+        self.assertEqual(rest, (7, 8))
+        self.assertEqual(extra, count)
+        self.assertEqual(kwds, {})
+
+        rest, extra, kwds = bump(0, 1, 2, foo=3)
+        self.assertEqual(rest, (1, 2))
+        self.assertEqual(kwds, {"foo": 3})
+
+
+    def test_inline_cells(self):
+        src = """
+        (function collect [num accu]
+          (if (== num 0) accu
+              (collect (- num 1) (cons (lambda [] num) accu))))
+        """
+        stmt, env = compile_expr(src)
+        collect = stmt()
+
+        self.assertNotIn("__tcr_frame_vars__", collect.__code__.co_names)
+        self.assertIn("__tcr_reset_cells__", collect.__code__.co_names)
+
+        # each closure must have kept its own cell for num
+        fns = collect(3, nil)
+        self.assertEqual([fn() for fn in fns.unpack()], [1, 2, 3])
+
+        count = getrecursionlimit() * 2
+        fns = collect(count, nil)
+        self.assertEqual(car(fns)(), 1)
+
+
 class TestTrampolineAttrs(TestCase):
 
     def test_func_getset(self):
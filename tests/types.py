@@ -213,6 +213,89 @@ class ConsTest(TestCase):
         self.assertEqual(z, a)
 
 
+    def test_long_cons(self):
+        count = 10000
+
+        a = cons(*range(count), nil)
+        links = list(a.follow())
+        self.assertEqual(len(links), count + 1)
+        self.assertIs(links[-1], nil)
+
+        self.assertTrue(a.is_proper())
+        self.assertFalse(a.is_recursive())
+        self.assertEqual(a.length(), count)
+        self.assertEqual(tuple(a.unpack()), tuple(range(count)))
+
+        b = cons(*range(count), nil)
+        self.assertEqual(a, b)
+        setcar(links[-2], None)
+        self.assertNotEqual(a, b)
+
+        c = cons(*range(count), "tail")
+        self.assertFalse(c.is_proper())
+        self.assertFalse(c.is_recursive())
+        self.assertEqual(c.length(), count + 1)
+        self.assertEqual(tuple(c.unpack())[-2:], (count - 1, "tail"))
+
+        for start in (0, 1, count // 2, count - 1):
+            z = cons(*range(count), nil)
+            links = list(z.follow())
+            setcdr(links[-2], links[start])
+
+            self.assertTrue(z.is_proper())
+            self.assertTrue(z.is_recursive())
+            self.assertEqual(z.length(), count)
+            self.assertEqual(tuple(z.unpack()), tuple(range(count)))
+            self.assertEqual(len(list(z.follow())), count)
+
+
+    def test_extend_while_following(self):
+        # the live chain is followed, so pairs added while iterating
+        # are visited too, provided the iterator hasn't already moved
+        # past the end
+        a = cons(0, 1, 2, nil)
+        seen = []
+        for item in a.unpack():
+            seen.append(item)
+            if item == 1:
+                setcdr(cdr(cdr(a)), cons(3, 4, nil))
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+
+        # and closing the chain into a loop part way through still
+        # ends the iteration
+        b = cons(*range(10), nil)
+        tail = list(b.follow())[-2]
+        links = []
+        for link in b.follow():
+            links.append(link)
+            if len(links) == 5:
+                setcdr(tail, b)
+        self.assertIs(links[0], b)
+        self.assertEqual(tuple(car(link) for link in links[:10]),
+                         tuple(range(10)))
+        self.assertLess(len(links), 30)
+
+
+    def test_recursive_eq(self):
+        # loops of differing lengths can still be equal
+        a = cons(1, recursive=True)
+        b = cons(1, 1, 1, recursive=True)
+        c = cons(1, 1, cons(1, 1, recursive=True))
+
+        self.assertEqual(a, b)
+        self.assertEqual(b, c)
+        self.assertEqual(c, a)
+
+        d = cons(1, 1, cons(1, 2, recursive=True))
+        self.assertNotEqual(a, d)
+        self.assertNotEqual(d, c)
+
+        e = cons(*range(1000), recursive=True)
+        f = cons(*range(1000), recursive=True)
+        self.assertEqual(e, f)
+        self.assertNotEqual(e, cons(*range(999), recursive=True))
+
+
 class SymbolTest(TestCase):
 
     def test_symbol(self):